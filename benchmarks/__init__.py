@@ -0,0 +1,5 @@
+"""Benchmarks of parsing, editing and CQL resolution.
+
+Run ``python -m benchmarks.run -o results.json`` and compare with a previous
+run with ``python -m benchmarks.run --compare old.json``.
+"""
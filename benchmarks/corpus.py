@@ -0,0 +1,90 @@
+"""Generated page corpora for benchmarks.
+
+Pages are generated in storage format and in view format (as rendered by
+confluence), with page properties tables containing users, dates, page
+references, links, mail addresses, nested lists and nested tables.
+"""
+
+import random
+
+STORAGE_PAGE = u"""<p>Generated page for benchmarks.</p><ac:structured-macro ac:name="details" ac:schema-version="1"><ac:rich-text-body><table><tbody>%s</tbody></table></ac:rich-text-body></ac:structured-macro>%s"""
+
+VIEW_PAGE = u"""<p>Generated page for benchmarks.</p><div class="plugin-tabmeta-details conf-macro output-block" data-macro-name="details"><div class="table-wrap"><table class="confluenceTable"><tbody>%s</tbody></table></div></div>%s"""
+
+ROW = u"""<tr><th>%s</th><td>%s</td></tr>"""
+
+
+def _storage_value(kind, n):
+    if kind == 'text':
+        return u'Some text value %s with <strong>markup</strong>' % n
+    if kind == 'user':
+        return u'<ac:link><ri:user ri:username="user%s"/></ac:link>' % (n % 50)
+    if kind == 'date':
+        return u'<time datetime="2020-%02d-%02d"/>' % (n % 12 + 1, n % 28 + 1)
+    if kind == 'ref':
+        return u'<ac:link><ri:page ri:space-key="DOC" ri:content-title="Referenced Page %s"/></ac:link>' % n
+    if kind == 'link':
+        return u'<a href="https://example.com/%s">Example %s</a>' % (n, n)
+    if kind == 'mail':
+        return u'<a href="mailto:user%s@example.com">user%s@example.com</a>' % (n, n)
+    if kind == 'list':
+        return u'<ul><li>first %s</li><li>second <ac:link><ri:user ri:username="user%s"/></ac:link><ul><li>nested %s</li></ul></li><li><time datetime="2021-01-%02d"/></li></ul>' % (n, n % 50, n, n % 28 + 1)
+    if kind == 'table':
+        return u'<table><tbody><tr><th>Key %s</th><td>value %s</td></tr><tr><th>Owner</th><td><ac:link><ri:user ri:username="user%s"/></ac:link></td></tr></tbody></table>' % (n, n, n % 50)
+
+
+def _view_value(kind, n):
+    if kind == 'text':
+        return u'Some text value %s with <strong>markup</strong>' % n
+    if kind == 'user':
+        u = n % 50
+        return u'<a class="confluence-userlink user-mention" data-username="user%s" href="/display/~user%s" data-linked-resource-type="userinfo">User %s</a>' % (u, u, u)
+    if kind == 'date':
+        return u'<time datetime="2020-%02d-%02d" class="date-past">%02d %s 2020</time>' % (n % 12 + 1, n % 28 + 1, n % 28 + 1, 'Jan')
+    if kind == 'ref':
+        return u'<a href="/display/DOC/Referenced+Page+%s" data-linked-resource-type="page">Referenced Page %s</a>' % (n, n)
+    if kind == 'link':
+        return u'<a href="https://example.com/%s" class="external-link" rel="nofollow">Example %s</a>' % (n, n)
+    if kind == 'mail':
+        return u'<a href="mailto:user%s@example.com" class="external-link" rel="nofollow">user%s@example.com</a>' % (n, n)
+    if kind == 'list':
+        u = n % 50
+        return u'<ul><li>first %s</li><li>second <a class="confluence-userlink user-mention" data-username="user%s" href="/display/~user%s">User %s</a><ul><li>nested %s</li></ul></li><li><time datetime="2021-01-%02d" class="date-past">%02d Jan 2021</time></li></ul>' % (n, u, u, u, n, n % 28 + 1, n % 28 + 1)
+    if kind == 'table':
+        u = n % 50
+        return u'<div class="table-wrap"><table class="confluenceTable"><tbody><tr><th>Key %s</th><td>value %s</td></tr><tr><th>Owner</th><td><a class="confluence-userlink user-mention" data-username="user%s" href="/display/~user%s">User %s</a></td></tr></tbody></table></div>' % (n, n, u, u, u)
+
+
+KINDS = ('text', 'user', 'date', 'ref', 'link', 'mail', 'list', 'table')
+
+
+def _kinds(rows, seed):
+    rnd = random.Random(seed)
+    return [ rnd.choice(KINDS) for i in range(rows) ]
+
+
+def _filler(size):
+    '''return storage/view content of about ``size`` bytes'''
+    section = u''.join([
+        u'<h2>Section</h2>',
+        u'<p>' + u'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20 + u'</p>',
+        u'<table><tbody>' + u'<tr><td>cell</td><td>cell</td><td>cell</td></tr>' * 20 + u'</tbody></table>',
+        u'<ul>' + u'<li>item<ul><li>nested item</li></ul></li>' * 10 + u'</ul>',
+    ])
+    return section * max(0, size // len(section))
+
+
+def storage_page(rows=300, size=0, seed=0):
+    '''return a page in storage format with ``rows`` page properties and
+    about ``size`` bytes of additional content'''
+    kinds = _kinds(rows, seed)
+    table = u''.join(ROW % (u'Property %s' % i, _storage_value(k, i)) for (i, k) in enumerate(kinds))
+    return STORAGE_PAGE % (table, _filler(size))
+
+
+def view_page(rows=300, size=0, seed=0):
+    '''return the view format of :func:`storage_page`'''
+    kinds = _kinds(rows, seed)
+    table = u''.join(ROW % (u'Property %s' % i, _view_value(k, i)) for (i, k) in enumerate(kinds))
+    filler = _filler(size).replace(u'<table>', u'<div class="table-wrap"><table class="confluenceTable">').replace(u'</table>', u'</table></div>')
+    return VIEW_PAGE % (table, filler)
@@ -0,0 +1,220 @@
+"""Run benchmarks and store results as JSON.
+
+::
+
+    python -m benchmarks.run -o results-0.5.0.json
+    python -m benchmarks.run --quick --compare results-0.5.0.json
+
+With ``--compare``, benchmarks slower than ``--threshold`` times the previous
+result are reported and the exit code is 1.
+"""
+
+import sys, time, json, platform, argparse, subprocess
+from datetime import datetime
+
+from pyquery import PyQuery
+from lxml import etree
+
+import confluence_tool
+from confluence_tool.page_properties import get_page_properties, get_storage_page_properties, extract_data, PagePropertiesEditor
+from confluence_tool.storage_editor import StorageEditor, storage_query
+from confluence_tool.confluence_api import ConfluenceAPI
+from confluence_tool.fake_server import FakeConfluence, FakeConfluenceServer
+from confluence_tool.transport import close_transports
+
+from .corpus import storage_page, view_page
+
+BENCHMARKS = []
+
+def benchmark(name):
+    '''register a benchmark
+
+    The decorated function gets the corpus scale (1 for full, smaller for
+    quick runs) and returns the callable to be timed.
+    '''
+    def decorator(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return decorator
+
+MB = 1024 * 1024
+
+
+@benchmark('get_page_properties.rows-300')
+def bench_get_page_properties(scale):
+    html = view_page(rows=int(300 * scale))
+    return lambda: list(get_page_properties(html))
+
+@benchmark('get_page_properties.large')
+def bench_get_page_properties_large(scale):
+    html = view_page(rows=int(300 * scale), size=int(3 * MB * scale))
+    return lambda: list(get_page_properties(html))
+
+@benchmark('get_storage_page_properties.rows-300')
+def bench_get_storage_page_properties(scale):
+    storage = storage_page(rows=int(300 * scale))
+    return lambda: list(get_storage_page_properties(storage))
+
+@benchmark('extract_data.rows-300')
+def bench_extract_data(scale):
+    d = PyQuery(view_page(rows=int(300 * scale)))
+    cells = [ PyQuery(th).next() for th in d("div[data-macro-name=details] > div.table-wrap > table > tbody > tr > th") ]
+    return lambda: [ extract_data(td) for td in cells ]
+
+@benchmark('PagePropertiesEditor.edit.rows-300')
+def bench_page_properties_editor(scale):
+    rows = int(300 * scale)
+    page = {
+        'body': {'storage': {'value': storage_page(rows=rows)}},
+        'pageProperties': {},
+    }
+    editor = PagePropertiesEditor(dict(
+        ('Property %s' % i, {'replace': 'new value %s' % i}) for i in range(0, rows, 10)))
+    return lambda: editor.edit(page)
+
+@benchmark('StorageEditor.edit.large')
+def bench_storage_editor(scale):
+    content = storage_page(rows=int(300 * scale), size=int(3 * MB * scale))
+    editor = StorageEditor(actions=[
+        dict(select='p:first', content='edited'),
+        dict(select='h2', action='append', content='<em>edited</em>'),
+    ])
+    return lambda: editor.edit(content)
+
+@benchmark('MyQuery.html.large')
+def bench_myquery_html(scale):
+    # html() serializes the content of the first element
+    q = storage_query(u'<div>%s</div>' % storage_page(rows=int(300 * scale), size=int(3 * MB * scale)))
+    return lambda: q.html()
+
+@benchmark('MyQuery.strip_namespaces.large')
+def bench_strip_namespaces(scale):
+    q = storage_query(storage_page(rows=int(300 * scale), size=int(MB * scale)))
+    # serialized elements carry xmlns declarations
+    html = ''.join(etree.tostring(e) for e in q)
+    return lambda: q.strip_namespaces(html)
+
+@benchmark('resolveCQL.simple')
+def bench_resolve_cql_simple(scale):
+    api = ConfluenceAPI(dict(baseurl='http://confluence.invalid', username='user', password='secret'))
+    refs = [ 'DOC:Some page', ':Some page', '12345', 'https://x/rest/api/content/12345', 'space = DOC' ] * 20
+    return lambda: [ api.resolveCQL(ref) for ref in refs ]
+
+@benchmark('resolveCQL.ancestor')
+def bench_resolve_cql_ancestor(scale):
+    fake = FakeConfluence()
+    fake.seed(pages=int(1000 * scale))
+    server = FakeConfluenceServer(fake)
+    server.start()
+    SERVERS.append(server)
+    api = ConfluenceAPI(dict(baseurl=server.baseurl, username='user', password='secret', cache=False, memo=False))
+    return lambda: api.resolveCQL('BENCHA:Page BENCHA 0>>')
+
+SERVERS = []
+
+
+def measure(func, repeat=5, min_time=0.2):
+    '''return seconds per call (min and median of ``repeat`` runs) and
+    number of calls per run'''
+    number = 1
+    while True:
+        start = time.time()
+        for i in range(number):
+            func()
+        elapsed = time.time() - start
+        if elapsed >= min_time or number >= 1000:
+            break
+        number *= 2
+
+    times = [ elapsed / number ]
+    for r in range(repeat - 1):
+        start = time.time()
+        for i in range(number):
+            func()
+        times.append((time.time() - start) / number)
+
+    times.sort()
+    return dict(min=times[0], median=times[len(times) // 2], number=number, repeat=repeat)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+            stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, scale=1.0, repeat=5, out=sys.stderr):
+    results = {}
+    try:
+        for name, setup in BENCHMARKS:
+            if names and not any(n in name for n in names):
+                continue
+            func = setup(scale)
+            results[name] = measure(func, repeat=repeat)
+            out.write("%-40s %10.3f ms (x%s)\n" % (name, results[name]['min'] * 1000, results[name]['number']))
+    finally:
+        close_transports()
+        while SERVERS:
+            SERVERS.pop().stop()
+
+    return dict(
+        meta = dict(
+            version   = confluence_tool.__version__,
+            revision  = git_revision(),
+            python    = platform.python_version(),
+            platform  = platform.platform(),
+            scale     = scale,
+            timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        ),
+        results = results,
+    )
+
+
+def compare(old, new, threshold=1.2, out=sys.stderr):
+    '''report changes between ``old`` and ``new`` results, return names of
+    regressed benchmarks'''
+    regressions = []
+    if old['meta'].get('scale') != new['meta'].get('scale'):
+        out.write("warning: comparing runs of different scale\n")
+
+    for name in sorted(new['results']):
+        if name not in old['results']:
+            continue
+        ratio = new['results'][name]['min'] / old['results'][name]['min']
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        out.write("%-40s %6.2fx%s\n" % (name, ratio, flag))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run confluence-tool benchmarks")
+    parser.add_argument('-o', '--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="compare with results from this JSON file")
+    parser.add_argument('--threshold', type=float, default=1.2, help="ratio regarded as regression (default 1.2)")
+    parser.add_argument('--quick', action='store_true', help="use small corpora")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('names', nargs='*', help="run only benchmarks containing one of these names")
+    args = parser.parse_args(argv)
+
+    results = run(args.names, scale=0.1 if args.quick else 1.0, repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, results, args.threshold):
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
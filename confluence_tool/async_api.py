@@ -0,0 +1,83 @@
+"""Concurrent counterpart of :class:`~confluence_tool.confluence_api.ConfluenceAPI`.
+
+:class:`AsyncConfluenceAPI` wraps a ConfluenceAPI and exposes the same
+methods.  Methods returning a value return a :class:`~.parallel.Future`
+instead, generator methods return an iterator, which is consumed in a
+background thread.  This way fetching pages overlaps with processing them and
+many updates can be in flight at the same time::
+
+    api = AsyncConfluenceAPI(ConfluenceAPI(config), workers=16)
+    futures = [ api.getPage(id) for id in ids ]
+    pages = [ f.result() for f in futures ]
+
+    for result in api.map('updatePage', updates):
+        ...
+
+The number of concurrent calls is bounded by ``workers`` (default is
+configuration value ``workers`` or 8).  Requests are still subject to the
+transport's rate limit and ``max_in_flight`` setting.
+"""
+
+from .parallel import Executor, pmap, prefetch, DEFAULT_WORKERS
+
+import logging
+logger = logging.getLogger('confluence.async')
+
+
+class AsyncConfluenceAPI(object):
+
+    # methods of ConfluenceAPI returning generators
+    GENERATORS = set([
+        'getPages', 'iterate', 'editPages', 'setPageProperties',
+        'getPagesWithProperties', 'listSpaces', 'expandPages', 'getChildren',
+        'getChildrenOfPages', 'walkTree',
+    ])
+
+    def __init__(self, api, workers=None, buffer=100):
+        self.api = api
+        if workers is None:
+            workers = int(api.config.get('workers') or DEFAULT_WORKERS)
+        self.workers = workers
+        self.buffer = buffer
+        self.executor = Executor(workers, name='confluence-async')
+
+    def __getattr__(self, name):
+        method = getattr(self.api, name)
+        if not callable(method):
+            return method
+
+        if name in self.GENERATORS:
+            def call(*args, **kwargs):
+                return prefetch(method(*args, **kwargs), buffer=self.buffer)
+        else:
+            def call(*args, **kwargs):
+                return self.executor.submit(method, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    def map(self, name, items):
+        '''call method ``name`` for each item of ``items`` concurrently
+
+        An item may be a dictionary of keyword arguments, a tuple of
+        positional arguments or a single argument.  Results are yielded in
+        order of ``items``.
+        '''
+        method = getattr(self.api, name)
+
+        def call(item):
+            if isinstance(item, dict):
+                return method(**item)
+            if isinstance(item, tuple):
+                return method(*item)
+            return method(item)
+
+        return pmap(call, items, workers=self.workers)
+
+    def gather(self, futures):
+        '''return results of ``futures`` as list'''
+        return [ f.result() for f in futures ]
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,454 @@
+"""Persistent content cache and conditional request store.
+
+Pages are stored in a SQLite database per confluence host (default in
+``~/.cache/confluence-tool``) keyed by page id, version and expand set.  A
+page version never changes, so a cached entry is valid as long as the page's
+current version is the cached one.  Least recently used entries are evicted,
+if the cache grows beyond its maximum size.
+
+Configuration values:
+
+* ``cache`` - enable the cache (default true)
+* ``cache_dir`` - directory for cache files
+* ``cache_size`` - maximum size in MB of pages and of stored responses
+  each (default 200)
+* ``conditional_get`` - send conditional GET requests (default true)
+* ``ref_ttl`` - seconds page ids of references like ``SPACE:title`` are
+  kept (default 3600, 0 disables)
+
+:class:`ResponseStore` keeps validators (ETag, Last-Modified) and bodies of
+GET responses in the same database, so that repeated requests can be sent as
+conditional requests.
+"""
+
+import os, time, json, sqlite3, threading, atexit
+from os.path import expanduser, join, exists
+from urlparse import urlparse
+
+from .util import to_bool
+from .stats import STATS
+
+import logging
+logger = logging.getLogger('confluence.cache')
+
+DEFAULT_CACHE_DIR = '~/.cache/confluence-tool'
+DEFAULT_CACHE_SIZE = 200 # MB
+DEFAULT_REF_TTL = 3600 # seconds
+
+
+def normalize_expand(expand):
+    '''return expand as sorted, comma separated string'''
+    if not expand:
+        return ''
+    if hasattr(expand, 'split'):
+        expand = expand.split(',')
+    return ','.join(sorted(set([ e.strip() for e in expand if e.strip() ])))
+
+
+def request_key(url, params):
+    '''return a key identifying a GET request'''
+    if isinstance(params, dict):
+        params = sorted([ (k,v) for (k,v) in params.items() if v is not None ])
+    return json.dumps([url, params])
+
+
+class ContentCache(object):
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            id       TEXT,
+            version  INTEGER,
+            expand   TEXT,
+            data     TEXT,
+            size     INTEGER,
+            accessed REAL,
+            PRIMARY KEY (id, version, expand)
+        );
+        CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed);
+    """
+
+    # pending access times are written at the latest with this many entries
+    MAX_PENDING = 1000
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        # access times of hits, written with next put, prune or close
+        self.accessed = {}
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+
+    def get(self, id, version, expand):
+        '''return cached page data or None'''
+        expand = normalize_expand(expand)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data FROM pages WHERE id = ? AND version = ? AND expand = ?",
+                (str(id), int(version), expand)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.accessed[(str(id), int(version), expand)] = time.time()
+            if len(self.accessed) >= self.MAX_PENDING:
+                self._flush()
+                self.db.commit()
+
+        return json.loads(row[0])
+
+    def contains(self, id):
+        '''return True, if any version of page ``id`` is cached'''
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM pages WHERE id = ? LIMIT 1", (str(id),)).fetchone() is not None
+
+    def _flush(self):
+        '''write pending access times'''
+        if self.accessed:
+            self.db.executemany("UPDATE pages SET accessed = ? WHERE id = ? AND version = ? AND expand = ?",
+                [ (accessed,) + key for (key, accessed) in self.accessed.items() ])
+            self.accessed = {}
+
+    def put(self, id, version, expand, data):
+        data = json.dumps(data)
+        with self.lock:
+            self._flush()
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages (id, version, expand, data, size, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(id), int(version), normalize_expand(expand), data, len(data), time.time()))
+            self.puts += 1
+            if self.puts % 100 == 0:
+                self._prune(self.max_size)
+            self.db.commit()
+
+    def _size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def _prune(self, max_size):
+        self._flush()
+        size = self._size()
+        removed = 0
+        if size <= max_size:
+            return removed
+
+        rows = self.db.execute("SELECT id, version, expand, size FROM pages ORDER BY accessed").fetchall()
+        for (id, version, expand, _size) in rows:
+            if size <= max_size:
+                break
+            self.db.execute("DELETE FROM pages WHERE id = ? AND version = ? AND expand = ?", (id, version, expand))
+            size -= _size
+            removed += 1
+
+        logger.debug("pruned %s entries", removed)
+        return removed
+
+    def prune(self, max_size=None):
+        '''evict least recently used entries until cache is not larger than
+        ``max_size`` (default is the configured maximum size)
+
+        Returns number of evicted entries.
+        '''
+        if max_size is None:
+            max_size = self.max_size
+        with self.lock:
+            removed = self._prune(max_size)
+            self.db.commit()
+            self.db.execute("VACUUM")
+        return removed
+
+    def clear(self):
+        with self.lock:
+            self.accessed = {}
+            self.db.execute("DELETE FROM pages")
+            self.db.commit()
+            self.db.execute("VACUUM")
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.db.commit()
+            self.db.close()
+
+    def stats(self):
+        with self.lock:
+            (entries, pages) = self.db.execute("SELECT COUNT(*), COUNT(DISTINCT id) FROM pages").fetchone()
+            size = self._size()
+
+        return dict(
+            path     = self.path,
+            entries  = entries,
+            pages    = pages,
+            size     = size,
+            max_size = self.max_size,
+            hits     = self.hits,
+            misses   = self.misses,
+        )
+
+
+class ResponseStore(object):
+    """Validators and bodies of GET responses keyed by request."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key           TEXT PRIMARY KEY,
+            etag          TEXT,
+            last_modified TEXT,
+            body          TEXT,
+            size          INTEGER,
+            accessed      REAL
+        );
+        CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+    """
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.counters = dict(conditional_requests=0, not_modified=0, bytes_saved=0)
+        # access times of responses served from store, written with next put, prune or close
+        self.accessed = {}
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+
+        # stores written before responses were pruned by size
+        columns = [ row[1] for row in self.db.execute("PRAGMA table_info(responses)") ]
+        if 'size' not in columns:
+            self.db.execute("ALTER TABLE responses ADD COLUMN size INTEGER")
+            self.db.execute("UPDATE responses SET size = length(body)")
+            self.db.commit()
+
+    def get(self, key):
+        '''return ``(etag, last_modified, body)`` or None'''
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.counters['conditional_requests'] += 1
+        return row
+
+    def _flush(self):
+        '''write pending access times'''
+        if self.accessed:
+            self.db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                [ (accessed, key) for (key, accessed) in self.accessed.items() ])
+            self.accessed = {}
+
+    def put(self, key, etag, last_modified, body):
+        with self.lock:
+            self._flush()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, etag, last_modified, body, size, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, last_modified, body, len(body or ''), time.time()))
+            self.puts += 1
+            if self.puts % 100 == 0:
+                self._prune(self.max_size)
+            self.db.commit()
+
+    def _size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _prune(self, max_size):
+        self._flush()
+        size = self._size()
+        removed = 0
+        if size <= max_size:
+            return removed
+
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        for (key, _size) in rows:
+            if size <= max_size:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            size -= _size or 0
+            removed += 1
+
+        logger.debug("pruned %s responses", removed)
+        return removed
+
+    def prune(self, max_size=None):
+        '''evict least recently used responses until the store is not larger
+        than ``max_size`` (default is the configured maximum size)
+
+        Returns number of evicted responses.
+        '''
+        if max_size is None:
+            max_size = self.max_size
+        with self.lock:
+            removed = self._prune(max_size)
+            self.db.commit()
+        return removed
+
+    def not_modified(self, key, body):
+        '''record a 304 response served from store'''
+        with self.lock:
+            self.counters['not_modified'] += 1
+            self.counters['bytes_saved'] += len(body or '')
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= ContentCache.MAX_PENDING:
+                self._flush()
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.accessed = {}
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.db.commit()
+            self.db.close()
+
+    def stats(self):
+        with self.lock:
+            result = dict(self.counters)
+        sent = result['conditional_requests']
+        result['hit_ratio'] = float(result['not_modified']) / sent if sent else 0.0
+        return result
+
+
+class ReferenceCache(object):
+    """Page ids of page references like ``SPACE:title``.
+
+    Titles of pages may change, so entries expire after ``ttl`` seconds and
+    entries of updated or deleted pages are invalidated.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS refs (
+            ref      TEXT PRIMARY KEY,
+            ids      TEXT,
+            expires  REAL
+        );
+    """
+
+    def __init__(self, path, ttl=DEFAULT_REF_TTL, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.counters = dict(hits=0, misses=0, expired=0)
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+
+    def get(self, ref):
+        '''return list of page ids of ``ref`` or None'''
+        with self.lock:
+            row = self.db.execute("SELECT ids, expires FROM refs WHERE ref = ?", (ref,)).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+            if row[1] < self.clock():
+                self.counters['expired'] += 1
+                return None
+            self.counters['hits'] += 1
+        return json.loads(row[0])
+
+    def put(self, ref, ids):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO refs (ref, ids, expires) VALUES (?, ?, ?)",
+                (ref, json.dumps(ids), self.clock() + self.ttl))
+            self.db.commit()
+
+    def invalidate(self, id):
+        '''remove references resolving to page ``id``'''
+        with self.lock:
+            self.db.execute("DELETE FROM refs WHERE ids LIKE ?", ('%%"%s"%%' % id,))
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM refs")
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            result = dict(self.counters)
+            result['entries'] = self.db.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+        return result
+
+
+def _cache_path(config):
+    cache_dir = expanduser(config.get('cache_dir') or DEFAULT_CACHE_DIR)
+    if not exists(cache_dir):
+        os.makedirs(cache_dir)
+    hostname = urlparse(config['baseurl']).netloc.replace(':', '_')
+    return join(cache_dir, '%s.sqlite' % hostname)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(config):
+    '''return the content cache for given configuration or None, if caching
+    is disabled
+    '''
+    if not to_bool(config.get('cache', True)):
+        return None
+
+    max_size = int(float(config.get('cache_size') or DEFAULT_CACHE_SIZE) * 1024 * 1024)
+
+    with _caches_lock:
+        path = _cache_path(config)
+        if path not in _caches:
+            _caches[path] = ContentCache(path, max_size=max_size)
+            STATS.register("content cache %s" % path, _caches[path].stats)
+        return _caches[path]
+
+_stores = {}
+
+def get_response_store(config):
+    '''return the response store for given configuration or None, if
+    conditional requests are disabled
+    '''
+    if not to_bool(config.get('cache', True)):
+        return None
+    if not to_bool(config.get('conditional_get', True)):
+        return None
+
+    max_size = int(float(config.get('cache_size') or DEFAULT_CACHE_SIZE) * 1024 * 1024)
+    with _caches_lock:
+        path = _cache_path(config)
+        if path not in _stores:
+            _stores[path] = ResponseStore(path, max_size=max_size)
+            STATS.register("conditional requests %s" % path, _stores[path].stats)
+        return _stores[path]
+
+@atexit.register
+def close_caches():
+    '''write pending access times of content caches and response stores'''
+    with _caches_lock:
+        for store in _caches.values() + _stores.values():
+            store.close()
+        _caches.clear()
+        _stores.clear()
+
+_refs = {}
+
+def get_reference_cache(config):
+    '''return the reference cache for given configuration or None, if
+    disabled
+    '''
+    if not to_bool(config.get('cache', True)):
+        return None
+
+    ttl = config.get('ref_ttl')
+    ttl = DEFAULT_REF_TTL if ttl is None else float(ttl)
+    if not ttl:
+        return None
+
+    with _caches_lock:
+        path = _cache_path(config)
+        if path not in _refs:
+            _refs[path] = ReferenceCache(path, ttl=ttl)
+            STATS.register("page references %s" % path, _refs[path].stats)
+        return _refs[path]
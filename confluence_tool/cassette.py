@@ -0,0 +1,173 @@
+"""Recording and replaying HTTP traffic.
+
+A cassette is a file of request/response pairs, one JSON object per line
+(gzip compressed, if the file name ends with ``.gz``).  With configuration
+values
+
+* ``cassette`` - path of the cassette file
+* ``cassette_mode`` - ``record`` or ``replay``
+* ``replay_latency`` - seconds to wait for each replayed response, or
+  ``recorded`` for the originally measured time (default 0)
+
+:class:`~confluence_tool.confluence_api.ConfluenceAPI` records all requests
+sent to confluence or serves them from the cassette without any network
+access.  Requests are matched by method, URL, query parameters and request
+body.  Identical requests are answered in recorded order, the last response
+is repeated, if there are more requests than recorded.
+
+Content cache and conditional requests are disabled while recording or
+replaying, so that a replay does not depend on the state of the local cache.
+"""
+
+import time, gzip, atexit, threading
+import json as JSON
+from collections import deque
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .stats import STATS
+
+import logging
+logger = logging.getLogger('confluence.cassette')
+
+# response headers kept in a cassette
+HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After', 'Location')
+
+
+class CassetteError(StandardError):
+    pass
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def request_key(method, url, params=None, data=None, json=None, **kwargs):
+    '''return key matching a request independent of headers'''
+    if isinstance(params, dict):
+        params = sorted([ (k, v) for (k, v) in params.items() if v is not None ])
+    if data is None and json is not None:
+        data = JSON.dumps(json, sort_keys=True)
+    return JSON.dumps([method, url, params or None, data])
+
+
+class Cassette(object):
+
+    def __init__(self, path, mode='replay', latency=0, sleep=time.sleep):
+        if mode not in ('record', 'replay'):
+            raise CassetteError("unknown cassette mode: %s" % mode)
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.counters = dict(recorded=0, replayed=0, missing=0)
+
+        if mode == 'record':
+            self.file = _open(path, 'wb')
+        else:
+            self.file = None
+            self.entries = {}
+            self.load()
+
+    def load(self):
+        with _open(self.path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = JSON.loads(line)
+                self.entries.setdefault(entry['key'], deque()).append(entry)
+        logger.debug("loaded %s requests from %s", len(self.entries), self.path)
+
+    def record(self, method, url, kwargs, response, elapsed):
+        entry = dict(
+            key     = request_key(method, url, **kwargs),
+            status  = response.status_code,
+            headers = dict( (k, response.headers[k]) for k in HEADERS if k in response.headers ),
+            body    = response.content.decode('utf-8', 'replace'),
+            elapsed = round(elapsed, 6),
+        )
+        line = JSON.dumps(entry) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.counters['recorded'] += 1
+
+    def play(self, method, url, kwargs):
+        '''return recorded response for the request'''
+        key = request_key(method, url, **kwargs)
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                self.counters['missing'] += 1
+                raise CassetteError("request not in cassette %s: %s %s %s" % (
+                    self.path, method, url, kwargs.get('params')))
+
+            entry = entries[0]
+            if len(entries) > 1:
+                entries.popleft()
+            self.counters['replayed'] += 1
+
+        if self.latency == 'recorded':
+            self.sleep(entry['elapsed'])
+        elif self.latency:
+            self.sleep(self.latency)
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = entry['body'].encode('utf-8')
+        response._content_consumed = True
+        response.encoding = 'utf-8'
+        response.url = url
+        return response
+
+    def send(self, request, method, url, **kwargs):
+        '''send request by calling ``request(method, url, **kwargs)`` or
+        serve it from cassette'''
+        if self.mode == 'replay':
+            return self.play(method, url, kwargs)
+
+        start = time.time()
+        response = request(method, url, **kwargs)
+        self.record(method, url, kwargs, response, time.time() - start)
+        return response
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+def get_cassette(config):
+    '''return cassette for given configuration or None'''
+    path = config.get('cassette')
+    if not path:
+        return None
+
+    with _cassettes_lock:
+        if path not in _cassettes:
+            latency = config.get('replay_latency') or 0
+            if latency != 'recorded':
+                latency = float(latency)
+            _cassettes[path] = Cassette(path, config.get('cassette_mode') or 'replay', latency)
+            STATS.register("cassette %s" % path, _cassettes[path].stats)
+        return _cassettes[path]
+
+@atexit.register
+def close_cassettes():
+    with _cassettes_lock:
+        for cassette in _cassettes.values():
+            cassette.close()
+        _cassettes.clear()
@@ -1,5 +1,7 @@
 from os.path import expanduser
 from confluence_tool import ConfluenceError, ConfluenceAPI
+from ..async_api import AsyncConfluenceAPI
+from ..stats import STATS
 import pyaml, yaml
 import logging
 from yaml import SafeLoader
@@ -32,6 +34,10 @@ class Config:
             self.confluence_api = self.getConfluenceAPI()
             return self.confluence_api
 
+        if name == 'async_api':
+            self.async_api = AsyncConfluenceAPI(self.confluence_api)
+            return self.async_api
+
         return self.get(name)
 
     def dict(self, *args):
@@ -83,6 +89,13 @@ class Config:
             config_name = self.args.get('config', 'default') or 'default'
             result.update(**self.config[config_name])
 
+        if self.args.get('record'):
+            result.update(cassette=self.args['record'], cassette_mode='record')
+        elif self.args.get('replay'):
+            result.update(cassette=self.args['replay'], cassette_mode='replay')
+            if self.args.get('replay_latency'):
+                result['replay_latency'] = self.args['replay_latency']
+
         if result['username'] and not result['password']:
             baseurl = result['baseurl']
             password = keyring.get_password('confluence-tool '+baseurl, result['username'])
@@ -165,6 +178,8 @@ from .cli import command, arg
 
 confluence_tool_config = {}
 
+_pyaml_p = pyaml.p
+
 
 def main(argv=None):
 
@@ -175,6 +190,9 @@ def main(argv=None):
             log = logging.getLogger()
             log.setLevel(logging.DEBUG)
 
+        if args.stats:
+            pyaml.p = STATS.timed('render', 'pyaml.p')(_pyaml_p)
+
         return [confluence_tool_config], {}
 
     try:
@@ -198,6 +216,10 @@ def main(argv=None):
             print (u"%s" % e).encode('utf-8')
             return 1
 
+    finally:
+        if confluence_tool_config.get('stats'):
+            STATS.report(confluence_tool_config.get('stats'))
+
 import edit
 import page_prop
 import show
@@ -205,5 +227,7 @@ import config
 import labels
 import comala_workflow
 import space
+import cache
+import copy_page
 
 argparser = command.argparser
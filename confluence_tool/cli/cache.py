@@ -0,0 +1,51 @@
+from .cli import command, arg
+import pyaml
+
+cache_command = command.add_subcommands('cache', help="local content cache")
+
+def get_cache(config):
+    cache = config.confluence_api.cache
+    if cache is None:
+        print "content cache is disabled"
+    return cache
+
+@cache_command('stats')
+def cache_stats(config):
+    """show size and usage of content cache"""
+    cache = get_cache(config)
+    if cache is not None:
+        pyaml.p(cache.stats())
+
+@cache_command('prune',
+    arg('--max-size', type=float, help="maximum size in MB (default: configured cache_size)"),
+)
+def cache_prune(config):
+    """evict least recently used pages and stored responses from cache"""
+    cache = get_cache(config)
+    if cache is not None:
+        max_size = config.get('max_size')
+        if max_size is not None:
+            max_size = int(max_size * 1024 * 1024)
+
+        result = {}
+        responses = config.confluence_api.responses
+        if responses is not None:
+            result['responses'] = responses.prune(max_size)
+        # pruning pages vacuums the database
+        result['removed'] = cache.prune(max_size)
+        pyaml.p(result)
+
+@cache_command('clear')
+def cache_clear(config):
+    """remove all pages, stored responses and page references from cache"""
+    cache = get_cache(config)
+    if cache is not None:
+        cache.clear()
+
+    responses = config.confluence_api.responses
+    if responses is not None:
+        responses.clear()
+
+    refs = config.confluence_api.refs
+    if refs is not None:
+        refs.clear()
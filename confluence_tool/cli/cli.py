@@ -28,6 +28,11 @@ command = CommandDecorator(
     arg('-p', '--password',    help="password for logging in (if not present, tried to read from netrc)"),
     arg('-d', '--debug',       action="store_true", help="get more information on exceptions"),
     arg('-q', '--quiet',       action="store_true", help="be quiet"),
+    arg('--stats',             action="store_const", const='table', help="print request and processing statistics to stderr at exit"),
+    arg('--stats-json',        action="store_const", const='json', dest='stats', help="like --stats, but print statistics as JSON"),
+    arg('--record',            metavar="FILE", help="record HTTP traffic into cassette FILE (gzipped, if ending with .gz)"),
+    arg('--replay',            metavar="FILE", help="replay HTTP traffic from cassette FILE instead of sending requests"),
+    arg('--replay-latency',    help="seconds to wait for each replayed response or 'recorded' (default: 0)"),
     prog='ct',
 )
 
@@ -48,6 +53,17 @@ arg_message = arg('-m', '--message', help="add a note or message")
 arg_add_label = arg('-l', '--label', action="append", help="add these labels to the page")
 arg_label   = arg('-l', '--label', help="with label(s)")
 arg_field   = arg('field', nargs="*", help='field to dump')
+arg_journal = arg('--journal', metavar="FILE", help="record pages done in journal FILE")
+arg_resume  = arg('--resume', metavar="FILE", help="skip pages done according to journal FILE and continue it")
+
+def get_journal(config, operation):
+    '''return journal of --journal or --resume option or None'''
+    from ..journal import Journal
+    if config.get('resume'):
+        return Journal(config['resume'], operation, resume=True)
+    if config.get('journal'):
+        return Journal(config['journal'], operation)
+    return None
 
 arg_parent = arg('-p', '--parent', help="specify parent for a page, which might be created")
 #def arg_parent(parser, namespace, values, option_string=None):
@@ -0,0 +1,57 @@
+from .cli import command, arg, arg_parent, arg_journal, arg_resume, get_journal
+from .space import space_command
+import pyaml, sys
+
+arg_copy = [
+    arg('--no-recursive', dest='recursive', action="store_false", help="copy only the page, not its descendants"),
+    arg('--delete', action="store_true", help="delete target descendants not present in source"),
+    arg('--workers', type=int, help="concurrent requests (default: configured workers)"),
+    arg('--progress', action="store_true", help="write out progress to stderr"),
+    arg('--sync', action="store_true", help="write only pages differing from their target"),
+    arg('--since', help="with --sync, consider pages not modified since this date (YYYY-MM-DD [HH:MM]) unchanged"),
+    arg_journal,
+    arg_resume,
+]
+
+def copy_options(config):
+    options = config.dict('recursive', 'delete', 'workers', 'sync', 'since')
+    if config.get('progress'):
+        options['progress'] = write_progress
+    options['journal'] = get_journal(config, 'copy')
+    return options
+
+def write_progress(copy):
+    sys.stderr.write("\r%s/%s pages, %.1f pages/s" % (copy.counts['pages'], copy.counts['total'], copy.rate))
+    if copy.counts['pages'] == copy.counts['total']:
+        sys.stderr.write("\n")
+
+@command('copy',
+    arg('source', help="SPACE:title, pageID or page URI of page to copy"),
+    arg('target', nargs="?", help="pageID, SPACE:title or title of target page (default: title of source)"),
+    arg_parent,
+    arg('-s', '--space', help="space of target page, if it is created"),
+    *arg_copy
+    )
+def cmd_copy(config):
+    """\
+    copy a page tree
+
+    Source page and its descendants are copied to target page, which is
+    created, if it does not exist.  Pages are created or updated level by
+    level, pages of a level concurrently.  With --sync, only pages differing
+    from their target are written.
+    """
+    pyaml.p(config.confluence_api.copyPage(config['source'], config['target'],
+        parent=config.get('parent'), space=config.get('space'), **copy_options(config)))
+
+@space_command('copy',
+    arg('source', help="key of space to copy"),
+    arg('key', help="key of new space"),
+    arg('name', help="name of new space"),
+    arg('--description', default='', help="description of new space"),
+    *arg_copy
+    )
+def space_copy(config):
+    """create a space with a copy of the page tree of another space"""
+    pyaml.p(config.confluence_api.copySpace(config['source'], config['key'], config['name'],
+        config['description'], **copy_options(config)))
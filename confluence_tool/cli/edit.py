@@ -1,7 +1,10 @@
 import yaml, pyaml, sys
+from collections import deque
 from difflib import Differ
-from .cli import command, arg, optarg_cql, arg_filter, arg_parent, arg_add_label, arg_pagename, arg_page_type
+from .cli import command, arg, optarg_cql, arg_filter, arg_parent, arg_add_label, arg_pagename, arg_page_type, arg_journal, arg_resume, get_journal
 from ..storage_editor import StorageEditor
+from ..tree_copy import storage_hash
+from ..async_api import AsyncConfluenceAPI
 
 # @command('create', arg_parent, arg_label, arg_space, arg("pagespec")
 # )
@@ -17,6 +20,8 @@ from ..storage_editor import StorageEditor
     # need arg_group
     arg('--show', action="store_true", help="show new content"),
     arg('--diff', action="store_true", help="show diff"),
+    arg_journal,
+    arg_resume,
     )
 def cmd_edit(config):
     """\
@@ -27,7 +32,6 @@ def cmd_edit(config):
     """
 
     confluence = config.getConfluenceAPI()
-    first = True
 
     if not config['file']:
         content = sys.stdin.read()
@@ -53,41 +57,83 @@ def cmd_edit(config):
 
     #editor = StorageEditor(confluence, **editor_config)
 
-    found = False
-    for page,content in confluence.editPages(confluence.resolveCQL(cql), filter=config.filter, editor=editor_config):
-        found = True
-        if not first:
+    async_api = AsyncConfluenceAPI(confluence)
+
+    first = [True]
+    def separate():
+        if not first[0]:
             print "---"
-        first = False
+        first[0] = False
+
+    journal = get_journal(config, 'edit')
+
+    # updates run concurrently, results are printed in order.  Each
+    # successful update is journaled, even if other updates fail
+    pending = deque()
+    failed = []
+    def print_result(item):
+        id, content, future = item
+        try:
+            result = future.result()
+        except StandardError as e:
+            failed.append(id)
+            sys.stderr.write("updating page %s failed: %s\n" % (id, e))
+            return
+
+        if journal is not None:
+            journal.record(result['id'], id=result['id'], version=result['version']['number'],
+                hash=storage_hash(content))
+        separate()
+        pyaml.p(result)
 
-        from html5print import HTMLBeautifier
-        b = HTMLBeautifier.beautify
+    found = False
+    try:
+        for page,content in async_api.editPages(confluence.resolveCQL(cql), filter=config.filter, editor=editor_config):
+            found = True
 
-        if config.show:
-            p = page.dict('id', 'spacekey', 'title')
+            if journal is not None and journal.done(page['id'], page['version']['number']):
+                continue
 
-            p['content'] = b(content, 2)
-            pyaml.p(p)
+            if config.show or config.diff:
+                from html5print import HTMLBeautifier
+                b = HTMLBeautifier.beautify
 
-        elif config.diff:
-            p = page.dict('id', 'spacekey', 'title')
+            if config.show:
+                separate()
+                p = page.dict('id', 'spacekey', 'title')
 
-            old = b(page['body']['storage']['value']).splitlines(1)
-            new = b(content).splitlines(1)
+                p['content'] = b(content, 2)
+                pyaml.p(p)
 
-            d = Differ()
-            result = list(d.compare(old, new))
+            elif config.diff:
+                separate()
+                p = page.dict('id', 'spacekey', 'title')
 
-            p['diff'] = ''.join(result)
-            pyaml.p(p)
+                old = b(page['body']['storage']['value']).splitlines(1)
+                new = b(content).splitlines(1)
 
-        else:
-            p = page.dict('id', 'title', 'version')
-            p['storage'] = content
-            p['version'] = int(page['version']['number'])+1
+                d = Differ()
+                result = list(d.compare(old, new))
 
-            result = confluence.updatePage(**p)
-            pyaml.p(result)
+                p['diff'] = ''.join(result)
+                pyaml.p(p)
+
+            else:
+                p = page.dict('id', 'title', 'version')
+                p['storage'] = content
+                p['version'] = int(page['version']['number'])+1
+
+                pending.append((page['id'], content, async_api.updatePage(**p)))
+                if len(pending) >= async_api.workers:
+                    print_result(pending.popleft())
+
+    finally:
+        while pending:
+            print_result(pending.popleft())
+
+    if failed:
+        sys.stderr.write("updating %s pages failed: %s\n" % (len(failed), ', '.join(failed)))
+        return 1
 
     if not found:
         space, title = cql.split(':', 1)
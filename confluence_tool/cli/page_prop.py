@@ -1,5 +1,6 @@
 import sys, re
-from .cli import command, arg, arg_format, optarg_cql, arg_filter, arg_state
+from .cli import command, arg, arg_format, optarg_cql, arg_filter, arg_state, arg_journal, arg_resume, get_journal
+from ..expand import infer_expand
 import pyaml, yaml
 
 @command('page-prop-get', optarg_cql, arg_filter, arg_format, arg_state,
@@ -37,19 +38,24 @@ def cmd_page_prop_get(config):
 
         gets all page properties for all pages with label 'some-label'
     """
-    confluence = config.getConfluenceAPI()
     first = True
 
     if config.get('dict'):
         results = {}
 
     kwargs = config.dict('cql', 'filter', 'state')
-    kwargs['expand'] = ['ancestors']
+    # ancestors are only needed for the parent
+    if config.get('format'):
+        kwargs['expand'] = infer_expand(format=config['format'], aliases=dict(parent='ancestors'))
+    else:
+        kwargs['expand'] = ['ancestors']
 
-    for pp in confluence.getPagesWithProperties(**kwargs):
+    for pp in config.async_api.getPagesWithProperties(**kwargs):
 
-        parent = pp['ancestors'][-1]
-        parent = dict(id=parent['id'], title=parent['title'], spacekey=pp.spacekey)
+        parent = None
+        if pp.has('ancestors') and pp['ancestors']:
+            parent = pp['ancestors'][-1]
+            parent = dict(id=parent['id'], title=parent['title'], spacekey=pp.spacekey)
         if config.get('format'):
             try:
 
@@ -75,7 +81,7 @@ def cmd_page_prop_get(config):
             else:
                 result['pageProperties'] = dict(pp.getPageProperties(*config.props))
 
-            result['parent'] = "{spacekey}:{title}".format(**parent)
+            result['parent'] = parent and "{spacekey}:{title}".format(**parent)
 
             if config.get('dict'):
                 results[result['id']] = result
@@ -100,7 +106,9 @@ def cmd_page_prop_get(config):
     arg('-l', '--label', action="append", help="add these labels to the page"),
     optarg_cql,
     arg('propset', nargs="*", help="property setting expression"),
-    arg('file', nargs="*", help="file to read data from")
+    arg('file', nargs="*", help="file to read data from"),
+    arg_journal,
+    arg_resume,
     )
 def cmd_page_prop_set(config):
     """\
@@ -265,6 +273,8 @@ def cmd_page_prop_set(config):
     if labels is None:
         labels = []
 
+    journal = get_journal(config, 'page-prop-set')
+
     for doc in documents:
         if config.get('parent'):
             if 'parent' not in doc:
@@ -294,7 +304,7 @@ def cmd_page_prop_set(config):
         if not isinstance(doc_labels, list):
             doc_labels = [ doc_labels ]
 
-        for result in confluence.setPageProperties(doc):
+        for result in confluence.setPageProperties(doc, journal=journal):
             if isinstance(result['page'], dict):
                 print("created {spacekey}:{title} ({id})".format(id=result['result']['id'], **result['page']))
             else:
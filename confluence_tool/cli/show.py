@@ -1,4 +1,5 @@
 from .cli import *
+from ..expand import infer_expand
 import sys
 import logging
 log = logging.getLogger('show')
@@ -51,18 +52,13 @@ def get_parent(config):
         arg('--ls', action="store_true", help="convenience for: -F '{id} {spacekey} {title}'"),
     ),
     arg('-B', '--beautify', action="store_true", help="beautify body.storage.value or body.view.value, if present"),
+    arg('--shards', type=int, help="split query by last modification into this number of concurrent queries"),
 #    arg('-d', '--data', help="filename containing data selector in YAML or JSON format"),
     arg('field', nargs="*", help='field to dump')
 )
 def show(config):
     """show a confluence item
 
-
-    """
-
-
-    """show a confluence item
-
     If specifying data selector file, there is added a special field
     body['data'] to each page.
 
@@ -133,12 +129,14 @@ def show(config):
 
     results = []
     log.debug('config: %s', config.args)
-    kwargs = config.dict('cql', 'expand', 'filter', 'state')
+    kwargs = config.dict('cql', 'expand', 'filter', 'state', 'shards')
+    kwargs['expand'] = infer_expand(format=config.get('format'), fields=config['field'],
+        filter=config.get('filter'), expand=config.get('expand'))
     log.debug('kwargs: %s', kwargs)
     kwargs['cql'] = config.confluence_api.resolveCQL(kwargs['cql'])
 
 
-    for page in config.confluence_api.getPages(**kwargs):
+    for page in config.async_api.getPages(**kwargs):
         rec = page.dict(*config['field'])
         if config.get('beautify'):
             from html5print import HTMLBeautifier
@@ -147,17 +145,21 @@ def show(config):
             if rec.get('body', {}).get('view', {}).get('value'):
                 rec['body']['view']['value'] = HTMLBeautifier.beautify(rec['body']['view']['value'], 4)
 
-        results.append(rec)
-
-    if config.get('format'):
-        for result in results:
+        if config.get('format'):
+            # print formatted pages as they arrive, so listing does not keep
+            # pages in memory
             if '{}' in config['format']:
-                fields = [ result[f] for f in config['field'] ]
+                fields = [ rec[f] for f in config['field'] ]
                 print config['format'].format(*fields)
 
-            print output_filter(unicode(config['format']).format(**result)).encode('utf-8')
+            print output_filter(unicode(config['format']).format(**rec)).encode('utf-8')
+        else:
+            results.append(rec)
+
+    if config.get('format'):
+        return
 
-    elif config.get('data'):
+    if config.get('data'):
         if config.get('data') == '-':
             data = get_list_data(sys.stdin.read())
         else:
@@ -1,9 +1,18 @@
 from urlparse import urlparse
-from .page import Page
+from .page import Page, merge_data
+from .tree_copy import TreeCopy, storage_hash
 import re, json
 import requests
 from .storage_editor import StorageEditor
 from .page_properties import PagePropertiesEditor
+from .transport import get_transport
+from .cache import get_cache, get_response_store, get_reference_cache, normalize_expand, request_key
+from .memo import get_memo
+from .stats import STATS, endpoint_template
+from .cassette import get_cassette
+from .parallel import Executor, pchain, pmap, DEFAULT_WORKERS
+from collections import deque
+from datetime import datetime
 
 import json as JSON
 
@@ -24,6 +33,8 @@ class ConfluenceAPI:
     def __init__(self, config):
         self.config = config
         self.hostname = urlparse(config['baseurl']).hostname
+        self.resolved = {}
+        self.compact_pages = bool(config.get('compact_pages'))
 
     def set_args(self, args):
         self.args = args
@@ -56,14 +67,52 @@ class ConfluenceAPI:
         return (user, password)
 
     def __getattr__(self, name):
+        if name == 'transport':
+            self.transport = get_transport(self.config, self._getauth)
+            return self.transport
+
         if name == 'session':
-            self.session = requests.Session()
-            self.session.auth = self._getauth()
-            return self.session
+            return self.transport.session
+
+        if name == 'cassette':
+            self.cassette = get_cassette(self.config)
+            return self.cassette
+
+        if name == 'cache':
+            self.cache = None if self.cassette else get_cache(self.config)
+            return self.cache
+
+        if name == 'responses':
+            self.responses = None if self.cassette else get_response_store(self.config)
+            return self.responses
+
+        if name == 'memo':
+            self.memo = get_memo(self.config)
+            return self.memo
+
+        if name == 'refs':
+            self.refs = None if self.cassette else get_reference_cache(self.config)
+            return self.refs
 
         raise AttributeError(name)
 
-    def request(self, method, endpoint, params=None, stream=None, data=None, json=None, headers=None, **kwargs):
+    def stats(self):
+        '''return statistics of the underlying transport, conditional
+        requests and memoized requests'''
+        result = self.transport.stats()
+        if self.responses is not None:
+            result.update(self.responses.stats())
+        if self.memo is not None:
+            result.update(self.memo.stats())
+        return result
+
+    def request(self, method, endpoint, params=None, stream=None, data=None, json=None, headers=None,
+            memo=True, **kwargs):
+        '''send request, return decoded JSON or the response, if ``stream``
+
+        GET requests are memoized, unless ``memo`` is False, which is meant
+        for GETs changing content.
+        '''
         url = self.config['baseurl'] + endpoint
         if params is None:
             params = {}
@@ -76,42 +125,115 @@ class ConfluenceAPI:
         if isinstance(params, dict):
             params.update(kwargs)
 
+        if method == 'GET' and memo and not stream:
+            if self.memo is not None:
+                text = self.memo.call(request_key(url, params),
+                    lambda: self._getText(url, params, headers, json), endpoint)
+            else:
+                text = self._getText(url, params, headers, json)
+
+            if text:
+                with STATS.timer('json', endpoint_template(endpoint)):
+                    return JSON.loads(text)
+            return {}
+
+        if (method != 'GET' or not memo) and self.memo is not None:
+            # content may change, so forget all memoized responses
+            self.memo.invalidate()
+
         try:
 
             if method == 'GET':
-                response = self.session.get(url, params=params, headers=headers, json=json, stream=stream)
+                response = self._send(method, url, params=params, headers=headers, json=json, stream=stream)
 
             elif data is not None:
-                response = self.session.request(method, url, data=data, params=params, json=json, headers=headers)
+                response = self._send(method, url, data=data, params=params, json=json, headers=headers)
 
             elif json is None and data is None:
                 headers.update({'Content-Type': 'application/json', 'Accept':'application/json'})
-                response = self.session.request(method, url, data=JSON.dumps(params), headers=headers)
+                response = self._send(method, url, data=JSON.dumps(params), headers=headers)
 
             else:
-                response = self.session.request(method, url, data=data, json=json, params=params, headers=headers)
+                response = self._send(method, url, data=data, json=json, params=params, headers=headers)
 
         except StandardError as e:
             logger.info("error in request %s %s with params %s", method, endpoint, params)
             raise
 
-        if response.status_code >= 400:
-            self.session.close()
-            del self.session
-
-            error = ''
-            logger.info("error: %s %s, %s: %s", method, url, params, response.text)
-
-            raise ConfluenceError(response.text)
+        self._checkResponse(response, method, url, params)
 
         if not stream:
             if response.text:
-                return response.json()
+                with STATS.timer('json', endpoint_template(endpoint)):
+                    return response.json()
         else:
             return response
 
         return {}
 
+    def _send(self, method, url, **kwargs):
+        '''send request through transport and record its latency and size'''
+        name = "%s %s" % (method, endpoint_template(url[len(self.config['baseurl']):]))
+        with STATS.timer('http', name) as info:
+            if self.cassette is not None:
+                # transport is not needed (and authenticated) for replaying
+                send = lambda *args, **kw: self.transport.request(*args, **kw)
+                response = self.cassette.send(send, method, url, **kwargs)
+            else:
+                response = self.transport.request(method, url, **kwargs)
+            if not kwargs.get('stream'):
+                info['bytes'] = len(response.content)
+        return response
+
+    def _checkResponse(self, response, method, url, params):
+        if response.status_code >= 400:
+            error = response.text
+            # release the connection back to the pool (also for streams)
+            response.close()
+
+            logger.info("error: %s %s, %s: %s", method, url, params, error)
+
+            raise ConfluenceError(error)
+
+    def _getText(self, url, params, headers, json=None):
+        """GET ``url`` and return response body
+
+        Sends a conditional request, if there is a stored response.
+        """
+        stored = None
+        if self.responses is not None:
+            response_key = request_key(url, params)
+            stored = self.responses.get(response_key)
+            if stored is not None:
+                headers = dict(headers)
+                (etag, last_modified, body) = stored
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+
+        try:
+            response = self._send('GET', url, params=params, headers=headers, json=json)
+        except StandardError as e:
+            logger.info("error in request %s %s with params %s", 'GET', url, params)
+            raise
+
+        self._checkResponse(response, 'GET', url, params)
+
+        if stored is not None and response.status_code == 304:
+            body = stored[2]
+            logger.debug("not modified: %s %s", url, params)
+            self.responses.not_modified(response_key, body)
+            return body
+
+        if self.responses is not None:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.responses.put(response_key, etag, last_modified, response.text)
+
+        return response.text
+
     def get(self, endpoint, params=None, **kwargs):
         return self.request('GET', endpoint, params, **kwargs)
 
@@ -133,31 +255,39 @@ class ConfluenceAPI:
                 }
             })
 
-    def copySpace(self, source_key, key, name, description=''):
+    def copySpace(self, source_key, key, name, description='', **kwargs):
+        """create space ``key`` and copy home page tree of space ``source_key``
+        into it (see :meth:`copyPage` for ``kwargs``)
+        """
         source_space = self.getSpace(source_key)
 
         # create new space
-        space = self.createSpace(key, name, description)
+        journal = kwargs.get('journal')
+        if journal is None or 'space:%s' % key not in journal:
+            self.createSpace(key, name, description)
+            if journal is not None:
+                journal.record('space:%s' % key)
         target_space = self.getSpace(key)
-        #log.info("Created new ps")
 
-        self.copyPage(source_space['_expandable']['homepage'], target_space['_expandable']['homepage'])
-
-        # self.updatePage(target_page['id'], version=target_page['version']['number'], title=target_page['title'], storage=source_page['body']['storage']['value'])
-        #
-        # subpages = self.getChildren(source_page['id'], type='page')
-        # # now create page tree from source page
-        # for subpage in subpages:
-        #     sp = self.getPage(subpage['id'], expand='body.storage')
-        #     self.createPage(target_space['key'], subpage['title'], storage = sp['body']['storage']['value'], parent=target_page['id'])
+        return self.copyPage(source_space['_expandable']['homepage'],
+            target_space['_expandable']['homepage'], **kwargs)
 
     def getUser(self, username, expand=''):
         """get user information"""
         return self.get("/rest/api/user", username=username, expand=expand)
 
-    def copyPage(self, source, target=None, recursive=True, parent=None, space=None, delete=False):
+    def getUsername(self, userkey):
+        """resolve userkey to username"""
+        return self.get("/rest/api/user", key=userkey)['username']
+
+    def copyPage(self, source, target=None, recursive=True, parent=None, space=None, delete=False,
+            workers=None, progress=None, sync=False, since=None, journal=None):
         '''copy source page as child of target and descend all children
 
+        The source tree is read with one query and copied level by level,
+        pages of a level concurrently (see :class:`~.tree_copy.TreeCopy`).
+        Returns counts of pages created, updated and deleted.
+
         :param source:
            content url or a pageid
         :param recursive:
@@ -165,65 +295,186 @@ class ConfluenceAPI:
         :param parent:
            parent for current target
         :param target:
-           where to copy a page
+           where to copy a page (pageid, SPACE:title or title)
         :param space:
            where to copy a page
         :param delete:
            delete children not present in source
+        :param workers:
+           number of concurrent requests (default configuration ``workers``)
+        :param progress:
+           called with the :class:`~.tree_copy.TreeCopy` after each page
+        :param sync:
+           write only pages differing from their target
+        :param since:
+           in sync mode, consider pages not modified since this date (or
+           datetime) as unchanged
+        :param journal:
+           :class:`~.journal.Journal` recording pages done, pages recorded
+           there are skipped
         '''
+        return TreeCopy(self, source, target=target, parent=parent, space=space,
+            recursive=recursive, delete=delete, workers=workers, progress=progress,
+            sync=sync, since=since, journal=journal).run()
 
-        source_page = self.getPage(source, expand='body.storage,space')
-        target_page = self.getPage(target, expand='version,space')
+    def getSpace(self, space_key, expand='', label=None, status=None):
+        return self.get( '/rest/api/space/%s' % space_key, expand=expand, label=label, status=status)
 
-        if target_page is None:
-            target_page = self.createPage(
-                space   = space,
-                title   = target,
-                storage = source_page['body']['storage']['value'],
-                parent  = parent
-            )
-            logger.info("Create Page: %s, %s", space, target)
-        else:
-            self.updatePage( target_page['id'],
-                version = target_page['version']['number'],
-                title   = target_page['title'],
-                storage = source_page['body']['storage']['value']
-            )
-            logger.info("Update Page: %s, %s", space, target_page['title'])
+    def listSpaces(self, expand='', status=None, type=None, label=None):
+        return self.iterate('get', '/rest/api/space', expand=expand, status=status, type=type, label=label)
 
-        if recursive:
-            source_subpages = sorted([ (p['title'], p) for p in self.getChildren(source_page['id'], type='page') ])
-            target_subpages = sorted([ (p['title'], p) for p in self.getChildren(target_page['id'], type='page') ])
+    # expansions, which do not change without a new page version
+    IMMUTABLE = ('body.storage', 'history', 'space', 'version')
 
-            # TODO: assert that there are no duplicate page titles
+    @staticmethod
+    def _cacheable(expand):
+        '''only pages with body.storage are worth caching'''
+        return 'body.storage' in normalize_expand(expand).split(',')
 
-            source_subpage = dict(source_subpages)
-            target_subpage = dict(target_subpages)
+    @classmethod
+    def _cacheExpand(cls, expand):
+        '''return expansions cached per version (always with version) and
+        expansions fetched live, like body.view, ancestors or labels, which
+        change without a new version
+        '''
+        expand = normalize_expand(expand).split(',')
+        cached = [ e for e in expand if e in cls.IMMUTABLE ]
+        live = [ e for e in expand if e and e not in cls.IMMUTABLE ]
+        return normalize_expand(cached + ['version']), live
+
+    @staticmethod
+    def _cacheData(data, live):
+        '''return page data without live expansions'''
+        data = dict(data)
+        for e in live:
+            root, _, sub = e.partition('.')
+            if root == 'body' and sub and 'body' in data:
+                data['body'] = dict( (k, v) for (k, v) in data['body'].items() if k != sub )
+            else:
+                data.pop(root, None)
+        return data
 
-            assert len(source_subpage.keys()) == len(source_subpages)
-            assert len(target_subpage.keys()) == len(target_subpages)
+    def _cachedPage(self, id, expand, status='current', version=None):
+        '''return data of page ``id`` from content cache, fetch it if missing
 
-            for title, page in source_subpage.items():
-                if title in target_subpage:
-                    subpage = target_subpage[title]['id']
+        The current version is checked with a cheap request (fetching live
+        expansions), if any version of the page is cached.
+        '''
+        url = '/rest/api/content/%s' % id
+        expand, live = self._cacheExpand(expand)
+
+        data = None
+        current = None
+        if status == 'historical' and version:
+            # historical versions never change
+            data = self.cache.get(id, int(version), expand)
+            if data is not None and live:
+                current = self.get(url, expand=','.join(live), status=status, version=version)
+        elif self.cache.contains(id):
+            current = self.get(url, expand=normalize_expand(live + ['version']), status=status, version=version)
+            data = self.cache.get(id, current['version']['number'], expand)
+
+        if data is None:
+            data = self.get(url, expand=normalize_expand(expand.split(',') + live), status=status, version=version)
+            self.cache.put(id, data['version']['number'], expand, self._cacheData(data, live))
+        elif current is not None:
+            merge_data(data, current)
+        return data
+
+    CACHE_BATCH = 50
+
+    def _cachedPages(self, cql, expand):
+        '''yield data of pages matching ``cql`` using content cache
+
+        Pages are listed with their version and live expansions only, pages
+        not in cache are fetched in batches.
+        '''
+        expand, live = self._cacheExpand(expand)
+
+        def resolve(listing):
+            found = {}
+            missing = []
+            for page in listing:
+                data = self.cache.get(page['id'], page['version']['number'], expand)
+                if data is None:
+                    missing.append(page['id'])
                 else:
-                    subpage = title
-
-                self.copyPage(page['id'], target=subpage, recursive=recursive,
-                    parent=target_page['id'], space=space)
-
-            if delete:
-                for title, page in target_subpage.items():
-                   if title not in source_subpage:
-                       self.deletePage(page['id'])
-
-    def getSpace(self, space_key, expand='', label=None, status=None):
-        return self.get( '/rest/api/space/%s' % space_key, expand=expand, label=label, status=status)
+                    merge_data(data, page)
+                    found[page['id']] = data
+
+            if missing:
+                logger.debug("fetch %s of %s pages", len(missing), len(listing))
+                for data in self.iterate('findPages', cql='id in (%s)' % ','.join(missing), expand=expand):
+                    self.cache.put(data['id'], data['version']['number'], expand, data)
+                    found[data['id']] = data
+
+            for page in listing:
+                if page['id'] in found and page['id'] in missing:
+                    merge_data(found[page['id']], page)
+
+            return [ found[page['id']] for page in listing if page['id'] in found ]
+
+        batch = []
+        for page in self.iterate('findPages', cql=cql, expand=normalize_expand(live + ['version'])):
+            batch.append(page)
+            if len(batch) >= self.CACHE_BATCH:
+                for data in resolve(batch):
+                    yield data
+                batch = []
+
+        for data in resolve(batch):
+            yield data
+
+    def expandPages(self, pages, expand):
+        """yield ``pages`` having expansions ``expand``
+
+        Missing expansions of current pages are fetched in batches of
+        ``CACHE_BATCH`` pages with a single query and merged into the pages.
+        Historical pages are updated one by one.
+        """
+        def resolve(batch):
+            missing = set()
+            ids = []
+            for page in batch:
+                _missing = page.missing(expand)
+                if not _missing:
+                    continue
+                if page.isHistorical():
+                    page.update(_missing)
+                    continue
+                missing.update(_missing)
+                ids.append(page['id'])
+
+            if ids:
+                logger.debug("expand %s of %s pages: %s", len(ids), len(batch), sorted(missing))
+                found = {}
+                for page in self.getPages('id in (%s)' % ','.join(ids), expand=sorted(missing)):
+                    found[page['id']] = page
+                for page in batch:
+                    if page['id'] in found:
+                        page.merge(found[page['id']])
+
+            return batch
+
+        batch = []
+        for page in pages:
+            batch.append(page)
+            if len(batch) >= self.CACHE_BATCH:
+                for page in resolve(batch):
+                    yield page
+                batch = []
+
+        for page in resolve(batch):
+            yield page
 
-    def listSpaces(self, expand='', status=None, type=None, label=None):
-        return self.iterate('get', '/rest/api/space', expand=expand, status=status, type=type, label=label)
+    CONTENT_ID = re.compile(r'^/rest/api/content/(\d+)$')
 
     def getPage(self, page_id, expand='', status='current', version=None):
+        """get a single page
+
+        Pages having an expanded body are served from content cache, if the
+        page's version did not change.
+        """
         if isinstance(expand, (list, set)):
             expand=",".join(expand)
 
@@ -235,19 +486,34 @@ class ConfluenceAPI:
                 assert len(pages) == 1
                 return pages[0]
 
-        return Page(self, self.get( page_id, expand=expand, status=status, version=version), expand=expand)
+        # historical versions never change, so they are always worth caching
+        cacheable = self._cacheable(expand) or (status == 'historical' and version)
+
+        m = self.CONTENT_ID.match(page_id)
+        if m and self.cache is not None and cacheable:
+            return Page(self, self._cachedPage(m.group(1), expand, status, version), expand=expand, compact=self.compact_pages)
+
+        return Page(self, self.get( page_id, expand=expand, status=status, version=version), expand=expand, compact=self.compact_pages)
 
     def movePage(self, page, parent):
+        # a GET changing content, which must not be memoized
         return self.get('/pages/movepage.action',
             pageId = page.id,
             spaceKey = parent['spacekey'],
             targetTitle = parent['title'],
-            position = 'append'
+            position = 'append',
+            memo = False
             )
 
-    def getPages(self, cql=None, expand=[], filter=None, state=None, pages=None, version=None):
+    def getPages(self, cql=None, expand=[], filter=None, state=None, pages=None, version=None, shards=None):
         """
         state is comala workflow state here
+
+        If ``shards`` is greater than 1, the query is split into up to
+        ``shards`` disjoint queries (see :meth:`shardCQL`), which run
+        concurrently.  Pages are yielded in order of arrival, without
+        duplicates.  Queries with long disjunctions are split the same way
+        (see :meth:`planCQL`).
         """
         logger.info("getPages cql=%s, expand=%s, filter=%s, state=%s", cql, expand, filter, state )
         if not expand:
@@ -256,43 +522,196 @@ class ConfluenceAPI:
         if pages is not None:
             cql = self.resolveCQL(pages)
 
+        queries = self.planCQL(cql)
+        if len(queries) > 1:
+            workers = min(len(queries), int(self.config.get('workers') or DEFAULT_WORKERS))
+            for page in self._unionPages(queries, expand, filter, state, version, workers):
+                yield page
+            return
+
+        if shards is not None and int(shards) > 1:
+            queries = self.shardCQL(cql, int(shards))
+            if len(queries) > 1:
+                for page in self._unionPages(queries, expand, filter, state, version, len(queries)):
+                    yield page
+                return
+
         if state is not None:
             _cql = '(%s) and state = "%s"' % (cql, state)
             for page in self.getPages(_cql, expand, filter):
                 yield page
 
+            # find last version in state of pages currently in another state
+            _expand = list(expand)
+            if filter is not None:
+                _expand.append('body.storage')
+
+            def resolve(page):
+                version = self._stateVersion(page, state)
+                if version is None:
+                    return None
+                logger.debug("found state version of %s: %s", page.id, version)
+                if version == page['version']['number']:
+                    return self.getPage(page.id, expand=_expand)
+                return self.getPage(page.id, expand=_expand, status='historical', version=version)
+
             _cql = '(%s) and state != "%s"' % (cql, state)
-            for page in self.getPages(_cql):
-                result = self.get("/rest/adhocworkflows/1/workflow/%s/states" % page.id)
+            workers = int(self.config.get('workers') or DEFAULT_WORKERS)
+            for page in pmap(resolve, self.getPages(_cql, expand=['version']), workers=workers):
+                if page is None:
+                    continue
+                logger.debug("page: %s", page)
+                for p in self.getPagesWithProperties(page, filter=filter):
+                    yield p
 
-                logger.debug("result: %s", result)
+        elif filter is not None:
+            for page in self.getPagesWithProperties(cql, filter=filter, expand=expand, version=version):
+                yield page
 
-                for _state in reversed(result['states']):
+        elif self.cache is not None and self._cacheable(expand):
+            for page in self._cachedPages(cql, expand):
+                yield Page(self, page, expand, compact=self.compact_pages)
 
-                    if _state[u'name'] != state:
-                        continue
+        else:
+            for page in self.iterate('findPages', cql=cql, expand=expand):
+                yield Page(self, page, expand, compact=self.compact_pages)
+
+    def _unionPages(self, queries, expand, filter, state, version, workers):
+        '''yield pages of ``queries`` run concurrently without duplicates'''
+        seen = set()
+        results = pchain([
+            self.getPages(q, list(expand), filter, state, version=version)
+            for q in queries ], workers=workers)
+        for page in results:
+            if page['id'] in seen:
+                continue
+            seen.add(page['id'])
+            yield page
 
-                    version = _state['contentVersion']
-                    logger.debug("found state version: %s", version)
+    WORKFLOW_STATES = '/rest/adhocworkflows/1/workflow/%s/states'
 
-                    _expand = expand
-                    if filter is not None:
-                        _expand.append('body.view')
+    def getWorkflowStates(self, page_id, version=None):
+        """return comala workflow state history of a page
 
-                    page = self.getPage(page.id, expand=_expand, status='historical', version=version)
-                    logger.debug("page: %s", page)
-                    for p in self.getPagesWithProperties(page, filter=filter):
-                        yield p
+        The history is kept in the content cache for the page's current
+        version ``version`` (looked up, if not given).  A new page version
+        gets a new history, state changes without a new version are only
+        seen after ``ct cache clear``.
+        """
+        if self.cache is None:
+            return self.get(self.WORKFLOW_STATES % page_id)['states']
 
-                    break
+        if version is None:
+            version = self.get('/rest/api/content/%s' % page_id, expand='version')['version']['number']
 
-        elif filter is not None:
-            for page in self.getPagesWithProperties(cql, filter=filter, expand=expand, version=version):
-                yield page
+        states = self.cache.get(page_id, version, 'workflow.states')
+        if states is None:
+            states = self.get(self.WORKFLOW_STATES % page_id)['states']
+            self.cache.put(page_id, version, 'workflow.states', states)
+        return states
 
-        else:
-            for page in self.iterate('findPages', cql=cql, expand=expand):
-                yield Page(self, page, expand)
+    def _stateVersion(self, page, state):
+        '''return last version of ``page`` having been in ``state`` or None'''
+        for _state in reversed(self.getWorkflowStates(page.id, page['version']['number'])):
+            if _state['name'] == state:
+                return _state['contentVersion']
+        return None
+
+    ORDER_BY = re.compile(r'\border\s+by\b', re.I)
+    CQL_DATE = '%Y/%m/%d %H:%M'
+
+    def _lastModified(self, cql, order):
+        for page in self.iterate('findPages', cql='(%s) order by lastmodified %s' % (cql, order), expand='version', limit=1):
+            return datetime.strptime(page['version']['when'][:19], '%Y-%m-%dT%H:%M:%S')
+
+    CQL_CHUNK = 50
+
+    # disjunctions created by resolveCQL and lists of ids
+    DISJUNCTION = re.compile(r'\(((?:ancestor|parent|id)\s*=\s*\d+(?:\s+OR\s+(?:ancestor|parent|id)\s*=\s*\d+)+)\)', re.I)
+    ID_LIST = re.compile(r'\b(id\s+in\s*)\(([\d,\s]+)\)', re.I)
+    CQL_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+    CQL_NOT = re.compile(r'\bnot\b', re.I)
+
+    def planCQL(self, cql):
+        """split ``cql`` into queries, which together match the same pages
+
+        Disjunctions of ``ancestor``, ``parent`` or ``id`` terms (like those
+        created by :meth:`resolveCQL` for ``X>>``) and ``id in (...)`` lists
+        having more than ``cql_chunk`` (default 50) terms are split into
+        chunks, so that queries stay short enough for a GET request.
+        Queries with ``not`` or an ``order by`` clause are not split.
+
+        :return:
+            list of CQL queries
+        """
+        if not cql or self.ORDER_BY.search(cql):
+            return [ cql ]
+        if self.CQL_NOT.search(self.CQL_STRING.sub('""', cql)):
+            return [ cql ]
+
+        chunk = int(self.config.get('cql_chunk') or self.CQL_CHUNK)
+
+        for m in self.DISJUNCTION.finditer(cql):
+            terms = re.split(r'\s+OR\s+', m.group(1), flags=re.I)
+            if len(terms) > chunk:
+                queries = []
+                for i in range(0, len(terms), chunk):
+                    part = u'(%s)' % u' OR '.join(terms[i:i+chunk])
+                    queries.extend(self.planCQL(cql[:m.start()] + part + cql[m.end():]))
+                logger.debug("split %s terms into %s queries", len(terms), len(queries))
+                return queries
+
+        for m in self.ID_LIST.finditer(cql):
+            ids = [ id.strip() for id in m.group(2).split(',') if id.strip() ]
+            if len(ids) > chunk:
+                queries = []
+                for i in range(0, len(ids), chunk):
+                    part = u'%s(%s)' % (m.group(1), u','.join(ids[i:i+chunk]))
+                    queries.extend(self.planCQL(cql[:m.start()] + part + cql[m.end():]))
+                logger.debug("split %s ids into %s queries", len(ids), len(queries))
+                return queries
+
+        return [ cql ]
+
+    def shardCQL(self, cql, shards):
+        """split ``cql`` into at most ``shards`` disjoint queries
+
+        Queries are split by ranges of ``lastmodified`` between the oldest
+        and the newest page matching ``cql``.  First and last range are open,
+        so all pages are covered, even if modified while querying.  Queries
+        having an ``order by`` clause are not split.
+
+        :return:
+            list of CQL queries
+        """
+        if self.ORDER_BY.search(cql):
+            logger.info("not sharding ordered query: %s", cql)
+            return [ cql ]
+
+        oldest = self._lastModified(cql, 'asc')
+        newest = self._lastModified(cql, 'desc')
+        if oldest is None or newest is None:
+            return [ cql ]
+
+        span = newest - oldest
+        first = oldest.strftime(self.CQL_DATE)
+        boundaries = []
+        for i in range(1, shards):
+            boundary = (oldest + span * i / shards).strftime(self.CQL_DATE)
+            # CQL dates have minute precision
+            if boundary > first and boundary not in boundaries:
+                boundaries.append(boundary)
+
+        if not boundaries:
+            return [ cql ]
+
+        queries = [ u'(%s) and lastmodified < "%s"' % (cql, boundaries[0]) ]
+        for lower, upper in zip(boundaries, boundaries[1:]):
+            queries.append(u'(%s) and lastmodified >= "%s" and lastmodified < "%s"' % (cql, lower, upper))
+        queries.append(u'(%s) and lastmodified >= "%s"' % (cql, boundaries[-1]))
+
+        logger.debug("shards: %s", queries)
+        return queries
 
     def getSpaceHomePage(self, space_key):
         logger.info("space_key: %s", space_key)
@@ -328,7 +747,8 @@ class ConfluenceAPI:
             result.append(self.delete('/rest/api/content/%s/label/%s' % (page_id, label)))
         return result
 
-    def updatePage(self, id, title, body=None, version=None, type='page', storage=None, wiki=None):
+    def updatePage(self, id, title, body=None, version=None, type='page', storage=None, wiki=None, parent=None):
+        """update page ``id``, move it below ``parent``, if given"""
         if not isinstance(version, dict):
             version = {'number': int(version)}
 
@@ -347,12 +767,19 @@ class ConfluenceAPI:
                 }
             }
 
-        return self.put('/rest/api/content/%s' % id,
+        # title may change
+        self.invalidateRefs(id)
+
+        data = dict(
             version = version,
             type    = type,
             title   = title,
             body    = body
         )
+        if parent is not None:
+            data['ancestors'] = [{'id': self.getContentId(parent)}]
+
+        return self.put('/rest/api/content/%s' % id, **data)
 
     def editPages(self, cql, editor, filter=None):
         """
@@ -400,41 +827,150 @@ class ConfluenceAPI:
             expand = ','.join(list(expand))
         return self.get('/rest/api/content/search', cql = cql, expand=expand, limit=limit, start=start)
 
+    DEFAULT_PREFETCH = 2
+    MAX_PAGE_SIZE = 1000
+
+    # largest accepted limit per (baseurl, endpoint, expand), shared in process
+    page_limits = {}
+
+    @staticmethod
+    def _next_link(result):
+        return result.get('_links', {}).get('next')
+
+    @classmethod
+    def _is_last(cls, result):
+        if result['size'] < result['limit']:
+            return True
+
+        # confluence provides a next link, if there are more results
+        links = result.get('_links', {})
+        return 'base' in links and 'next' not in links
+
+    def _windows(self, fetch, follow, start, limit, prefetch):
+        """yield result windows from ``start`` on
+
+        The first window is fetched synchronously.  If it provides a cursor
+        based next link, next links are followed.  Else next windows are
+        fetched by offset and the next ``prefetch`` windows are fetched in
+        background while the caller consumes the current one.  Pending
+        windows are cancelled, if the generator is closed.
+        """
+        result = fetch(start, limit)
+        yield result
+
+        next_link = self._next_link(result)
+        if next_link and 'cursor=' in next_link:
+            while next_link:
+                logger.info("follow: %s", next_link)
+                result = follow(next_link)
+                yield result
+                next_link = self._next_link(result)
+            return
+
+        if self._is_last(result):
+            return
+
+        limit = result.get('limit') or limit
+        total = result.get('totalSize')
+        start += limit
+
+        if not prefetch:
+            while total is None or start < total:
+                result = fetch(start, limit)
+                yield result
+                if self._is_last(result):
+                    return
+                start += limit
+            return
+
+        executor = Executor(prefetch, name='prefetch')
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < prefetch and (total is None or start < total):
+                    pending.append(executor.submit(fetch, start, limit))
+                    start += limit
+
+                if not pending:
+                    return
+
+                result = pending.popleft().result()
+                yield result
+
+                if self._is_last(result):
+                    return
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+
     def iterate(self, method, *args, **kwargs):
+        """yield all results of paginated ``method``
+
+        ``limit`` is the maximum number of results (default all).
+
+        Window size is configuration value ``page_size``.  If not configured,
+        the largest window size accepted by the server is discovered per
+        endpoint and expansion.  Cursor based next links are followed, if
+        the server provides them.  Else next result windows are fetched by
+        offset and prefetched in background, configure the number of windows
+        with configuration value ``prefetch`` (default 2, 0 disables
+        prefetching).
+        """
         if 'start' not in kwargs:
             kwargs['start'] = 0
         if 'limit' not in kwargs:
             kwargs['limit'] = -1
 
         start = kwargs['start']
-        limit = 25 # confluence max
-        done = False
         maxResults = kwargs['limit']
         if maxResults < 0:
             maxResults = 10000000000
 
-        while True:
-            kwargs['start'] = start
-            kwargs['limit'] = limit
-            result = getattr(self, method)(*args, **kwargs)
+        # page ids in endpoints like /rest/api/content/{id}/child/page do not
+        # change the accepted limit, expansions like body.storage do
+        endpoint = (self.config.get('baseurl'), method) + tuple(endpoint_template(a) for a in args if is_string(a)) \
+            + (normalize_expand(kwargs.get('expand')),)
 
-            for item in result['results']:
-                logger.info("item_id: %s", item['id'])
-                yield item
-                maxResults -= 1
-                if maxResults <= 0:
-                    break
-
-            if maxResults <= 0:
-                break
-
-            start += limit
-            if result['size'] < result['limit']:
-                break
+        limit = self.config.get('page_size')
+        if limit:
+            limit = int(limit)
+        else:
+            limit = self.page_limits.get(endpoint, self.MAX_PAGE_SIZE)
+        limit = min(limit, maxResults)
+
+        prefetch = self.config.get('prefetch')
+        if prefetch is None:
+            prefetch = self.DEFAULT_PREFETCH
+        prefetch = int(prefetch)
+
+        def fetch(start, limit):
+            _kwargs = dict(kwargs, start=start, limit=limit)
+            logger.info("fetch: start=%s, limit=%s", start, limit)
+            result = getattr(self, method)(*args, **_kwargs)
+
+            accepted = result.get('limit')
+            if accepted and accepted < limit:
+                logger.debug("accepted limit for %s: %s", endpoint, accepted)
+                self.page_limits[endpoint] = accepted
+            return result
 
-            logger.info("next round: start=%s, limit=%s, size=%s, result_limit=%s", start, limit, result['size'], result['limit'])
+        def follow(next_link):
+            return self.get(next_link)
 
-    SPACE_PAGE_REF = re.compile(r'^([A-Z]*):(.*)$')
+        windows = self._windows(fetch, follow, start, limit, prefetch)
+        try:
+            for result in windows:
+                for item in result['results']:
+                    logger.info("item_id: %s", item['id'])
+                    yield item
+                    maxResults -= 1
+                    if maxResults <= 0:
+                        return
+        finally:
+            windows.close()
+
+    SPACE_PAGE_REF = re.compile(r'^([A-Z]+):(.*)$')
     PAGE_REF = re.compile(r'^:(.*)$')
     PAGE_ID = re.compile(r'^(\d+)$')
     PAGE_URI = re.compile(r'api/content/(\d+)$')
@@ -453,19 +989,31 @@ class ConfluenceAPI:
             * ``:page title`` ->  ``title = "page title"``
             * ``12345`` -> ``ID = 12345``
             * ends with ``api/content/12345`` -> ``ID = 12345``
+            * a list of references -> ``ID in (<ids of referred pages>)``
             * else assume ``ref`` is already CQL
 
+        Ids of referred parents and ancestors are resolved with
+        :meth:`resolveIds`.
+
         :return:
             CQL
         """
+        # match groups are kept local, resolveCQL may run in several threads
+        mob = []
         def match(RE):
             m = RE.search(ref)
             if m:
-                self.mob = m.groups()
+                mob[:] = m.groups()
                 return True
             else:
                 return False
 
+        if isinstance(ref, (list, tuple)):
+            ids = self.resolveIds(ref)
+            result = u"ID in ({})".format(",".join(id for r in ref for id in ids[r]))
+            logger.debug("references CQL: %r", result)
+            return result
+
         if not is_string(ref):
             ref = str(ref)
 
@@ -473,47 +1021,107 @@ class ConfluenceAPI:
         logger.debug("ref = %r", ref)
 
         if match(self.ANCESTOR):
-            query = self.resolveCQL(*self.mob)
-            queries = []
-            for p in self.getPages(query):
-                queries.append(u"ancestor = {}".format(p.id))
-
+            queries = [ u"ancestor = {}".format(id) for id in self.resolveIds(mob)[mob[0]] ]
             result = "("+" OR ".join(queries)+")"
             logger.debug("ancestor CQL: %r", result)
             return result
-            #return #u"ancestor = {}".format(p.id)
 
         if match(self.PARENT):
-            query = self.resolveCQL(*self.mob)
-            logger.debug("query = %r", query)
-            #p = self.getPage(query)
-            queries = []
-            for p in self.getPages(query):
-                queries.append(u"parent = {}".format(p.id))
-
+            queries = [ u"parent = {}".format(id) for id in self.resolveIds(mob)[mob[0]] ]
             result = "("+" OR ".join(queries)+")"
             logger.debug("parent CQL: %r", result)
             return result
 
-            #return u"parent = {}".format(p.id)
-
         if match(self.SPACE_PAGE_REF):
-            if not self.mob[1]:
-                return u"space = {}".format(*self.mob)
+            if not mob[1]:
+                return u"space = {}".format(*mob)
             else:
-                return u"space = {} AND title  = \"{}\"".format(*self.mob)
+                return u"space = {} AND title  = \"{}\"".format(*mob)
 
         if match(self.PAGE_REF):
-            return u"title  = \"{}\"".format(*self.mob)
+            return u"title  = \"{}\"".format(*mob)
 
         if match(self.PAGE_ID):
-            return u"ID  = {}".format(*self.mob)
+            return u"ID  = {}".format(*mob)
 
         if match(self.PAGE_URI):
-            return u"ID  = {}".format(*self.mob)
+            return u"ID  = {}".format(*mob)
 
         return ref
 
+    REF_BATCH = 50
+
+    def resolveIds(self, refs):
+        """return dictionary of page references to lists of ids of referred
+        pages
+
+        References are resolved like in :meth:`resolveCQL`.  Ids are
+        remembered for this API object and ids of ``SPACE:title`` and
+        ``:title`` references are kept in the reference cache (see
+        configuration value ``ref_ttl``).  Uncached title references are
+        resolved with one query per ``REF_BATCH`` references.
+        """
+        result = {}
+        titles = []
+        for ref in refs:
+            if ref in result:
+                continue
+            key = (ref if is_string(ref) else str(ref)).strip()
+
+            ids = self.resolved.get(key)
+            if ids is None and self.refs is not None:
+                ids = self.refs.get(key)
+            if ids is not None:
+                result[ref] = ids
+                continue
+
+            m = self.SPACE_PAGE_REF.search(key) or self.PAGE_REF.search(key)
+            if m and m.groups()[-1] and not self.PARENT.search(key):
+                # SPACE:title or :title
+                space = m.group(1) if len(m.groups()) > 1 else None
+                titles.append((ref, key, space, m.groups()[-1]))
+            elif self.PAGE_ID.search(key) or self.PAGE_URI.search(key):
+                result[ref] = [ (self.PAGE_ID.search(key) or self.PAGE_URI.search(key)).group(1) ]
+            else:
+                result[ref] = self.resolved[key] = [ p['id'] for p in self.iterate('findPages', cql=self.resolveCQL(key)) ]
+
+        for i in range(0, len(titles), self.REF_BATCH):
+            batch = titles[i:i+self.REF_BATCH]
+            queries = []
+            for (ref, key, space, title) in batch:
+                query = u'title = "%s"' % title.replace('"', '\\"')
+                if space:
+                    query = u'space = %s AND %s' % (space, query)
+                queries.append(u'(%s)' % query)
+
+            found = {}
+            for page in self.iterate('findPages', cql=u" OR ".join(queries), expand='space'):
+                # titles are matched case insensitive
+                title = page['title'].lower()
+                found.setdefault((page['space']['key'], title), []).append(page['id'])
+                found.setdefault((None, title), []).append(page['id'])
+
+            for (ref, key, space, title) in batch:
+                ids = found.get((space, title.lower()), [])
+                result[ref] = ids
+                # pages may be created later
+                if ids:
+                    self.resolved[key] = ids
+                    if self.refs is not None:
+                        self.refs.put(key, ids)
+
+        logger.debug("resolved ids: %s", result)
+        return result
+
+    def invalidateRefs(self, id):
+        '''forget references resolved to page ``id``'''
+        id = str(id)
+        for ref, ids in list(self.resolved.items()):
+            if id in ids:
+                self.resolved.pop(ref, None)
+        if self.refs is not None:
+            self.refs.invalidate(id)
+
     def cwInfo(self, page, expand=[]):
         """return comala workflow information about current page"""
 
@@ -536,14 +1144,21 @@ class ConfluenceAPI:
             note = note)
 
 
-    def setPageProperties(self, document):
+    def setPageProperties(self, document, journal=None):
+        """set page properties of pages of ``document`` (see ``ct
+        page-prop-set``)
+
+        Pages written are recorded in :class:`~.journal.Journal` ``journal``.
+        Pages, whose current version has been written according to the
+        journal, are skipped.
+        """
         pages = document.pop('pages', None)
 
         if pages is not None:
             for page in pages:
                 _doc = document.copy()
                 _doc.update(page)
-                for p in self.setPageProperties(_doc):
+                for p in self.setPageProperties(_doc, journal=journal):
                     yield p
 
         cql = None
@@ -557,8 +1172,12 @@ class ConfluenceAPI:
 
             found = False
             for page in self.getPagesWithProperties(cql, expand=['body.storage', 'version']):
-                new_content = editor.edit(page)
                 found = True
+                if journal is not None and journal.done(page['id'], page['version']['number']):
+                    logger.info("skipping page %s, done according to journal", page['id'])
+                    continue
+
+                new_content = editor.edit(page)
                 old_content = page.content.replace(" />", "/>")
                 logger.debug("old: %r", old_content)
                 logger.debug("new: %r", new_content)
@@ -574,25 +1193,36 @@ class ConfluenceAPI:
                     logger.debug("content has not changed")
                     result = page
 
+                if journal is not None:
+                    journal.record(page['id'], id=page['id'], version=result['version']['number'],
+                        hash=storage_hash(new_content))
+                yield dict(page=page, content=new_content, result=result)
+
             if not found:
                 new_content = editor.edit()
                 (space, title) = document['page'].split(':', 1)
+                result = self.createPage(
+                    space = space,
+                    title = title,
+                    storage = new_content,
+                    parent = document.get('parent', None)
+                )
+                if journal is not None:
+                    journal.record(result['id'], id=result['id'], version=result['version']['number'],
+                        hash=storage_hash(new_content))
                 yield dict(
                     page    = dict(
                         spacekey = space,
                         title    = title,
                         ),
                     content = new_content,
-                    result  = self.createPage(
-                        space = space,
-                        title = title,
-                        storage = new_content,
-                        parent = document.get('parent', None)
-                    ))
+                    result  = result)
 
     PAGE_PROP_FILTER = re.compile(r'^(?:(.*?)([!=])=(.*)|!(.*)|(.*)\?)$')
     def getPagesWithProperties(self, cql, filter=None, expand=[], state=None, **options):
-        """Either pass CQL or a page having body.view expanded.
+        """Either pass CQL, a page or a list of pages.
+
+        Pages without body.storage are expanded in batches.
         """
         page_prop_filters = []
 
@@ -600,9 +1230,11 @@ class ConfluenceAPI:
 
         if isinstance(cql, Page):
             pages = [ cql ]
+        elif isinstance(cql, list) and all(isinstance(p, Page) for p in cql):
+            pages = self.expandPages(cql, 'body.storage')
         else:
             cql = self.resolveCQL(cql)
-            pages = self.getPages(cql, state=state, expand=expand + ['body.view'])
+            pages = self.getPages(cql, state=state, expand=expand + ['body.storage'])
 
         if filter is not None:
             if not isinstance(filter, list):
@@ -657,8 +1289,9 @@ class ConfluenceAPI:
             yield page
 
     def getContentId(self, page):
-        (space, title, id) = self.extractPage(page)
-        return id
+        ids = self.resolveIds([page])[page]
+        assert len(ids) == 1, "Ambigious search: %s" % page
+        return ids[0]
 
     def extractPage(self, pageSpec):
         results = self.findPages(pageSpec, expand='space')
@@ -684,11 +1317,51 @@ class ConfluenceAPI:
 
         return self.post('/rest/api/content', **data)
 
-    def getChildren(self, page_id, type=None, expand=''):
+    def deletePage(self, id):
+        self.invalidateRefs(id)
+        return self.delete('/rest/api/content/%s' % id)
+
+    def getChildren(self, page_id, type=None, expand='', limit=-1):
+        """yield children of type ``type`` (default: page) of page ``page_id``
+
+        Children are fetched in windows like in :meth:`iterate`, next
+        windows are prefetched while the current one is consumed.
+        """
+        if isinstance(expand, (list, set)):
+            expand = ','.join(expand)
         if not page_id.startswith('/rest'):
             page_id = '/rest/api/content/%s' % page_id
-        if type is None:
-            url = page_id +"/child"
-        else:
-            url = page_id + "/child/"+type
-        return self.get(url, expand=expand)['results']
+        url = page_id + "/child/" + (type or 'page')
+
+        for data in self.iterate('get', url, expand=expand, limit=limit):
+            yield Page(self, data, expand=expand, compact=self.compact_pages)
+
+    def getChildrenOfPages(self, page_ids, type=None, expand='', workers=None):
+        """yield tuples of page id and child for children of all ``page_ids``
+
+        Children of up to ``workers`` (default: configuration value
+        ``workers``) pages are fetched concurrently, so tuples are yielded in
+        order of arrival.
+        """
+        if workers is None:
+            workers = int(self.config.get('workers') or DEFAULT_WORKERS)
+
+        def children(page_id):
+            for page in self.getChildren(page_id, type=type, expand=expand):
+                yield page_id, page
+
+        return pchain([ children(str(id)) for id in page_ids ], workers=workers)
+
+    def walkTree(self, page_id, type=None, expand='', workers=None):
+        """yield levels of descendants of page ``page_id`` as lists of tuples
+        of parent id and page
+
+        Unlike an ``ancestor = ...`` query, this does not depend on the
+        search index, which may not yet know pages just created.
+        """
+        parents = [ str(page_id) ]
+        while parents:
+            level = list(self.getChildrenOfPages(parents, type=type, expand=expand, workers=workers))
+            if level:
+                yield level
+            parents = [ page['id'] for (parent, page) in level ]
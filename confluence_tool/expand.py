@@ -0,0 +1,106 @@
+"""Inference of page expansions from output format and fields.
+
+Commands printing only some fields of pages do not need to expand
+everything a user passes with ``-e``.  :func:`infer_expand` finds the
+expansions referred to by a format string (python format or mustache) and a
+list of fields::
+
+    >>> infer_expand(format='{title} {version[number]} {body[view][value]}')
+    ['body.view', 'version']
+"""
+
+import re
+from string import Formatter
+
+import logging
+logger = logging.getLogger('confluence.expand')
+
+# page fields, which are only present, if expanded
+EXPANDABLE = set([
+    'ancestors', 'body', 'children', 'container', 'descendants', 'history',
+    'metadata', 'operations', 'restrictions', 'space', 'version',
+])
+
+# fields expanded with their first subfield like "body.view"
+NESTED = set(['body', 'children', 'descendants', 'metadata', 'restrictions'])
+
+# expansion of nested fields referred to without subfield
+DEFAULTS = {
+    'body': 'body.storage',
+    'children': 'children.page',
+    'descendants': 'descendants.page',
+}
+
+FIELD_PART = re.compile(r'[^.\[\]]+')
+MUSTACHE_TAG = re.compile(r'\{\{\s*[#^/&{]?\s*([\w.\-]+)')
+
+
+def field_expansion(field, aliases=None):
+    '''return expansion needed for ``field`` like "body[view][value]" or None'''
+    parts = FIELD_PART.findall(field)
+    if not parts:
+        return None
+
+    root = parts[0]
+    if aliases and root in aliases:
+        return aliases[root]
+    if root not in EXPANDABLE:
+        return None
+    if root in NESTED:
+        if len(parts) > 1 and not parts[1].lstrip('-').isdigit():
+            return '%s.%s' % (root, parts[1])
+        return DEFAULTS.get(root, root)
+    return root
+
+
+def format_fields(format):
+    '''return fields referred to in python format or mustache template'''
+    if '{{' in format:
+        return MUSTACHE_TAG.findall(format)
+
+    fields = []
+    try:
+        for (literal, field, spec, conversion) in Formatter().parse(format):
+            if field:
+                fields.append(field)
+            if spec and '{' in spec:
+                fields.extend(format_fields(spec))
+    except ValueError as e:
+        logger.debug("cannot parse format %r: %s", format, e)
+    return fields
+
+
+def infer_expand(format=None, fields=(), filter=None, expand=None, aliases=None):
+    """return sorted list of expansions needed to output pages
+
+    If output is restricted by ``format`` or ``fields``, only expansions
+    referred to there are used, otherwise explicit expansions ``expand``.
+    Page property filters need ``body.storage``.  ``aliases`` map names of
+    command specific fields to their expansion.
+    """
+    if hasattr(expand, 'split'):
+        expand = expand.split(',')
+    explicit = set([ e.strip() for e in expand or [] if e.strip() ])
+
+    if format or fields:
+        names = list(fields or [])
+        if format:
+            names += format_fields(format)
+
+        result = set()
+        for name in names:
+            expansion = field_expansion(name, aliases)
+            if expansion is not None:
+                result.add(expansion)
+
+        if explicit - result:
+            logger.debug("not expanding unused %s", ','.join(sorted(explicit - result)))
+    else:
+        result = explicit
+
+    if filter:
+        result.add('body.storage')
+
+    result = sorted(result)
+    logger.debug("expand: %s", ','.join(result) or '(nothing)')
+    return result
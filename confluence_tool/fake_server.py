@@ -0,0 +1,957 @@
+"""Local stand-in for the confluence REST API.
+
+:class:`FakeConfluence` keeps spaces, pages (with versions, labels and comala
+workflow states) and users in memory and implements the endpoints used by
+:class:`~confluence_tool.confluence_api.ConfluenceAPI`:
+
+* ``/rest/api/content`` (get, create, update, delete)
+* ``/rest/api/content/search`` with a subset of CQL (see :func:`parse_cql`)
+* ``/rest/api/content/{id}/child``, ``/rest/api/content/{id}/label``
+* ``/rest/api/space``, ``/rest/api/user``
+* ``/rest/api/contentbody/convert/storage``
+* ``/rest/cw/1/content/{id}/status`` and ``/rest/adhocworkflows``
+
+:class:`FakeConfluenceServer` serves it on localhost with optional latency,
+error injection and rate limiting::
+
+    fake = FakeConfluence()
+    fake.seed(spaces=2, pages=5000)
+    with FakeConfluenceServer(fake, latency=0.02) as server:
+        api = ConfluenceAPI(dict(baseurl=server.baseurl, username='u', password='p'))
+
+Run ``python -m confluence_tool.fake_server --help`` for a standalone server.
+"""
+
+import re, time, random, threading
+import json as JSON
+from datetime import datetime, timedelta
+from cgi import escape
+from urlparse import urlparse, parse_qsl
+from urllib import quote_plus, urlencode
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+import logging
+logger = logging.getLogger('confluence.fake')
+
+
+class CqlError(StandardError):
+    pass
+
+
+class FakeError(StandardError):
+    """Error response of the fake server."""
+
+    def __init__(self, status, message):
+        StandardError.__init__(self, message)
+        self.status = status
+        self.message = message
+
+
+## CQL
+
+CQL_TOKEN = re.compile(r'''\s*(?:
+      (?P<paren>[(),])
+    | (?P<op>!=|>=|<=|!~|~|=|<|>)
+    | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<word>[\w.\-/:]+)
+    )''', re.X)
+
+CQL_DATE_FORMATS = ('%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M', '%Y/%m/%d', '%Y-%m-%d')
+
+
+def tokenize_cql(cql):
+    tokens = []
+    pos = 0
+    cql = cql.strip()
+    while pos < len(cql):
+        m = CQL_TOKEN.match(cql, pos)
+        if m is None or m.end() == pos:
+            raise CqlError("could not parse CQL at %r" % cql[pos:])
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        tokens.append((kind, value))
+    return tokens
+
+
+def _cql_date(value):
+    for fmt in CQL_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise CqlError("invalid date: %s" % value)
+
+
+class CqlParser(object):
+    """Parses a CQL subset into a predicate on page records.
+
+    Supported are ``AND``, ``OR``, ``NOT``, parentheses, operators ``=``,
+    ``!=``, ``~``, ``!~``, ``<``, ``<=``, ``>``, ``>=``, ``in`` and ``not in``
+    on fields ``id``, ``space``, ``title``, ``type``, ``parent``,
+    ``ancestor``, ``label``, ``text``, ``state``, ``created`` and
+    ``lastmodified`` and an ``order by`` clause.
+    """
+
+    def __init__(self, fake, cql):
+        self.fake = fake
+        self.tokens = tokenize_cql(cql)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def keyword(self, *words):
+        kind, value = self.peek()
+        if kind == 'word' and value.lower() in words:
+            self.pos += 1
+            return value.lower()
+        return None
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise CqlError("expected %s, got %r" % (value or kind, token[1]))
+        self.pos += 1
+        return token[1]
+
+    def parse(self):
+        predicate = self.expr()
+        order = []
+        if self.keyword('order'):
+            if not self.keyword('by'):
+                raise CqlError("expected 'by'")
+            while True:
+                field = self.take('word').lower()
+                direction = self.keyword('asc', 'desc') or 'asc'
+                order.append((field, direction == 'desc'))
+                if self.peek() != ('paren', ','):
+                    break
+                self.take('paren', ',')
+        if self.peek()[0] is not None:
+            raise CqlError("unexpected %r" % self.peek()[1])
+        return predicate, order
+
+    def expr(self):
+        terms = [ self.term() ]
+        while self.keyword('or'):
+            terms.append(self.term())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda page: any(t(page) for t in terms)
+
+    def term(self):
+        factors = [ self.factor() ]
+        while self.keyword('and'):
+            factors.append(self.factor())
+        if len(factors) == 1:
+            return factors[0]
+        return lambda page: all(f(page) for f in factors)
+
+    def factor(self):
+        if self.keyword('not'):
+            inner = self.factor()
+            return lambda page: not inner(page)
+        if self.peek() == ('paren', '('):
+            self.take('paren', '(')
+            inner = self.expr()
+            self.take('paren', ')')
+            return inner
+        return self.clause()
+
+    def values(self):
+        self.take('paren', '(')
+        values = [ self.value() ]
+        while self.peek() == ('paren', ','):
+            self.take('paren', ',')
+            values.append(self.value())
+        self.take('paren', ')')
+        return values
+
+    def value(self):
+        kind, value = self.peek()
+        if kind not in ('word', 'string'):
+            raise CqlError("expected value, got %r" % value)
+        self.pos += 1
+        return value
+
+    def clause(self):
+        field = self.take('word').lower()
+        getter = self.fake.cql_field(field)
+
+        if self.keyword('not'):
+            if not self.keyword('in'):
+                raise CqlError("expected 'in'")
+            values = set(self.values())
+            return lambda page: not (set(getter(page)) & values)
+
+        if self.keyword('in'):
+            values = set(self.values())
+            return lambda page: bool(set(getter(page)) & values)
+
+        op = self.take('op')
+        value = self.value()
+
+        if field in ('created', 'lastmodified'):
+            date = _cql_date(value)
+            compare = {
+                '=':  lambda d: d.strftime('%Y%m%d%H%M') == date.strftime('%Y%m%d%H%M'),
+                '!=': lambda d: d.strftime('%Y%m%d%H%M') != date.strftime('%Y%m%d%H%M'),
+                '<':  lambda d: d < date,
+                '<=': lambda d: d <= date,
+                '>':  lambda d: d > date,
+                '>=': lambda d: d >= date,
+            }.get(op)
+            if compare is None:
+                raise CqlError("operator %s not supported for %s" % (op, field))
+            return lambda page: any(compare(d) for d in getter(page))
+
+        if op == '=':
+            return lambda page: value in getter(page)
+        if op == '!=':
+            return lambda page: value not in getter(page)
+        if op in ('~', '!~'):
+            words = value.lower().replace('*', '').split()
+            def contains(page):
+                text = u' '.join(getter(page)).lower()
+                return all(w in text for w in words)
+            if op == '~':
+                return contains
+            return lambda page: not contains(page)
+
+        raise CqlError("operator %s not supported for %s" % (op, field))
+
+
+def parse_cql(fake, cql):
+    '''return ``(predicate, order)`` for ``cql``'''
+    return CqlParser(fake, cql).parse()
+
+
+## content
+
+def storage_to_view(storage):
+    '''render the parts of storage format used by page properties to view
+    format'''
+    view = re.sub(r'<ac:structured-macro[^>]*ac:name="details"[^>]*>\s*<ac:rich-text-body>',
+        '<div class="plugin-tabmeta-details conf-macro output-block" data-macro-name="details">', storage)
+    view = re.sub(r'</ac:rich-text-body>\s*</ac:structured-macro>', '</div>', view)
+    view = re.sub(r'<table>', '<div class="table-wrap"><table class="confluenceTable">', view)
+    view = re.sub(r'</table>', '</table></div>', view)
+    view = re.sub(r'<ri:user ri:username="([^"]*)"\s*/>',
+        r'<a class="confluence-userlink user-mention" data-username="\1" href="/display/~\1">\1</a>', view)
+    view = re.sub(r'</?ac:link>', '', view)
+    view = re.sub(r'<time datetime="([^"]*)"\s*/>', r'<time datetime="\1" class="date-past">\1</time>', view)
+    return view
+
+
+def wiki_to_storage(wiki):
+    '''convert wiki markup to storage format (paragraphs only)'''
+    paragraphs = [ p.strip() for p in re.split(r'\n\s*\n', wiki) if p.strip() ]
+    return u''.join(u'<p>%s</p>' % escape(p) for p in paragraphs)
+
+
+PAGE_BODY = u"""<ac:structured-macro ac:name="details" ac:schema-version="1"><ac:rich-text-body><table><tbody>%s</tbody></table></ac:rich-text-body></ac:structured-macro><p>%s</p>"""
+PROPERTY_ROW = u"""<tr><th>%s</th><td>%s</td></tr>"""
+
+STATES = ('Draft', 'Review', 'Approved')
+
+
+def space_key(n):
+    '''return n-th seeded space key (BENCHA, BENCHB, ..., BENCHBA, ...)'''
+    letters = ''
+    while True:
+        letters = chr(ord('A') + n % 26) + letters
+        n //= 26
+        if not n:
+            return 'BENCH' + letters
+
+
+class FakeConfluence(object):
+    """In-memory confluence content."""
+
+    def __init__(self, max_limit=100, clock=time.time):
+        self.lock = threading.RLock()
+        self.max_limit = max_limit
+        self.clock = clock
+        self.spaces = {}    # key -> dict(key, name, homepage)
+        self.pages = {}     # id -> page record
+        self.users = {}     # username -> user
+        self.next_id = 100000
+        self.base_time = datetime(2020, 1, 1)
+        self.ticks = 0
+
+    ## records
+
+    def _now(self):
+        # every change gets a new minute, so lastmodified ranges are usable
+        self.ticks += 1
+        return self.base_time + timedelta(minutes=self.ticks)
+
+    def addUser(self, username, displayName=None):
+        with self.lock:
+            self.users[username] = dict(
+                type        = 'known',
+                username    = username,
+                userKey     = 'key-%s' % username,
+                displayName = displayName or username.title(),
+            )
+            return self.users[username]
+
+    def addSpace(self, key, name=None, description=''):
+        with self.lock:
+            if key in self.spaces:
+                raise FakeError(400, "A space with key %s already exists" % key)
+            self.spaces[key] = space = dict(key=key, name=name or key, description=description, homepage=None)
+            home = self.addPage(key, u'%s Home' % space['name'], u'<p>Welcome</p>')
+            space['homepage'] = home['id']
+            return space
+
+    def addPage(self, space, title, storage, parent=None, type='page', labels=(), state=None, user='admin'):
+        with self.lock:
+            if space not in self.spaces:
+                raise FakeError(404, "No space with key : %s" % space)
+            if self.findTitle(space, title) is not None:
+                raise FakeError(400, "A page with this title already exists: A page already exists with the title %s in the space with key %s" % (title, space))
+            if parent is not None and str(parent) not in self.pages:
+                raise FakeError(404, "No content found with id %s" % parent)
+
+            self.next_id += 1
+            id = str(self.next_id)
+            now = self._now()
+            self.pages[id] = page = dict(
+                id       = id,
+                type     = type,
+                status   = 'current',
+                title    = title,
+                space    = space,
+                parent   = str(parent) if parent is not None else None,
+                created  = now,
+                versions = [ dict(number=1, when=now, by=user, title=title, storage=storage) ],
+                labels   = list(labels),
+                states   = [],
+                approvals = [],
+            )
+            if state:
+                page['states'].append(dict(name=state, contentVersion=1))
+            return page
+
+    def findTitle(self, space, title):
+        for page in self.pages.values():
+            if page['space'] == space and page['title'] == title and page['status'] == 'current':
+                return page
+        return None
+
+    def page(self, id):
+        page = self.pages.get(str(id))
+        if page is None or page['status'] != 'current':
+            raise FakeError(404, "No content found with id: ContentId{id=%s}" % id)
+        return page
+
+    def ancestors(self, page):
+        result = []
+        parent = page['parent']
+        while parent is not None:
+            p = self.pages[parent]
+            result.insert(0, p)
+            parent = p['parent']
+        return result
+
+    def children(self, page):
+        return sorted([ p for p in self.pages.values()
+            if p['parent'] == page['id'] and p['status'] == 'current' ], key=lambda p: int(p['id']))
+
+    def seed(self, spaces=1, pages=1000, fanout=10, properties=5, users=10, random_seed=0):
+        '''create ``spaces`` spaces (see :func:`space_key`) with ``pages``
+        pages each
+
+        Pages form a tree with ``fanout`` children per page below the space
+        home page.  Each page has a page properties table with ``properties``
+        rows, a label and a comala workflow state.
+        '''
+        rnd = random.Random(random_seed)
+        with self.lock:
+            for u in range(users):
+                self.addUser('user%s' % u)
+
+            for s in range(spaces):
+                key = space_key(s)
+                space = self.addSpace(key, 'Benchmark Space %s' % s)
+                parents = [ space['homepage'] ]
+                for n in range(pages):
+                    parent = parents[n // fanout] if n // fanout < len(parents) else parents[-1]
+                    rows = []
+                    for p in range(properties):
+                        if p == 0:
+                            value = u'<ac:link><ri:user ri:username="user%s"/></ac:link>' % rnd.randrange(users)
+                        elif p == 1:
+                            value = u'<time datetime="2020-%02d-%02d"/>' % (rnd.randint(1, 12), rnd.randint(1, 28))
+                        else:
+                            value = u'value %s' % rnd.randrange(100)
+                        rows.append(PROPERTY_ROW % (u'Property %s' % p, value))
+                    storage = PAGE_BODY % (u''.join(rows), u'Page %s of space %s.' % (n, key))
+                    page = self.addPage(key, u'Page %s %s' % (key, n), storage, parent=parent,
+                        labels=[ u'label-%s' % (n % 10) ], state=rnd.choice(STATES),
+                        user='user%s' % rnd.randrange(users))
+                    parents.append(page['id'])
+
+    ## CQL fields
+
+    def cql_field(self, field):
+        '''return function returning list of values of ``field`` of a page'''
+        last = lambda page: page['versions'][-1]
+        fields = {
+            'id':       lambda page: [ page['id'] ],
+            'content':  lambda page: [ page['id'] ],
+            'space':    lambda page: [ page['space'] ],
+            'title':    lambda page: [ page['title'] ],
+            'type':     lambda page: [ page['type'] ],
+            'parent':   lambda page: [ page['parent'] ] if page['parent'] else [],
+            'ancestor': lambda page: [ p['id'] for p in self.ancestors(page) ],
+            'label':    lambda page: page['labels'],
+            'text':     lambda page: [ page['title'], last(page)['storage'] ],
+            'state':    lambda page: [ page['states'][-1]['name'] ] if page['states'] else [],
+            'created':  lambda page: [ page['created'] ],
+            'lastmodified': lambda page: [ last(page)['when'] ],
+            'creator':  lambda page: [ page['versions'][0]['by'] ],
+            'contributor': lambda page: [ v['by'] for v in page['versions'] ],
+        }
+        if field not in fields:
+            raise CqlError("unsupported CQL field: %s" % field)
+        return fields[field]
+
+    def search(self, cql):
+        predicate, order = parse_cql(self, cql)
+        with self.lock:
+            result = [ p for p in self.pages.values() if p['status'] == 'current' and predicate(p) ]
+
+        result.sort(key=lambda p: int(p['id']))
+        for field, reverse in reversed(order):
+            getter = self.cql_field(field)
+            result.sort(key=lambda p: getter(p), reverse=reverse)
+        return result
+
+    ## JSON representation
+
+    def user_json(self, username):
+        return self.users.get(username) or dict(type='known', username=username, displayName=username)
+
+    def space_json(self, space, expand=()):
+        data = dict(
+            id   = abs(hash(space['key'])) % 1000000,
+            key  = space['key'],
+            name = space['name'],
+            type = 'global',
+            _links = dict(webui='/display/%s' % space['key'], self='/rest/api/space/%s' % space['key']),
+            _expandable = dict(homepage='/rest/api/content/%s' % space['homepage'],
+                description='', metadata=''),
+        )
+        if 'homepage' in expand:
+            data['homepage'] = self.content_json(self.pages[space['homepage']])
+            del data['_expandable']['homepage']
+        if 'description' in expand or 'description.plain' in expand:
+            data['description'] = dict(plain=dict(value=space['description'], representation='plain'))
+            del data['_expandable']['description']
+        return data
+
+    def content_json(self, page, expand=(), version=None):
+        if version is None:
+            v = page['versions'][-1]
+        else:
+            matching = [ _v for _v in page['versions'] if _v['number'] == int(version) ]
+            if not matching:
+                raise FakeError(404, "No content found with id %s and version %s" % (page['id'], version))
+            v = matching[0]
+
+        expand = set(expand)
+        data = dict(
+            id     = page['id'],
+            type   = page['type'],
+            status = page['status'] if v is page['versions'][-1] else 'historical',
+            title  = v['title'],
+            _links = dict(
+                webui  = '/display/%s/%s' % (page['space'], quote_plus(v['title'].encode('utf-8'))),
+                tinyui = '/x/%s' % page['id'],
+                self   = '/rest/api/content/%s' % page['id'],
+            ),
+            _expandable = dict(
+                container   = '/rest/api/space/%s' % page['space'],
+                space       = '/rest/api/space/%s' % page['space'],
+                version     = '',
+                body        = '',
+                ancestors   = '',
+                history     = '/rest/api/content/%s/history' % page['id'],
+                children    = '/rest/api/content/%s/child' % page['id'],
+                descendants = '/rest/api/content/%s/descendant' % page['id'],
+                metadata    = '',
+                operations  = '',
+                restrictions = '/rest/api/content/%s/restriction/byOperation' % page['id'],
+            ),
+        )
+
+        def expanded(name):
+            data['_expandable'].pop(name, None)
+
+        if 'space' in expand:
+            data['space'] = self.space_json(self.spaces[page['space']])
+            expanded('space')
+        if 'container' in expand:
+            data['container'] = self.space_json(self.spaces[page['space']])
+            expanded('container')
+        if 'version' in expand:
+            data['version'] = dict(
+                number  = v['number'],
+                when    = v['when'].strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                by      = self.user_json(v['by']),
+                message = '',
+                minorEdit = False,
+            )
+            expanded('version')
+        if 'ancestors' in expand:
+            data['ancestors'] = [ self.content_json(p) for p in self.ancestors(page) ]
+            expanded('ancestors')
+        if 'history' in expand:
+            data['history'] = dict(
+                latest      = v is page['versions'][-1],
+                createdBy   = self.user_json(page['versions'][0]['by']),
+                createdDate = page['created'].strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            )
+            expanded('history')
+        if 'metadata.labels' in expand:
+            data['metadata'] = dict(labels=self.labels_json(page))
+            expanded('metadata')
+        if 'children.page' in expand:
+            children = [ self.content_json(p) for p in self.children(page) ]
+            data['children'] = dict(page=dict(results=children, start=0, limit=len(children), size=len(children)))
+            expanded('children')
+
+        body = {}
+        if 'body.storage' in expand:
+            body['storage'] = dict(value=v['storage'], representation='storage')
+        if 'body.view' in expand:
+            body['view'] = dict(value=storage_to_view(v['storage']), representation='storage')
+        if body:
+            data['body'] = body
+            expanded('body')
+
+        return data
+
+    def labels_json(self, page):
+        results = [ dict(prefix='global', name=l, id=str(abs(hash(l)) % 1000000)) for l in page['labels'] ]
+        return dict(results=results, start=0, limit=200, size=len(results))
+
+    def states_json(self, page):
+        return dict(states=list(page['states']))
+
+    def status_json(self, page):
+        state = page['states'][-1] if page['states'] else dict(name='None', contentVersion=0)
+        return dict(
+            state     = dict(name=state['name'], description=''),
+            approvals = list(page['approvals']),
+            latest    = state['contentVersion'] == page['versions'][-1]['number'],
+        )
+
+
+## HTTP
+
+def _expand(params):
+    return [ e.strip() for e in (params.get('expand') or '').split(',') if e.strip() ]
+
+
+def _paged(items, params, max_limit, link, render):
+    start = int(params.get('start') or 0)
+    limit = min(int(params.get('limit') or 25), max_limit)
+    window = items[start:start+limit]
+    result = dict(
+        results = [ render(i) for i in window ],
+        start   = start,
+        limit   = limit,
+        size    = len(window),
+        _links  = dict(base='', context=''),
+    )
+    if start + limit < len(items):
+        next_params = dict(params, start=start+limit, limit=limit)
+        result['_links']['next'] = '%s?%s' % (link, urlencode(sorted(
+            (k, unicode(v).encode('utf-8')) for (k, v) in next_params.items() )))
+    return result
+
+
+class FakeConfluenceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    ROUTES = [
+        ('GET',    r'/rest/api/content/search$',                  'search'),
+        ('GET',    r'/rest/api/content/(\d+)$',                   'getContent'),
+        ('PUT',    r'/rest/api/content/(\d+)$',                   'updateContent'),
+        ('DELETE', r'/rest/api/content/(\d+)$',                   'deleteContent'),
+        ('POST',   r'/rest/api/content/?$',                       'createContent'),
+        ('GET',    r'/rest/api/content/(\d+)/child$',             'getChildren'),
+        ('GET',    r'/rest/api/content/(\d+)/child/(\w+)$',       'getChildrenOfType'),
+        ('GET',    r'/rest/api/content/(\d+)/label$',             'getLabels'),
+        ('POST',   r'/rest/api/content/(\d+)/label$',             'addLabels'),
+        ('DELETE', r'/rest/api/content/(\d+)/label/([^/]+)$',     'deleteLabel'),
+        ('GET',    r'/rest/api/space/?$',                         'listSpaces'),
+        ('POST',   r'/rest/api/space/?$',                         'createSpace'),
+        ('GET',    r'/rest/api/space/([^/]+)$',                   'getSpace'),
+        ('GET',    r'/rest/api/user$',                            'getUser'),
+        ('POST',   r'/rest/api/contentbody/convert/storage$',     'convert'),
+        ('GET',    r'/rest/cw/1/content/(\d+)/status$',           'cwStatus'),
+        ('GET',    r'/rest/adhocworkflows/[^/]+/workflow/(\d+)/states$', 'cwStates'),
+        ('POST',   r'/rest/adhocworkflows/[^/]+/approval/(\d+)/(approve|reject)$', 'cwApproval'),
+        ('GET',    r'/pages/movepage\.action$',                  'movePage'),
+    ]
+    ROUTES = [ (m, re.compile(p), h) for (m, p, h) in ROUTES ]
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        params = dict( (k, v.decode('utf-8')) for (k, v) in parse_qsl(url.query) )
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+
+        status, result, headers = self.server.admit()
+        if status is None:
+            try:
+                status, result = self.route(method, url.path, params, body)
+            except FakeError as e:
+                status, result = e.status, dict(statusCode=e.status, message=e.message)
+            except (CqlError, ValueError, KeyError) as e:
+                status, result = 400, dict(statusCode=400, message=u"%s" % e)
+
+        self.respond(status, result, headers)
+
+    def route(self, method, path, params, body):
+        allowed = False
+        for (_method, pattern, handler) in self.ROUTES:
+            m = pattern.match(path)
+            if m:
+                allowed = True
+                if _method == method:
+                    data = JSON.loads(body) if body else None
+                    return getattr(self, handler)(params, data, *m.groups())
+        if allowed:
+            raise FakeError(405, "method %s not allowed" % method)
+        raise FakeError(404, "null for uri: %s" % path)
+
+    def respond(self, status, result, headers=None):
+        body = '' if result is None else JSON.dumps(result)
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    ## content
+
+    def search(self, params, data):
+        cql = params.get('cql')
+        if not cql:
+            raise FakeError(400, "cql parameter is required")
+        pages = self.fake.search(cql)
+        expand = _expand(params)
+        with self.fake.lock:
+            result = _paged(pages, params, self.fake.max_limit, '/rest/api/content/search',
+                lambda p: self.fake.content_json(p, expand))
+        result['totalSize'] = len(pages)
+        result['cqlQuery'] = cql
+        return 200, result
+
+    def getContent(self, params, data, id):
+        with self.fake.lock:
+            page = self.fake.pages.get(id)
+            if page is None or (page['status'] != 'current' and params.get('status') != 'trashed'):
+                raise FakeError(404, "No content found with id: ContentId{id=%s}" % id)
+            version = None
+            if params.get('status') == 'historical' or params.get('version'):
+                version = params.get('version')
+            return 200, self.fake.content_json(page, _expand(params), version)
+
+    def _storage(self, body):
+        storage = body.get('storage') or {}
+        if storage.get('representation') == 'wiki':
+            return wiki_to_storage(storage.get('value', u''))
+        return storage.get('value', u'')
+
+    def createContent(self, params, data):
+        parent = None
+        if data.get('ancestors'):
+            parent = data['ancestors'][-1]['id']
+        with self.fake.lock:
+            page = self.fake.addPage(
+                space   = data['space']['key'],
+                title   = data['title'],
+                storage = self._storage(data.get('body') or {}),
+                parent  = parent,
+                type    = data.get('type') or 'page',
+            )
+            return 200, self.fake.content_json(page, ['space', 'version', 'body.storage', 'ancestors'])
+
+    def updateContent(self, params, data, id):
+        with self.fake.lock:
+            page = self.fake.page(id)
+            current = page['versions'][-1]
+            number = int((data.get('version') or {}).get('number') or 0)
+            if number != current['number'] + 1:
+                raise FakeError(409, "Version must be incremented on update. Current version is: %s" % current['number'])
+
+            title = data.get('title') or current['title']
+            if title != current['title']:
+                other = self.fake.findTitle(page['space'], title)
+                if other is not None:
+                    raise FakeError(400, "A page with this title already exists: %s" % title)
+
+            if data.get('body'):
+                storage = self._storage(data['body'])
+            else:
+                storage = current['storage']
+
+            if data.get('ancestors'):
+                parent = str(data['ancestors'][-1]['id'])
+                if parent == page['id'] or page['id'] in [ p['id'] for p in self.fake.ancestors(self.fake.page(parent)) ]:
+                    raise FakeError(400, "Cannot move a page below itself")
+                page['parent'] = parent
+
+            page['title'] = title
+            page['versions'].append(dict(number=number, when=self.fake._now(),
+                by='admin', title=title, storage=storage))
+            return 200, self.fake.content_json(page, ['space', 'version', 'body.storage'])
+
+    def deleteContent(self, params, data, id):
+        with self.fake.lock:
+            page = self.fake.page(id)
+            page['status'] = 'trashed'
+        return 204, None
+
+    def getChildren(self, params, data, id):
+        status, result = self.getChildrenOfType(params, data, id, 'page')
+        return 200, dict(page=result, _expandable=dict(attachment='', comment=''))
+
+    def getChildrenOfType(self, params, data, id, type):
+        expand = _expand(params)
+        with self.fake.lock:
+            page = self.fake.page(id)
+            children = [ p for p in self.fake.children(page) if p['type'] == type ]
+            return 200, _paged(children, params, self.fake.max_limit,
+                '/rest/api/content/%s/child/%s' % (id, type),
+                lambda p: self.fake.content_json(p, expand))
+
+    def getLabels(self, params, data, id):
+        with self.fake.lock:
+            return 200, self.fake.labels_json(self.fake.page(id))
+
+    def addLabels(self, params, data, id):
+        if isinstance(data, dict):
+            data = [ data ]
+        with self.fake.lock:
+            page = self.fake.page(id)
+            for label in data:
+                if label['name'] not in page['labels']:
+                    page['labels'].append(label['name'])
+            return 200, self.fake.labels_json(page)
+
+    def deleteLabel(self, params, data, id, name):
+        with self.fake.lock:
+            page = self.fake.page(id)
+            if name in page['labels']:
+                page['labels'].remove(name)
+        return 204, None
+
+    ## spaces and users
+
+    def listSpaces(self, params, data):
+        expand = _expand(params)
+        with self.fake.lock:
+            spaces = [ self.fake.spaces[k] for k in sorted(self.fake.spaces) ]
+            return 200, _paged(spaces, params, self.fake.max_limit, '/rest/api/space',
+                lambda s: self.fake.space_json(s, expand))
+
+    def createSpace(self, params, data):
+        description = ((data.get('description') or {}).get('plain') or {}).get('value', '')
+        with self.fake.lock:
+            space = self.fake.addSpace(data['key'], data.get('name'), description)
+            return 200, self.fake.space_json(space)
+
+    def getSpace(self, params, data, key):
+        with self.fake.lock:
+            if key not in self.fake.spaces:
+                raise FakeError(404, "No space with key : %s" % key)
+            return 200, self.fake.space_json(self.fake.spaces[key], _expand(params))
+
+    def getUser(self, params, data):
+        username = params.get('username')
+        with self.fake.lock:
+            if username not in self.fake.users:
+                raise FakeError(404, "No user found with username %s" % username)
+            return 200, self.fake.users[username]
+
+    def convert(self, params, data):
+        return 200, dict(value=wiki_to_storage(data.get('value', u'')), representation='storage')
+
+    ## comala workflows
+
+    def cwStatus(self, params, data, id):
+        with self.fake.lock:
+            return 200, self.fake.status_json(self.fake.page(id))
+
+    def cwStates(self, params, data, id):
+        with self.fake.lock:
+            return 200, self.fake.states_json(self.fake.page(id))
+
+    def cwApproval(self, params, data, id, action):
+        data = data or {}
+        with self.fake.lock:
+            page = self.fake.page(id)
+            page['approvals'].append(dict(name=data.get('name'), note=data.get('note'),
+                approved=(action == 'approve')))
+            state = 'Approved' if action == 'approve' else 'Rejected'
+            page['states'].append(dict(name=state, contentVersion=page['versions'][-1]['number']))
+            return 200, self.fake.status_json(page)
+
+    def movePage(self, params, data):
+        # a GET changing content, like confluence's page action
+        with self.fake.lock:
+            page = self.fake.page(params['pageId'])
+            parent = self.fake.findTitle(params['spaceKey'], params['targetTitle'])
+            if parent is None:
+                raise FakeError(404, "No parent page %s" % params['targetTitle'])
+            page['parent'] = parent['id']
+            return 200, {}
+
+
+class FakeConfluenceServer(ThreadingMixIn, HTTPServer):
+    """Serves a :class:`FakeConfluence` on localhost.
+
+    :param latency:
+        seconds to wait before answering a request
+    :param jitter:
+        additional random latency up to ``jitter`` seconds
+    :param error_rate:
+        fraction of requests answered with 503
+    :param rate_limit:
+        requests per second, excess requests are answered with 429
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fake=None, port=0, latency=0, jitter=0, error_rate=0, rate_limit=None,
+            host='127.0.0.1', random_seed=None):
+        HTTPServer.__init__(self, (host, port), FakeConfluenceHandler)
+        self.fake = fake if fake is not None else FakeConfluence()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(random_seed)
+        self.lock = threading.Lock()
+        self.allowance = rate_limit or 0
+        self.last = time.time()
+        self.counters = dict(requests=0, errors=0, throttled=0)
+        self.thread = None
+
+    @property
+    def baseurl(self):
+        return 'http://%s:%s' % self.server_address[:2]
+
+    def admit(self):
+        '''return ``(status, result, headers)`` of an injected error or
+        ``(None, None, None)``'''
+        with self.lock:
+            self.counters['requests'] += 1
+
+            throttled = False
+            if self.rate_limit:
+                now = time.time()
+                self.allowance = min(self.rate_limit, self.allowance + (now - self.last) * self.rate_limit)
+                self.last = now
+                if self.allowance < 1:
+                    throttled = True
+                else:
+                    self.allowance -= 1
+
+            failed = not throttled and self.error_rate and self.random.random() < self.error_rate
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+
+            if throttled:
+                self.counters['throttled'] += 1
+            if failed:
+                self.counters['errors'] += 1
+
+        if delay:
+            time.sleep(delay)
+
+        if throttled:
+            return 429, dict(statusCode=429, message="rate limit exceeded"), {'Retry-After': '1'}
+        if failed:
+            return 503, dict(statusCode=503, message="injected error"), {}
+        return None, None, None
+
+    def start(self):
+        '''serve in a background thread, return base URL'''
+        self.thread = threading.Thread(target=self.serve_forever, name='fake-confluence')
+        self.thread.daemon = True
+        self.thread.start()
+        return self.baseurl
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="serve a fake confluence for testing and benchmarks")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--spaces', type=int, default=1, help="number of seeded spaces")
+    parser.add_argument('--pages', type=int, default=1000, help="number of seeded pages per space")
+    parser.add_argument('--fanout', type=int, default=10, help="children per page")
+    parser.add_argument('--latency', type=float, default=0, help="seconds per request")
+    parser.add_argument('--jitter', type=float, default=0, help="random additional seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of requests failing with 503")
+    parser.add_argument('--rate-limit', type=float, help="requests per second before answering 429")
+    parser.add_argument('--max-limit', type=int, default=100, help="maximum page size of results")
+    args = parser.parse_args(argv)
+
+    fake = FakeConfluence(max_limit=args.max_limit)
+    fake.seed(spaces=args.spaces, pages=args.pages, fanout=args.fanout)
+    server = FakeConfluenceServer(fake, port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit=args.rate_limit)
+    print "serving %s pages on %s" % (len(fake.pages), server.baseurl)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
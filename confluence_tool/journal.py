@@ -0,0 +1,98 @@
+"""Journals of bulk operations.
+
+A :class:`Journal` is an append-only file of JSON lines, one for each
+completed step of a bulk operation like ``ct copy``, ``ct edit`` or
+``ct page-prop-set``.  A step records a page id, the version written and a
+hash of the content written.  If an operation dies midway, it can be resumed
+with its journal, skipping all steps recorded there::
+
+    journal = Journal('copy.journal', 'copy', resume=True)
+    api.copyPage('DOC:Handbook', 'COPY:Handbook', journal=journal)
+"""
+
+import os, json, time, threading
+
+import logging
+logger = logging.getLogger('confluence.journal')
+
+
+class JournalError(StandardError):
+    pass
+
+
+class Journal(object):
+    """journal of ``operation`` in file ``path``
+
+    Without ``resume``, ``path`` must not be an existing journal.  With
+    ``resume``, steps of the existing journal are loaded and new steps are
+    appended.
+    """
+
+    def __init__(self, path, operation, resume=False):
+        self.path = path
+        self.operation = operation
+        self.steps = {}
+        self.lock = threading.Lock()
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if resume:
+            if not exists:
+                raise JournalError("journal %s does not exist" % path)
+            self.load()
+        elif exists:
+            raise JournalError("journal %s already exists, use --resume to continue it" % path)
+
+        self.file = open(path, 'a')
+        if not exists:
+            self.write(dict(operation=operation, started=time.time()))
+
+    def load(self):
+        with open(self.path) as f:
+            for n, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line may be incomplete, if the process died while writing it
+                    logger.warning("%s:%s: skipping incomplete entry", self.path, n+1)
+                    continue
+
+                if 'operation' in entry:
+                    if entry['operation'] != self.operation:
+                        raise JournalError("journal %s is a journal of %s, not of %s"
+                            % (self.path, entry['operation'], self.operation))
+                    continue
+
+                self.steps[entry['key']] = entry
+
+        logger.info("resuming %s with %s completed steps of journal %s", self.operation, len(self.steps), self.path)
+
+    def write(self, entry):
+        with self.lock:
+            self.file.write(json.dumps(entry, sort_keys=True) + '\n')
+            self.file.flush()
+
+    def get(self, key):
+        '''return recorded step ``key`` or None'''
+        return self.steps.get(unicode(key))
+
+    def __contains__(self, key):
+        return unicode(key) in self.steps
+
+    def __len__(self):
+        return len(self.steps)
+
+    def record(self, key, id=None, version=None, hash=None, **info):
+        '''record completed step ``key`` (e.g. a source page id)'''
+        entry = dict(info, key=unicode(key), id=id, version=version, hash=hash, time=time.time())
+        self.steps[entry['key']] = entry
+        self.write(entry)
+
+    def done(self, key, version):
+        '''return True, if step ``key`` has written ``version``, which is
+        still the current one
+        '''
+        step = self.get(key)
+        return step is not None and step.get('version') is not None and int(step['version']) == int(version)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,120 @@
+"""Memoization of idempotent GET requests.
+
+Within a run, the same GET request is often sent many times, e.g. resolving
+the same parent page or looking up the same user.  :class:`RequestMemo`
+keeps response bodies for ``memo_ttl`` seconds (default 60, 0 disables
+memoization) and coalesces concurrent identical requests into a single
+request.
+
+Any write request through the API forgets all memoized responses, except
+those of endpoints in :data:`RequestMemo.STABLE`, which are not changed by
+editing content.
+"""
+
+import time, threading
+
+from .util import to_bool
+from .stats import STATS
+
+import logging
+logger = logging.getLogger('confluence.memo')
+
+DEFAULT_TTL = 60
+
+
+class RequestMemo(object):
+
+    STABLE = ('/rest/api/user', '/rest/api/space')
+    MAX_ENTRIES = 1000
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = {}   # key -> (expires, endpoint, body)
+        self.in_flight = {} # key -> threading.Event
+        self.counters = dict(memo_hits=0, memo_misses=0, memo_coalesced=0)
+
+    def call(self, key, fetch, endpoint=''):
+        '''return memoized body for ``key`` or ``fetch()`` it
+
+        ``endpoint`` is the path of the request, used for invalidation.
+        '''
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > self.clock():
+                    self.counters['memo_hits'] += 1
+                    return entry[2]
+
+                event = self.in_flight.get(key)
+                if event is None:
+                    event = self.in_flight[key] = threading.Event()
+                    self.counters['memo_misses'] += 1
+                    break
+
+                self.counters['memo_coalesced'] += 1
+
+            # identical request is in flight, wait for its result
+            event.wait()
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > self.clock():
+                    return entry[2]
+            # request failed, try ourselves
+
+        try:
+            body = fetch()
+            with self.lock:
+                now = self.clock()
+                if len(self.entries) >= self.MAX_ENTRIES:
+                    self._expire(now)
+                self.entries[key] = (now + self.ttl, endpoint, body)
+            return body
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            event.set()
+
+    def _expire(self, now):
+        for key, entry in self.entries.items():
+            if entry[0] <= now:
+                del self.entries[key]
+
+        # still too many, forget oldest
+        if len(self.entries) >= self.MAX_ENTRIES:
+            oldest = sorted(self.entries.items(), key=lambda item: item[1][0])
+            for key, entry in oldest[:len(oldest) // 2]:
+                del self.entries[key]
+
+    def invalidate(self):
+        '''forget memoized responses of endpoints, which may change'''
+        with self.lock:
+            for key, (expires, endpoint, body) in self.entries.items():
+                if not endpoint.startswith(self.STABLE):
+                    del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+_memos = {}
+_memos_lock = threading.Lock()
+
+def get_memo(config):
+    '''return request memo shared by API objects of same configuration or
+    None, if memoization is disabled
+    '''
+    ttl = config.get('memo_ttl')
+    if ttl is None:
+        ttl = DEFAULT_TTL
+    if not to_bool(config.get('memo', True)) or not float(ttl):
+        return None
+
+    key = (config.get('baseurl'), config.get('username'), float(ttl))
+    with _memos_lock:
+        if key not in _memos:
+            _memos[key] = RequestMemo(float(ttl))
+            STATS.register("memo %s (%s)" % key[:2], _memos[key].stats)
+        return _memos[key]
@@ -7,36 +7,138 @@ from lxml.etree import XMLSyntaxError
 import logging
 log = logging.getLogger('confluence-tool.page')
 
-class Page(object):
-    def __init__(self, api, data, expand=None):
-        self.api = api
-        self.data = data
 
-        if 'body' in self.data:
-            body = self.data['body']
+def expand_list(expand):
+    '''return expand as list of expansions'''
+    if not expand:
+        return []
+    if hasattr(expand, 'split'):
+        expand = expand.split(',')
+    return [ e.strip() for e in expand if e.strip() ]
 
-            if 'storage' in body:
-                body = body['storage']
 
-                log.debug("body: %s", body['value'])
-                body['value'] = htmlparser.unescape(body['value'])
-                log.debug("unescaped body: %s", body['value'])
+def merge_data(data, other):
+    '''merge page data ``other`` into ``data``'''
+    for key, value in other.items():
+        if isinstance(value, dict) and isinstance(data.get(key), dict):
+            merge_data(data[key], value)
+        else:
+            data[key] = value
 
-            elif 'view' in body:
-                body = body['view']
-                log.debug("unescaped body")
-                body['value'] = htmlparser.unescape(body['value'])
 
+_expand_sets = {}
+
+def expand_set(expand):
+    '''return expansions as frozenset, shared by pages with the same expand'''
+    key = frozenset(expand_list(expand))
+    return _expand_sets.setdefault(key, key)
 
-        if hasattr(expand, 'split'):
-            self.expand = set([ s.strip() for s in expand.split(',') ])
-        else:
-            self.expand = set(expand)
 
-    def update(self):
-        self.api.getPage(self.data['id'], expand=self.expand)
+class Page(object):
+    """a confluence page (or other content)
+
+    Bodies are unescaped on first access.  With ``compact``, subtrees of page
+    data not needed by confluence-tool (``_links`` and ``extensions``) are
+    dropped.
+    """
+    __slots__ = ('api', 'data', 'expand', '_decoded', '_storage', 'pageProperties', 'pageProperty', 'labels')
+
+    # body representations unescaped on first access
+    REPRESENTATIONS = ('storage', 'view')
+
+    # subtrees dropped from compact pages
+    COMPACT = ('_links', 'extensions')
+
+    def __init__(self, api, data, expand=None, compact=False):
+        self.api = api
+        self.data = data
+        self.expand = expand_set(expand)
+        self._decoded = ()
+        self._storage = None
+
+        if compact:
+            for key in self.COMPACT:
+                data.pop(key, None)
+
+    def _body(self):
+        '''return body with unescaped values'''
+        body = self.data['body']
+        for rep in self.REPRESENTATIONS:
+            if rep in body and rep not in self._decoded:
+                log.debug("unescape body.%s", rep)
+                if rep == 'storage':
+                    # keep storage for parsing it as XML
+                    self._storage = body[rep]['value']
+                body[rep]['value'] = htmlparser.unescape(body[rep]['value'])
+                self._decoded += (rep,)
+        return body
+
+    def has(self, expansion):
+        '''return True, if ``expansion`` (like "body.storage") is present'''
+        if expansion in self.expand:
+            return True
+        data = self.data
+        for key in expansion.split('.'):
+            if not isinstance(data, dict) or key not in data:
+                return False
+            data = data[key]
+        return True
+
+    def missing(self, expand):
+        '''return expansions of ``expand``, which are not present'''
+        return [ e for e in expand_list(expand) if not self.has(e) ]
+
+    def isHistorical(self):
+        return self.data.get('status') == 'historical' and 'version' in self.data
+
+    def update(self, expand=None):
+        """fetch missing expansions and merge them into page data
+
+        Without ``expand``, the page is fetched again with its expansions.
+        For many pages use :meth:`ConfluenceAPI.expandPages`.
+        """
+        if expand is None:
+            expand = self.expand
+        else:
+            expand = self.missing(expand)
+            if not expand:
+                return self
+
+        options = {}
+        if self.isHistorical():
+            options = dict(status='historical', version=self.data['version']['number'])
+
+        log.debug("update page %s: %s", self.data['id'], expand)
+        self.merge(self.api.getPage(self.data['id'], expand=expand_list(expand), **options))
+        return self
+
+    def merge(self, page):
+        '''merge data and expansions of another instance of this page'''
+        if 'storage' in page._decoded:
+            self._storage = page._storage
+        # merged bodies are decoded as they are in ``page``
+        body = page.data.get('body', {})
+        self._decoded = tuple( rep for rep in self._decoded if rep not in body ) + \
+            tuple( rep for rep in page._decoded if rep in body )
+        merge_data(self.data, page.data)
+        self.expand = expand_set(self.expand | page.expand)
+
+    def storage(self):
+        '''return storage format as sent by confluence (not unescaped)'''
+        if 'storage' in self._decoded:
+            return self._storage
+        return self.data['body']['storage']['value']
+
+    # expansions fetched on access of unexpanded fields
+    LAZY = {
+        'body': 'body.storage',
+        'content': 'body.storage',
+    }
 
     def __getattr__(self, name):
+        if name.startswith('_') or name in ('api', 'data', 'expand'):
+            raise AttributeError(name)
+
         if name == 'pageProperties':
             self.pageProperties = [item for item in self.loadPageProperties() ]
             return self.pageProperties
@@ -54,10 +156,11 @@ class Page(object):
             return self['spacekey']
 
         if name == 'content':
+            self.update(self.LAZY[name])
             return self['body']['storage']['value']
 
-        if name in self.data:
-            return self.data[name]
+        if name in self.data or name in self.data.get('_expandable', {}):
+            return self[name]
 
         raise AttributeError(name)
 
@@ -68,9 +171,17 @@ class Page(object):
             return self.labels
 
         if name == 'spacekey':
-            return self.data['_expandable']['space'].split("/")[-1]
-        else:
-            return self.data[name]
+            if 'space' in self.data.get('_expandable', {}):
+                return self.data['_expandable']['space'].split("/")[-1]
+            return self['space']['key']
+
+        if name not in self.data and name in self.data.get('_expandable', {}):
+            self.update(self.LAZY.get(name, name))
+
+        if name == 'body':
+            return self._body()
+
+        return self.data[name]
 
         raise KeyError(name)
 
@@ -83,6 +194,8 @@ class Page(object):
     def dict(self, *keys):
         '''compose new dictionary from given keys'''
         if not len(keys):
+            if 'body' in self.data:
+                self._body()
             return self.data
 
         result = {}
@@ -103,10 +216,30 @@ class Page(object):
                 yield (k,v)
 
     def loadPageProperties(self, need_html=False, need_data=False, properties=None, **opts):
-        from .page_properties import get_page_properties
-        if 'body.view' not in self.expand:
-            self.expand.add('body.view')
-            self.update()
-        html = self.data['body']['view']['value']
+        """return page properties of body.view, if present, else of
+        body.storage, which does not need a rendered page
+        """
+        from .page_properties import get_page_properties, get_storage_page_properties
+
+        if not self.has('body.view'):
+            if not self.has('body.storage'):
+                self.update('body.storage')
+
+            try:
+                return list(get_storage_page_properties(self.storage(),
+                    need_html=need_html, need_data=need_data, properties=properties,
+                    spacekey=self._spacekey(), username=self.api.getUsername))
+            except XMLSyntaxError as e:
+                log.warning("cannot parse storage of page %s, using body.view: %s", self.data.get('id'), e)
+                self.update('body.view')
+
+        html = self['body']['view']['value']
         return get_page_properties(html, need_html=need_html, need_data=need_data, properties=properties)
-        #self.data['pageProperties'] = dict(get_page_properties(self.data['body']['view']['value']))
+
+    def _spacekey(self):
+        if 'key' in self.data.get('space', {}):
+            return self.data['space']['key']
+        try:
+            return self['spacekey']
+        except KeyError:
+            return None
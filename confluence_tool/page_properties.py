@@ -1,12 +1,18 @@
 import logging, urllib
+from htmlentitydefs import name2codepoint
 logger = logging.getLogger("confluence.page.props")
 
 from os.path import dirname
 #logger.setLevel(logging.DEBUG)
 
 from .storage_editor import edit
+from .myquery import MyQuery
+from .stats import STATS
 
 from pyquery import PyQuery
+from lxml import etree
+import lxml.html
+from copy import deepcopy
 from pystache import Renderer
 from pprint import pprint
 from datetime import datetime, date
@@ -15,101 +21,348 @@ import re
 
 DISPLAY_URL = re.compile(r'/display/([\w-]*)/(.*)')
 
-def extract_data(elem, need_data=False):
-    """Extracts data from confluence html page properties value <td>.
+# header cells of page properties tables in view format
+PROPERTY_HEADERS = etree.XPath(
+    "//div[@data-macro-name='details']"
+    "/div[contains(concat(' ', normalize-space(@class), ' '), ' table-wrap ')]"
+    "/table/tbody/tr/th")
+
+AC = 'http://www.atlassian.com/schema/confluence/4/ac'
+RI = 'http://www.atlassian.com/schema/confluence/4/ri'
+
+# header cells of page properties tables in storage format
+STORAGE_PROPERTY_HEADERS = etree.XPath(
+    "//ac:structured-macro[@ac:name='details']/ac:rich-text-body/table/tbody/tr/th",
+    namespaces=dict(ac=AC, ri=RI))
+
+STORAGE_ROOT = u'<root xmlns:ac="%s" xmlns:ri="%s">%%s</root>' % (AC, RI)
+
+# html entities, which are not defined in XML
+HTML_ENTITY = re.compile(r'&(?!(?:amp|lt|gt|quot|apos);)(\w+);')
+# ampersands left over by unescaping storage, see Page
+BARE_AMPERSAND = re.compile(r'&(?!#?\w+;)')
+
+try:
+    from pyquery.text import extract_text
+except ImportError:
+    # older pyquery
+    def extract_text(element):
+        return PyQuery(element).text()
+
+
+def _has_class(element, name):
+    return name in (element.get('class') or '').split()
+
+def _set_text(element, text):
+    for child in element:
+        element.remove(child)
+    element.text = text
+
+def _inner_html(element):
+    if element is None:
+        return None
+    if not len(element):
+        return element.text
+    return (element.text or u'') + u''.join(etree.tostring(e, encoding=unicode) for e in element)
+
+def _in_table(element, container):
+    for parent in element.iterancestors():
+        if parent is container:
+            return False
+        if parent.tag == 'table':
+            return True
+    return False
+
+def _first_child(element):
+    for child in element:
+        return child
+    return None
+
+def _is_list(element):
+    # ul or a content wrapper around it
+    if element.tag == 'ul':
+        return True
+    return element.tag == 'div' and _has_class(element, 'content-wrapper') \
+        and any(e.tag == 'ul' for e in element)
+
+def _remove(element):
+    # like PyQuery.remove(), keeps the tail
+    parent = element.getparent()
+    if element.tail:
+        prev = element.getprevious()
+        if prev is None:
+            parent.text = (parent.text or u'') + u' ' + element.tail
+        else:
+            prev.tail = (prev.tail or u'') + u' ' + element.tail
+    parent.remove(element)
 
-    Returns either a simple value in wiki represention or a complex data type
-    with extraction of all containing data.
-    """
-    data = {}
-    data['users'] = users = []
-    data['refs']  = refs  = []
-    data['links'] = links = []
-    data['dates'] = dates = []
-    data['mailAddresses'] = mailAddresses = []
+
+def _extract(elem, need_data, to_wiki):
+    # list, table or wiki text of a value cell, ``to_wiki(d, data)`` rewrites
+    # a copy of the cell for text values and collects users, refs, ...
+    data = dict(users=[], refs=[], links=[], dates=[], mailAddresses=[])
+    html = None
+
+    first = _first_child(elem) if elem is not None else None
 
     # if is list
-    if elem.children().eq(0).is_('div.content-wrapper > ul, ul'):
-        value = [ extract_data(PyQuery(e)) for e in elem.find('li') ]
+    if first is not None and _is_list(first):
+        value = [ _extract(e, False, to_wiki) for e in elem.iterdescendants('li') ]
         logger.debug("list value: %s", value)
 
     # if is dictionary-like table
-    elif elem.children().eq(0).is_('div.table-wrapper, table'):
+    elif first is not None and (first.tag == 'table' or first.tag == 'div'
+            and (_has_class(first, 'table-wrap') or _has_class(first, 'table-wrapper'))):
         value = {}
-        for e in elem.find('table th'):
-            if e.next_all().not_('td'):
+        for th in elem.iterdescendants('th'):
+            if not _in_table(th, elem):
                 continue
+            siblings = list(th.itersiblings())
+            if not siblings or any(e.tag != 'td' for e in siblings):
+                continue
+            value[extract_text(th).strip()] = _extract(siblings[0], False, to_wiki)
 
-            value[e.text().strip()] = extract_data(e.next_all())
+    elif elem is None:
+        value = u''
 
     else:
-        # transform usernames, refs and external links to wiki code
-        d = PyQuery("<div>"+elem.html()+"</div>")
-
-        for a in d('a'):
-            _a = d(a)
-            if _a.hasClass('confluence-userlink'):
-                username = _a.attr('data-username')
-                users.append(dict(username=username))
-                _a.html("[~%s]" % username)
-
-            elif _a.attr('href').startswith('mailto:'):
-                address = _a.attr('href')[7:]
-                mailAddresses.append(address)
-                _a.html(address)
-
-            elif _a.hasClass('external-link'):
-                href = _a.attr('href')
-                caption = _a.text()
-                if caption != href:
-                    _a.html("[%s|%s]" % (caption, href))
-                    links.append(dict(caption=caption, href=href))
-                else:
-                    _a.html("[%s]" % href)
-                    links.append(dict(href=href))
-            else:
-                #print _a.attr('href')
-                m = DISPLAY_URL.search(_a.attr('href'))
-                if m:
-                    (space, title) = m.groups()
-                    title = urllib.unquote(title).decode('utf8').replace(u"+", u" ")
-                    _a.html("[{}:{}]".format(space, title))
-                    refs.append(dict(space=space, title=title))
-
-        for t in d('time'):
-            _t = d(t)
-            _time = _t.attr('datetime')
-            dates.append(_time)
-            _t.html(_time)
-
-        value = d(':root').text().strip()
+        # transform usernames, refs and external links to wiki code on a copy
+        d = deepcopy(elem)
+        d.tail = None
+        to_wiki(d, data)
+
+        value = extract_text(d).strip()
+        html = _inner_html(d)
 
         logger.info("value: %s", value)
+
     if need_data:
         return dict(
-            value=value, html=d.show(), users=users,
-            refs=refs, links=links, mailAddresses=mailAddresses,
+            value=value, html=html, users=data['users'],
+            refs=data['refs'], links=data['links'], mailAddresses=data['mailAddresses'],
         )
     else:
         return value
 
 
+def _view_to_wiki(d, data):
+    for a in list(d.iter('a')):
+        href = a.get('href') or ''
+        if _has_class(a, 'confluence-userlink'):
+            username = a.get('data-username')
+            data['users'].append(dict(username=username))
+            _set_text(a, u"[~%s]" % username)
+
+        elif href.startswith('mailto:'):
+            address = href[7:]
+            data['mailAddresses'].append(address)
+            _set_text(a, address)
+
+        elif _has_class(a, 'external-link'):
+            _link_to_wiki(a, href, data)
+
+        else:
+            m = DISPLAY_URL.search(href)
+            if m:
+                (space, title) = m.groups()
+                title = urllib.unquote(title.encode('utf-8')).decode('utf8').replace(u"+", u" ")
+                _set_text(a, u"[{}:{}]".format(space, title))
+                data['refs'].append(dict(space=space, title=title))
+
+    for t in list(d.iter('time')):
+        _time = t.get('datetime')
+        data['dates'].append(_time)
+        _set_text(t, _time)
+
+
+def _link_to_wiki(a, href, data):
+    caption = extract_text(a)
+    if caption != href:
+        _set_text(a, u"[%s|%s]" % (caption, href))
+        data['links'].append(dict(caption=caption, href=href))
+    else:
+        _set_text(a, u"[%s]" % href)
+        data['links'].append(dict(href=href))
+
+
+def extract_data(elem, need_data=False):
+    """Extracts data from confluence html page properties value <td>.
+
+    Returns either a simple value in wiki represention or a complex data type
+    with extraction of all containing data.
+
+    ``elem`` is an lxml element or a PyQuery object of it.
+    """
+    if isinstance(elem, PyQuery):
+        elem = elem[0] if len(elem) else None
+
+    return _extract(elem, need_data, _view_to_wiki)
+
+
+@STATS.timed('parse')
 def get_page_properties(html, need_html=False, need_data=False, properties=None, **kwargs):
-    d = PyQuery(html)
-    d('script').remove()
-    th = d("div[data-macro-name=details] > div.table-wrap > table > tbody > tr > th")
-    for elem in th:
-        _th = PyQuery(elem)
-        key = _th.text().strip()
+    """yield ``(key, value)`` of page properties in view format ``html``
+
+    The document is parsed once, values are extracted from the lxml tree.
+    """
+    root = lxml.html.fragment_fromstring(html or u'', create_parent='div')
+    for script in list(root.iter('script')):
+        _remove(script)
+
+    for th in PROPERTY_HEADERS(root):
+        key = extract_text(th).strip()
+
+        if properties is not None:
+            if key not in properties:
+                continue
+
+        td = th.getnext()
+        if not need_data and need_html:
+            yield (key, _inner_html(td))
+        else:
+            yield (key, extract_data(td, need_data=False))
+
+
+def _ac(name):
+    return '{%s}%s' % (AC, name)
+
+def _ri(name):
+    return '{%s}%s' % (RI, name)
+
+def _replace(element, text):
+    # replace element by text, ac and ri elements would be block elements
+    # for extract_text
+    text = text + (element.tail or u'')
+    parent = element.getparent()
+    prev = element.getprevious()
+    if prev is None:
+        parent.text = (parent.text or u'') + text
+    else:
+        prev.tail = (prev.tail or u'') + text
+    parent.remove(element)
+
+def _storage_to_wiki(d, data, spacekey=None, username=None):
+    for link in list(d.iter(_ac('link'))):
+        user = link.find(_ri('user'))
+        page = link.find(_ri('page'))
+        if user is not None:
+            name = user.get(_ri('username'))
+            if name is None:
+                name = user.get(_ri('userkey'))
+                if username is not None:
+                    name = username(name)
+            data['users'].append(dict(username=name))
+            _replace(link, u"[~%s]" % name)
+
+        elif page is not None:
+            space = page.get(_ri('space-key')) or spacekey
+            title = page.get(_ri('content-title'))
+            data['refs'].append(dict(space=space, title=title))
+            _replace(link, u"[{}:{}]".format(space, title))
+
+        else:
+            # attachments, anchors, ...: keep the caption
+            body = link.find(_ac('plain-text-link-body'))
+            if body is None:
+                body = link.find(_ac('link-body'))
+            _replace(link, extract_text(body) if body is not None else u'')
+
+    for a in list(d.iter('a')):
+        href = a.get('href') or ''
+        if href.startswith('mailto:'):
+            address = href[7:]
+            data['mailAddresses'].append(address)
+            _set_text(a, address)
+
+        elif '://' in href:
+            _link_to_wiki(a, href, data)
+
+        else:
+            m = DISPLAY_URL.search(href)
+            if m:
+                (space, title) = m.groups()
+                title = urllib.unquote(title.encode('utf-8')).decode('utf8').replace(u"+", u" ")
+                _set_text(a, u"[{}:{}]".format(space, title))
+                data['refs'].append(dict(space=space, title=title))
+
+    for t in list(d.iter('time')):
+        _time = t.get('datetime')
+        data['dates'].append(_time)
+        _set_text(t, _time)
+
+    # status macros are rendered as their title, of other macros only the
+    # body is visible
+    for macro in list(d.iter(_ac('structured-macro'))):
+        if macro.get(_ac('name')) == 'status':
+            title = macro.find("%s[@%s='title']" % (_ac('parameter'), _ac('name')))
+            _replace(macro, (title.text or u'') if title is not None else u'')
+
+    for e in list(d.iter(_ac('parameter'), _ac('placeholder'), _ac('image'), _ac('emoticon'))):
+        _replace(e, u'')
+
+
+def _storage_html(element):
+    html = _inner_html(element)
+    if html is None:
+        return None
+    return u''.join(MyQuery.XMLNS.sub(u'', part) if part.startswith(u'<') else part
+        for part in MyQuery.HTML_TAG.split(html))
+
+
+def parse_storage(storage):
+    """return root element of storage format ``storage``
+
+    HTML entities are resolved, because they are not defined in XML, bare
+    ampersands are escaped.
+    """
+    if isinstance(storage, str):
+        storage = storage.decode('utf-8')
+
+    def entity(m):
+        if m.group(1) in name2codepoint:
+            return unichr(name2codepoint[m.group(1)])
+        return m.group(0)
+
+    storage = BARE_AMPERSAND.sub(u'&amp;', HTML_ENTITY.sub(entity, storage or u''))
+    return etree.fromstring(STORAGE_ROOT % storage)
+
+
+def extract_storage_data(elem, need_data=False, spacekey=None, username=None):
+    """Extracts data from a page properties value <td> in storage format.
+
+    Values are the same as of :func:`extract_data` for view format.  Page
+    references without space key refer to ``spacekey``.  ``username`` is
+    called to resolve userkeys of users not referred by username.
+    """
+    def to_wiki(d, data):
+        _storage_to_wiki(d, data, spacekey=spacekey, username=username)
+
+    return _extract(elem, need_data, to_wiki)
+
+
+@STATS.timed('parse')
+def get_storage_page_properties(storage, need_html=False, need_data=False, properties=None,
+        spacekey=None, username=None, **kwargs):
+    """yield ``(key, value)`` of page properties in storage format ``storage``
+
+    Unlike :func:`get_page_properties` this does not need the rendered
+    ``body.view`` of a page.  With ``need_html``, values are the storage
+    format of the cells.
+    """
+    root = parse_storage(storage)
+
+    for th in STORAGE_PROPERTY_HEADERS(root):
+        key = extract_text(th).strip()
 
         if properties is not None:
             if key not in properties:
                 continue
 
+        td = th.getnext()
         if not need_data and need_html:
-            yield (key, _th.next().html())
+            yield (key, _storage_html(td))
         else:
-            yield (key, extract_data(_th.next(), need_data=False))
+            yield (key, extract_storage_data(td, spacekey=spacekey, username=username))
 
 
 class PagePropertiesEditor:
@@ -239,6 +492,7 @@ class PagePropertiesEditor:
         return self.get_storage(key, data, action.get('templates', {}))
 
 
+    @STATS.timed('parse', 'PagePropertiesEditor.edit')
     def edit(self, page=None):
         updated_keys = []
         if page is not None:
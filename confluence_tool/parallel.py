@@ -0,0 +1,224 @@
+"""Bounded thread pools for overlapping requests.
+
+Requests to confluence are I/O bound, so threads are good enough for letting
+many of them overlap.  All helpers here keep memory bounded and stop feeding
+work into the pool, if the consumer stops early.
+"""
+
+import sys, time, threading
+from collections import deque
+from Queue import Queue, Empty, Full
+
+import logging
+logger = logging.getLogger('confluence.parallel')
+
+DEFAULT_WORKERS = 8
+
+
+class Future(object):
+    """Result of a function call submitted to an :class:`Executor`."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._lock = threading.Lock()
+        self._state = 'pending'
+
+    def _start(self):
+        with self._lock:
+            if self._state != 'pending':
+                return False
+            self._state = 'running'
+            return True
+
+    def cancel(self):
+        '''cancel the call, if it did not start yet'''
+        with self._lock:
+            if self._state == 'pending':
+                self._state = 'cancelled'
+                self._event.set()
+            return self._state == 'cancelled'
+
+    def cancelled(self):
+        return self._state == 'cancelled'
+
+    def done(self):
+        return self._event.is_set()
+
+    def set_result(self, result):
+        self._result = result
+        self._state = 'done'
+        self._event.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._state = 'done'
+        self._event.set()
+
+    def result(self, timeout=None):
+        # wait in slices, so that KeyboardInterrupt is not blocked
+        while not self._event.wait(timeout or 0.5):
+            if timeout:
+                break
+        if not self._event.is_set():
+            raise RuntimeError("timeout waiting for result")
+        if self._state == 'cancelled':
+            raise RuntimeError("call has been cancelled")
+        if self._exc_info is not None:
+            exc_type, exc, tb = self._exc_info
+            raise exc_type, exc, tb
+        return self._result
+
+
+class Executor(object):
+    """Pool of daemon worker threads, started on first use."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, name='confluence'):
+        self.workers = workers
+        self.name = name
+        self.queue = Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def _start_workers(self):
+        with self.lock:
+            while len(self.threads) < self.workers:
+                t = threading.Thread(target=self._work,
+                    name="%s-%s" % (self.name, len(self.threads)))
+                t.daemon = True
+                t.start()
+                self.threads.append(t)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            future, func, args, kwargs = item
+            if not future._start():
+                continue
+
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException:
+                future.set_exception(sys.exc_info())
+
+    def submit(self, func, *args, **kwargs):
+        '''call ``func(*args, **kwargs)`` in a worker, return a Future'''
+        if len(self.threads) < self.workers:
+            self._start_workers()
+
+        future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def shutdown(self, wait=None):
+        '''let the workers exit after running already submitted calls
+
+        If ``wait`` is given, wait up to ``wait`` seconds for the workers to
+        exit, so that idle daemon threads are not torn down at interpreter
+        exit.
+        '''
+        with self.lock:
+            threads, self.threads = self.threads, []
+            for t in threads:
+                self.queue.put(None)
+
+        if wait:
+            deadline = time.time() + wait
+            for t in threads:
+                t.join(max(0, deadline - time.time()))
+
+
+def pmap(func, iterable, workers=DEFAULT_WORKERS, executor=None):
+    '''like :func:`itertools.imap`, but calls ``func`` concurrently
+
+    Results are yielded in order of ``iterable``.  At most ``2 * workers``
+    calls are pending at a time.  If the generator is closed, pending calls
+    are cancelled.
+    '''
+    own = executor is None
+    if own:
+        executor = Executor(workers, name='pmap')
+
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    finally:
+        for future in pending:
+            future.cancel()
+        if own:
+            executor.shutdown()
+
+
+_DONE = object()
+
+def pchain(iterables, workers=DEFAULT_WORKERS, buffer=100):
+    '''like :func:`itertools.chain`, but consumes ``iterables`` concurrently
+
+    Each iterable is consumed in its own worker thread, at most ``workers`` at
+    a time.  Items are yielded in the order they arrive.  At most ``buffer``
+    items are held in memory.  If the generator is closed, the producers stop
+    after their current item.
+    '''
+    queue = Queue(buffer)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce(iterable):
+        try:
+            for item in iterable:
+                if not put((None, item)):
+                    return
+        except BaseException:
+            put((sys.exc_info(), None))
+        finally:
+            put((None, _DONE))
+
+    executor = Executor(workers, name='pchain')
+    running = 0
+    for iterable in iterables:
+        executor.submit(produce, iterable)
+        running += 1
+
+    try:
+        while running:
+            try:
+                exc_info, item = queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if exc_info is not None:
+                exc_type, exc, tb = exc_info
+                raise exc_type, exc, tb
+            if item is _DONE:
+                running -= 1
+                continue
+            yield item
+
+    finally:
+        stop.set()
+        executor.shutdown(wait=1)
+
+
+def prefetch(iterable, buffer=100):
+    '''consume ``iterable`` in a background thread, keeping up to ``buffer``
+    items ahead of the consumer
+    '''
+    return pchain([iterable], workers=1, buffer=buffer)
@@ -0,0 +1,176 @@
+"""Latency and throughput instrumentation.
+
+:data:`STATS` collects counts, bytes and latency histograms of HTTP requests
+(grouped by endpoint template like ``/rest/api/content/{id}``), JSON
+decoding, parsing and rendering.  Components having own counters (transport,
+caches) register them with :meth:`Stats.register`.  ``ct --stats`` prints a
+summary at exit.
+"""
+
+import re, sys, time, json, threading, types
+from functools import wraps
+from contextlib import contextmanager
+
+# upper bounds of latency buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class Metric(object):
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds, bytes=0):
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += bytes
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        '''return upper bound of bucket containing percentile ``p``'''
+        rank = self.count * p / 100.0
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def dict(self):
+        return dict(
+            count   = self.count,
+            seconds = round(self.seconds, 6),
+            bytes   = self.bytes,
+            mean_ms = round(self.seconds * 1000 / self.count, 3) if self.count else 0,
+            p50_ms  = round(self.percentile(50) * 1000, 3),
+            p95_ms  = round(self.percentile(95) * 1000, 3),
+            max_ms  = round(self.max * 1000, 3),
+            histogram = dict( (str(b), n) for (b, n) in zip(BUCKETS, self.buckets) if n ),
+        )
+
+
+NUMERIC = re.compile(r'^\d{3,}$')
+NAMED = ('space', 'label', 'key')
+
+def endpoint_template(path):
+    '''replace ids and keys in ``path`` by placeholders
+
+    >>> endpoint_template('/rest/api/content/12345/child/page')
+    '/rest/api/content/{id}/child/page'
+    '''
+    path = path.split('?', 1)[0]
+    parts = path.split('/')
+    for i, part in enumerate(parts):
+        if NUMERIC.match(part):
+            parts[i] = '{id}'
+        elif i and parts[i-1] in NAMED and part:
+            parts[i] = '{%s}' % parts[i-1]
+    return '/'.join(parts)
+
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.providers = {}
+        self.started = time.time()
+
+    def record(self, category, name, seconds, bytes=0):
+        with self.lock:
+            key = (category, name)
+            if key not in self.metrics:
+                self.metrics[key] = Metric()
+            self.metrics[key].add(seconds, bytes)
+
+    @contextmanager
+    def timer(self, category, name):
+        '''time a block, the yielded dictionary may get ``bytes``'''
+        info = dict(bytes=0)
+        start = time.time()
+        try:
+            yield info
+        finally:
+            self.record(category, name, time.time() - start, info['bytes'])
+
+    def _timed_generator(self, category, name, generator):
+        seconds = 0.0
+        try:
+            while True:
+                start = time.time()
+                try:
+                    item = next(generator)
+                finally:
+                    seconds += time.time() - start
+                yield item
+        except StopIteration:
+            pass
+        finally:
+            self.record(category, name, seconds)
+
+    def timed(self, category, name=None):
+        '''decorator timing calls of a function
+
+        For generator functions, time spent producing items is recorded.
+        '''
+        def decorator(func):
+            _name = name or func.__name__
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.time()
+                result = func(*args, **kwargs)
+                if isinstance(result, types.GeneratorType):
+                    return self._timed_generator(category, _name, result)
+                self.record(category, _name, time.time() - start)
+                return result
+            return wrapper
+        return decorator
+
+    def register(self, name, provider):
+        '''register a callable returning a dictionary of counters'''
+        with self.lock:
+            self.providers[name] = provider
+
+    def dict(self):
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+            providers = sorted(self.providers.items())
+
+        return dict(
+            elapsed  = round(time.time() - self.started, 3),
+            metrics  = [ dict(category=c, name=n, **m.dict()) for ((c, n), m) in metrics ],
+            counters = dict( (name, provider()) for (name, provider) in providers ),
+        )
+
+    def report(self, format='table', stream=None):
+        if stream is None:
+            stream = sys.stderr
+
+        data = self.dict()
+        if format == 'json':
+            json.dump(data, stream, indent=2, sort_keys=True)
+            stream.write("\n")
+            return
+
+        width = max([ len(m['name']) for m in data['metrics'] ] + [4])
+        row = u"%-8s  %-" + str(width) + "s  %6s  %9s  %9s  %9s  %9s  %10s\n"
+        stream.write(row % ('category', 'name', 'count', 'total_s', 'mean_ms', 'p50_ms', 'p95_ms', 'bytes'))
+        for m in data['metrics']:
+            stream.write(row % (m['category'], m['name'], m['count'], "%.3f" % m['seconds'],
+                m['mean_ms'], m['p50_ms'], m['p95_ms'], m['bytes']))
+
+        for name, counters in sorted(data['counters'].items()):
+            stream.write(u"\n%s:\n" % name)
+            for k, v in sorted(counters.items()):
+                stream.write(u"  %s: %s\n" % (k, v))
+
+        stream.write(u"\nelapsed: %.3fs\n" % data['elapsed'])
+
+
+STATS = Stats()
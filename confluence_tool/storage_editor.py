@@ -4,6 +4,7 @@ from os.path import dirname
 from .myquery import MyQuery
 from .util import get_list_data
 from .page import Page
+from .stats import STATS
 from lxml import etree
 
 from lxml.etree import XMLSyntaxError
@@ -25,6 +26,7 @@ class StorageEditor:
             )
 
 
+    @STATS.timed('parse', 'StorageEditor.edit')
     def edit(self, content):
         if isinstance(content, Page):
             page = content
@@ -0,0 +1,112 @@
+"""Client side rate limiting and retries.
+
+:class:`TokenBucket` limits the request rate, :class:`RetryPolicy` decides if
+and how long to wait before a failed request is sent again.  Both are used by
+:class:`~confluence_tool.transport.Transport`.
+"""
+
+import time, random, threading
+from email.utils import parsedate_tz, mktime_tz
+
+import logging
+logger = logging.getLogger('confluence.throttle')
+
+
+class TokenBucket(object):
+    """Token bucket allowing ``rate`` requests per second on average and
+    bursts of up to ``burst`` requests.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        '''take a token and return the seconds to wait until it is valid'''
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        '''wait for a token, return the seconds waited'''
+        wait = self._reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+def parse_retry_after(value, now=None):
+    '''return seconds from a Retry-After header value (seconds or HTTP date)'''
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+
+    if now is None:
+        now = time.time()
+    return max(mktime_tz(date) - now, 0.0)
+
+
+class RetryPolicy(object):
+    """Decide about retrying a request.
+
+    Responses with status 429 are retried for all methods, because the server
+    did not process the request.  Other temporary errors (502, 503, 504 and
+    connection errors) are only retried for idempotent methods.  A
+    Retry-After header is honored, else exponential backoff with full jitter
+    is used.
+    """
+
+    THROTTLED = (429,)
+    TEMPORARY = (502, 503, 504)
+    IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=60.0, jitter=True):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def retryable(self, method, status=None):
+        if status in self.THROTTLED:
+            return True
+        if method.upper() not in self.IDEMPOTENT:
+            return False
+        return status is None or status in self.TEMPORARY
+
+    def backoff_delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def delay(self, method, attempt, status=None, retry_after=None):
+        '''return seconds to wait before retry number ``attempt`` (starting
+        with 0) or None, if request shall not be retried.
+        '''
+        if attempt >= self.max_retries:
+            return None
+        if not self.retryable(method, status):
+            return None
+
+        retry_after = parse_retry_after(retry_after)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+
+        return self.backoff_delay(attempt)
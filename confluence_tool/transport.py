@@ -0,0 +1,249 @@
+"""HTTP transport for :class:`~confluence_tool.confluence_api.ConfluenceAPI`.
+
+A transport owns a :class:`requests.Session` with a pooled HTTP adapter.  It is
+created once per configuration and then shared by all API objects of the
+process, so authentication is resolved only once and keep-alive connections
+are reused across requests (also across failed ones).
+
+The transport also limits the request rate and the number of requests in
+flight and retries throttled or temporarily failed requests (see
+:mod:`~confluence_tool.throttle`).
+"""
+
+import time, threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .util import to_bool
+from .throttle import TokenBucket, RetryPolicy
+from .stats import STATS
+
+import logging
+logger = logging.getLogger('confluence.transport')
+
+DEFAULT_POOL_SIZE = 10
+
+# configuration keys, which define a transport
+TRANSPORT_SETTINGS = (
+    'baseurl', 'username', 'password', 'pool_size', 'keep_alive',
+    'rate_limit', 'burst', 'max_in_flight', 'max_retries', 'backoff',
+    'max_backoff',
+)
+
+
+class CountingPoolMixin(object):
+    """Counts connections handed out by a connection pool.
+
+    A hit is a connection, which is handed out with an open socket, a miss is
+    a connection which has to be (re)connected before sending the request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CountingPoolMixin, self).__init__(*args, **kwargs)
+        self.counter_lock = threading.Lock()
+        self.pool_hits = 0
+        self.pool_misses = 0
+
+    def _get_conn(self, timeout=None):
+        conn = super(CountingPoolMixin, self)._get_conn(timeout=timeout)
+        with self.counter_lock:
+            if getattr(conn, 'sock', None) is not None:
+                self.pool_hits += 1
+            else:
+                self.pool_misses += 1
+        return conn
+
+class CountingHTTPConnectionPool(CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+class CountingHTTPSConnectionPool(CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super(CountingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http':  CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class Transport(object):
+    def __init__(self, auth=None, pool_size=DEFAULT_POOL_SIZE, keep_alive=True,
+            rate_limit=None, burst=None, max_in_flight=None, retry=None,
+            sleep=time.sleep):
+        self.auth = auth
+        self.pool_size = pool_size
+        self.sleep = sleep
+
+        self.bucket = None
+        if rate_limit:
+            self.bucket = TokenBucket(rate_limit, burst, sleep=sleep)
+
+        self.in_flight = None
+        if max_in_flight:
+            self.in_flight = threading.BoundedSemaphore(max_in_flight)
+
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry
+
+        self.counter_lock = threading.Lock()
+        self.counters = dict(retries=0, retry_wait=0.0, throttle_wait=0.0, in_flight_wait=0.0)
+
+        self.adapter = CountingHTTPAdapter(
+            pool_connections = 1,
+            pool_maxsize     = pool_size,
+            max_retries      = 0,
+        )
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def _count(self, **counters):
+        with self.counter_lock:
+            for k,v in counters.items():
+                self.counters[k] += v
+
+    def _send(self, method, url, **kwargs):
+        if self.in_flight is None:
+            return self._send_throttled(method, url, **kwargs)
+
+        start = time.time()
+        with self.in_flight:
+            self._count(in_flight_wait=time.time() - start)
+            return self._send_throttled(method, url, **kwargs)
+
+    def _send_throttled(self, method, url, **kwargs):
+        if self.bucket is not None:
+            self._count(throttle_wait=self.bucket.acquire())
+        return self.session.request(method, url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = self._send(method, url, **kwargs)
+
+            except requests.ConnectionError as e:
+                delay = self.retry.delay(method, attempt)
+                if delay is None:
+                    raise
+                reason = e.__class__.__name__
+
+            else:
+                delay = self.retry.delay(method, attempt,
+                    status = response.status_code,
+                    retry_after = response.headers.get('Retry-After'))
+                if delay is None:
+                    return response
+                reason = response.status_code
+                response.close()
+
+            logger.info("retry %s %s in %.2fs (attempt %s, %s)", method, url, delay, attempt+1, reason)
+            self._count(retries=1, retry_wait=delay)
+            self.sleep(delay)
+            attempt += 1
+
+    def _pools(self):
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                yield pool
+
+    def stats(self):
+        '''return connection pool and throttling counters
+
+        ``pool_hits`` counts requests sent over an already open connection,
+        ``pool_misses`` requests, which needed to open a connection.
+        ``retries`` counts repeated requests, ``retry_wait``,
+        ``throttle_wait`` and ``in_flight_wait`` are the seconds spent waiting
+        for a retry, the rate limiter and a free request slot.
+        '''
+        hits = 0
+        misses = 0
+        for pool in self._pools():
+            hits += getattr(pool, 'pool_hits', 0)
+            misses += getattr(pool, 'pool_misses', 0)
+
+        result = dict(
+            requests    = hits + misses,
+            pool_hits   = hits,
+            pool_misses = misses,
+            pool_size   = self.pool_size,
+        )
+        with self.counter_lock:
+            result.update(self.counters)
+        return result
+
+    def close(self):
+        self.session.close()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+def get_transport(config, getauth):
+    '''return the process wide transport for given configuration
+
+    Transports are shared between configurations with same values for
+    :data:`TRANSPORT_SETTINGS`.
+
+    :param config:
+        configuration dictionary as passed to ConfluenceAPI.  Beside
+        connection settings it may contain:
+
+        * ``pool_size`` - maximum number of pooled connections (default 10)
+        * ``keep_alive`` - keep connections open (default true)
+        * ``rate_limit`` - maximum requests per second (default unlimited)
+        * ``burst`` - number of requests allowed in a burst (default
+          ``rate_limit``)
+        * ``max_in_flight`` - maximum concurrent requests (default unlimited)
+        * ``max_retries`` - maximum retries of a request (default 5)
+        * ``backoff`` - base of exponential backoff in seconds (default 0.5)
+        * ``max_backoff`` - maximum seconds to wait for a retry (default 60)
+    :param getauth:
+        callable returning the ``(user, password)`` tuple.  It is only called,
+        if there is no transport yet.
+    '''
+    key = tuple(config.get(k) for k in TRANSPORT_SETTINGS)
+
+    def number(name, default=None, type=float):
+        value = config.get(name)
+        if value is None or value == '':
+            return default
+        return type(value)
+
+    with _transports_lock:
+        if key not in _transports:
+            _transports[key] = Transport(
+                auth          = getauth(),
+                pool_size     = number('pool_size', DEFAULT_POOL_SIZE, int),
+                keep_alive    = to_bool(config.get('keep_alive', True)),
+                rate_limit    = number('rate_limit'),
+                burst         = number('burst'),
+                max_in_flight = number('max_in_flight', type=int),
+                retry         = RetryPolicy(
+                    max_retries = number('max_retries', 5, int),
+                    backoff     = number('backoff', 0.5),
+                    max_backoff = number('max_backoff', 60.0),
+                ),
+            )
+            STATS.register("transport %s (%s)" % (key[0], key[1]), _transports[key].stats)
+            logger.debug("new transport for %s (user %s)", key[0], key[1])
+
+        return _transports[key]
+
+def close_transports():
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
@@ -0,0 +1,304 @@
+"""Copying page trees.
+
+:class:`TreeCopy` finds all descendants of a source page with one (paginated)
+``ancestor = ...`` query and creates or updates target pages level by level.
+Pages of a level are written concurrently, a level is started after its
+parent level is complete, so parents always exist before their children.
+
+In sync mode, only pages differing from their target (by hash of normalized
+storage, title or parent) are written.
+"""
+
+import re, time, hashlib
+from datetime import datetime
+
+from .parallel import pmap, DEFAULT_WORKERS
+
+import logging
+logger = logging.getLogger('confluence.tree_copy')
+
+SPACE_PAGE_REF = re.compile(r'^([A-Z]+):(.*)$')
+PAGE_ID = re.compile(r'^(\d+)$|api/content/(\d+)$')
+
+MACRO_ID = re.compile(r'\s+ac:macro-id="[^"]*"')
+WHITESPACE = re.compile(r'\s+')
+BETWEEN_TAGS = re.compile(r'>\s+<')
+
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def storage_hash(storage):
+    '''return hash of storage format, ignoring macro ids and whitespace'''
+    storage = MACRO_ID.sub('', storage)
+    storage = BETWEEN_TAGS.sub('><', WHITESPACE.sub(' ', storage)).strip()
+    return hashlib.sha1(storage.encode('utf-8')).hexdigest()
+
+
+def parse_date(value):
+    '''return datetime of a date like "2020-01-31 12:00" or a version's "when"'''
+    if value is None or isinstance(value, datetime):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:19], fmt)
+        except ValueError:
+            pass
+    raise ValueError("invalid date: %s" % value)
+
+
+def modified(page):
+    return parse_date(page['version']['when'])
+
+
+class TreeCopy(object):
+    """copy page ``source`` and (if ``recursive``) its descendants
+
+    ``target`` may be a page id, a ``SPACE:title`` reference or a title.  If
+    there is no such page, it is created in ``space`` below ``parent``.
+    Descendants of ``target`` are matched to source pages by title and moved
+    to the parent matching the source page's parent.  With ``delete``,
+    descendants of ``target`` not present in source are deleted.
+
+    With ``sync``, pages are only written, if their normalized storage (see
+    :func:`storage_hash`) or their parent differ.  With ``since``, pages
+    matched by a target, which have not been modified since then, are
+    considered unchanged without comparing their storage, so unchanged
+    subtrees cost neither downloads of bodies nor writes.
+
+    Pages done are recorded in :class:`~.journal.Journal` ``journal``.
+    Source pages recorded there (with unchanged storage) are skipped.
+
+    ``progress`` is called with the :class:`TreeCopy` after each page.
+    """
+
+    SOURCE_EXPAND = ['body.storage', 'ancestors']
+    TARGET_EXPAND = ['version', 'ancestors']
+
+    # bodies of source pages are only fetched for pages to be compared
+    SYNC_EXPAND = ['version', 'ancestors']
+
+    def __init__(self, api, source, target=None, parent=None, space=None,
+            recursive=True, delete=False, workers=None, progress=None, sync=False, since=None,
+            journal=None):
+        self.api = api
+        self.source = source
+        self.target = target
+        self.parent = parent
+        self.space = space
+        self.recursive = recursive
+        self.delete = delete
+        self.workers = int(workers or api.config.get('workers') or DEFAULT_WORKERS)
+        self.progress = progress
+        self.sync = sync or since is not None
+        self.since = parse_date(since)
+        self.journal = journal
+
+        self.counts = dict(total=0, pages=0, created=0, updated=0, unchanged=0, resumed=0, deleted=0)
+        self.started = None
+
+    @property
+    def rate(self):
+        '''pages written per second'''
+        seconds = time.time() - self.started if self.started else 0
+        return self.counts['pages'] / seconds if seconds else 0.0
+
+    def descendants(self, page_id, expand):
+        '''return descendants of page ``page_id`` as list of levels'''
+        levels = []
+        for page in self.api.getPages('type = page AND ancestor = %s' % page_id, expand=expand):
+            ancestors = [ a['id'] for a in page['ancestors'] ]
+            depth = len(ancestors) - ancestors.index(page_id)
+            while len(levels) < depth:
+                levels.append([])
+            levels[depth-1].append(page)
+        return levels
+
+    def findTarget(self, source):
+        '''return target page or None, if it has to be created
+
+        Sets title and space of a target page to be created.
+        '''
+        target = self.target
+        self.title = source['title']
+
+        expand = 'version,space,body.storage' if self.sync else 'version,space'
+
+        if target is not None:
+            target = unicode(target)
+            if PAGE_ID.search(target):
+                page = self.api.getPage(target, expand=expand)
+                self.space = page['space']['key']
+                return page
+
+            m = SPACE_PAGE_REF.match(target)
+            if m:
+                self.space, self.title = m.groups()
+            else:
+                self.title = target
+
+        if self.space is None:
+            if self.parent is not None:
+                self.space = self.api.getPage(self.api.getContentId(self.parent), expand='space')['space']['key']
+            else:
+                self.space = source['space']['key']
+
+        ref = u'%s:%s' % (self.space, self.title)
+        ids = self.api.resolveIds([ref])[ref]
+        if ids:
+            return self.api.getPage(ids[0], expand=expand)
+        return None
+
+    @staticmethod
+    def moved(target, parent):
+        '''return True, if ``target`` is not a child of ``parent``'''
+        ancestors = target.data.get('ancestors')
+        return parent is not None and bool(ancestors) and ancestors[-1]['id'] != parent
+
+    def changes(self, tasks):
+        '''split write tasks into tasks of changed and of unchanged pages'''
+        candidates = []
+        unchanged = []
+        for task in tasks:
+            source, target, title, parent = task
+            if target is None or self.moved(target, parent):
+                candidates.append(task)
+            elif self.since is not None and modified(source) < self.since:
+                unchanged.append(task)
+            else:
+                candidates.append(task)
+
+        pages = [ t[0] for t in candidates ] + [ t[1] for t in candidates if t[1] is not None ]
+        for page in self.api.expandPages(pages, 'body.storage'):
+            pass
+
+        changed = []
+        for task in candidates:
+            source, target, title, parent = task
+            if target is None or self.moved(target, parent) or \
+                    storage_hash(source['body']['storage']['value']) != storage_hash(target['body']['storage']['value']):
+                changed.append(task)
+            else:
+                unchanged.append(task)
+        return changed, unchanged
+
+    def resumed(self, tasks):
+        '''split write tasks into tasks to do and tasks recorded in journal'''
+        if self.journal is None:
+            return tasks, []
+
+        todo = []
+        done = []
+        for task in tasks:
+            source = task[0]
+            step = self.journal.get(source['id'])
+            if step is not None and (step['hash'] is None or not source.has('body.storage')
+                    or step['hash'] == storage_hash(source['body']['storage']['value'])):
+                done.append((source, step['id']))
+            else:
+                todo.append(task)
+        return todo, done
+
+    def write(self, source, target, title, parent):
+        '''create or update a target page, return source, target id, action
+        and version written
+
+        An existing target page is moved to ``parent``, if it has another one.
+        '''
+        storage = source['body']['storage']['value']
+        if target is None:
+            page = self.api.createPage(self.space, title, storage, parent=parent)
+            logger.info("Create Page: %s, %s", self.space, title)
+            return source, page['id'], 'created', page.get('version', {}).get('number', 1)
+
+        self.api.updatePage(target['id'],
+            version = target['version']['number'] + 1,
+            title   = target['title'],
+            storage = storage,
+            parent  = parent if self.moved(target, parent) else None
+        )
+        logger.info("Update Page: %s, %s", self.space, target['title'])
+        return source, target['id'], 'updated', target['version']['number'] + 1
+
+    def done(self, action, source=None, id=None, version=None):
+        if self.journal is not None and action != 'resumed':
+            hash = None
+            if source.has('body.storage'):
+                hash = storage_hash(source['body']['storage']['value'])
+            self.journal.record(source['id'], id=id, version=version, hash=hash, action=action)
+
+        self.counts['pages'] += 1
+        self.counts[action] += 1
+        if self.progress is not None:
+            self.progress(self)
+
+    def run(self):
+        '''copy the tree, return counts of pages created, updated and deleted'''
+        self.started = time.time()
+
+        source = self.api.getPage(self.source, expand='body.storage,space')
+        expand = self.SYNC_EXPAND if self.sync else self.SOURCE_EXPAND
+        levels = self.descendants(source['id'], expand) if self.recursive else []
+        self.counts['total'] = 1 + sum(len(level) for level in levels)
+
+        target = self.findTarget(source)
+
+        # target descendants by title, which is unique in a space
+        existing = {}
+        if target is not None and self.recursive:
+            for level in self.descendants(target['id'], self.TARGET_EXPAND):
+                for page in level:
+                    existing[page['title']] = page
+
+        tasks, done = self.resumed([(source, target, self.title, self.parent if target is None else None)])
+        if done:
+            self.target_id = done[0][1]
+            self.done('resumed')
+        elif self.sync and target is not None and \
+                storage_hash(source['body']['storage']['value']) == storage_hash(target['body']['storage']['value']):
+            self.target_id = target['id']
+            self.done('unchanged', source, target['id'], target['version']['number'])
+        else:
+            source, self.target_id, action, version = self.write(*tasks[0])
+            self.done(action, source, self.target_id, version)
+
+        ids = { source['id']: self.target_id }
+        for depth, level in enumerate(levels, 1):
+            tasks = []
+            for page in level:
+                parent = ids[page['ancestors'][-1]['id']]
+                tasks.append((page, existing.pop(page['title'], None), page['title'], parent))
+
+            tasks, done = self.resumed(tasks)
+            for page, id in done:
+                ids[page['id']] = id
+                self.done('resumed')
+
+            if self.sync:
+                tasks, unchanged = self.changes(tasks)
+                for page, target, title, parent in unchanged:
+                    ids[page['id']] = target['id']
+                    self.done('unchanged', page, target['id'], target['version']['number'])
+
+            for page, id, action, version in pmap(lambda task: self.write(*task), tasks, workers=self.workers):
+                ids[page['id']] = id
+                self.done(action, page, id, version)
+
+            logger.info("level %s: %s pages, %s/%s done, %.1f pages/s",
+                depth, len(level), self.counts['pages'], self.counts['total'], self.rate)
+
+        if self.delete and existing:
+            # deepest first, as confluence moves children of deleted pages up
+            pages = sorted(existing.values(), key=lambda p: -len(p['ancestors']))
+            for page in pmap(self.deletePage, pages, workers=self.workers):
+                self.counts['deleted'] += 1
+
+        self.counts['seconds'] = round(time.time() - self.started, 3)
+        logger.info("copied %s pages (%s created, %s updated, %s unchanged, %s resumed, %s deleted) in %.1fs, %.1f pages/s",
+            self.counts['pages'], self.counts['created'], self.counts['updated'], self.counts['unchanged'],
+            self.counts['resumed'], self.counts['deleted'], self.counts['seconds'], self.rate)
+        return self.counts
+
+    def deletePage(self, page):
+        self.api.deletePage(page['id'])
+        logger.info("Delete Page: %s, %s", self.space, page['title'])
+        return page
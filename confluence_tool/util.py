@@ -44,3 +44,12 @@ def represent_stringish(dumper, data):
 for str_type in {bytes, unicode}:
     UnsafePrettyYAMLDumper.add_representer(
         str_type, represent_stringish )
+
+def to_bool(value):
+    '''convert a configuration value to a boolean
+
+    Strings like "false", "no", "off" and "0" are false.
+    '''
+    if isinstance(value, basestring):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'off')
+    return bool(value)
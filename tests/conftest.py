@@ -0,0 +1,29 @@
+import pytest
+
+from confluence_tool.confluence_api import ConfluenceAPI
+from confluence_tool.fake_server import FakeConfluence, FakeConfluenceServer
+from confluence_tool.transport import close_transports
+
+
+@pytest.fixture
+def fake():
+    '''empty fake confluence, tests add spaces and pages'''
+    return FakeConfluence()
+
+
+@pytest.fixture
+def server(fake):
+    server = FakeConfluenceServer(fake)
+    server.start()
+    yield server
+    close_transports()
+    server.stop()
+
+
+@pytest.fixture
+def api(server):
+    '''return a factory of ConfluenceAPI objects using ``server``'''
+    def api(**config):
+        return ConfluenceAPI(dict(dict(baseurl=server.baseurl, username='user', password='secret',
+            cache=False, memo=False), **config))
+    return api
@@ -0,0 +1,21 @@
+from StringIO import StringIO
+
+from confluence_tool.page_properties import get_page_properties
+from benchmarks.corpus import view_page, KINDS
+from benchmarks.run import run, compare
+
+
+def test_corpus_has_page_properties():
+    props = dict(get_page_properties(view_page(rows=len(KINDS))))
+    assert len(props) == len(KINDS)
+    assert isinstance(props['Property 6'], list)
+
+
+def test_run_and_compare():
+    out = StringIO()
+    old = run(['resolveCQL.simple'], scale=0.01, repeat=1, out=out)
+    assert 'resolveCQL.simple' in old['results']
+
+    new = dict(old, results={'resolveCQL.simple': dict(old['results']['resolveCQL.simple'])})
+    new['results']['resolveCQL.simple']['min'] *= 2
+    assert compare(old, new, threshold=1.5, out=out) == ['resolveCQL.simple']
@@ -0,0 +1,69 @@
+from confluence_tool.cache import ContentCache, ResponseStore, ReferenceCache, normalize_expand
+
+
+def test_normalize_expand():
+    assert normalize_expand('version, body.storage') == 'body.storage,version'
+    assert normalize_expand(['body.view', 'body.view']) == 'body.view'
+    assert normalize_expand(None) == ''
+
+
+def test_content_cache(tmpdir):
+    cache = ContentCache(str(tmpdir.join('cache.sqlite')), max_size=1000)
+
+    assert cache.get('1', 2, 'body.storage') is None
+    cache.put('1', 2, 'version,body.storage', {'id': '1', 'body': 'x' * 300})
+    assert cache.get('1', 2, 'body.storage,version')['body'] == 'x' * 300
+    assert cache.get('1', 3, 'body.storage,version') is None
+
+    for i in range(2, 6):
+        cache.put(str(i), 1, 'body.storage', {'id': str(i), 'body': 'y' * 300})
+
+    assert cache.prune() > 0
+    stats = cache.stats()
+    assert stats['size'] <= 1000
+    assert stats['hits'] == 1
+
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+
+def test_reference_cache_expires(tmpdir):
+    now = [1000.0]
+    refs = ReferenceCache(str(tmpdir.join('refs.sqlite')), ttl=60, clock=lambda: now[0])
+    refs.put('DOC:Page', ['123'])
+    assert refs.get('DOC:Page') == ['123']
+    now[0] += 61
+    assert refs.get('DOC:Page') is None
+
+    refs.put('DOC:Page', ['123'])
+    refs.invalidate('123')
+    assert refs.get('DOC:Page') is None
+
+
+def test_content_cache_batches_access_times(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    cache = ContentCache(path)
+    cache.put('1', 1, 'body.storage', {'id': '1'})
+    assert cache.contains('1') and not cache.contains('2')
+
+    accessed = lambda: cache.db.execute("SELECT accessed FROM pages").fetchone()[0]
+    before = accessed()
+    assert cache.get('1', 1, 'body.storage') == {'id': '1'}
+    assert accessed() == before
+
+    cache.close()
+    import sqlite3
+    assert sqlite3.connect(path).execute("SELECT accessed FROM pages").fetchone()[0] > before
+
+
+def test_response_store_prunes_by_size(tmpdir):
+    store = ResponseStore(str(tmpdir.join('cache.sqlite')), max_size=1000)
+
+    for i in range(5):
+        store.put('key %s' % i, 'etag %s' % i, None, 'x' * 300)
+    store.not_modified('key 0', 'x' * 300)
+
+    assert store.prune() == 2
+    assert store.get('key 0') is not None
+    assert store.get('key 1') is None and store.get('key 2') is None
+    assert store.get('key 4') == ('etag 4', None, 'x' * 300)
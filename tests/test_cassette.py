@@ -0,0 +1,48 @@
+import requests
+import pytest
+
+from confluence_tool.cassette import Cassette, CassetteError, close_cassettes
+from confluence_tool.confluence_api import ConfluenceAPI, ConfluenceError
+
+
+def response(status, body):
+    r = requests.Response()
+    r.status_code = status
+    r._content = body
+    r.headers['Content-Type'] = 'application/json'
+    return r
+
+
+def test_record_and_replay(tmpdir):
+    path = str(tmpdir.join('session.jsonl.gz'))
+    baseurl = 'http://confluence.invalid'
+
+    answers = [ response(200, '{"version": 1}'), response(200, '{"version": 2}'), response(404, '{"message": "gone"}') ]
+    def send(method, url, **kwargs):
+        return answers.pop(0)
+
+    cassette = Cassette(path, 'record')
+    cassette.send(send, 'GET', baseurl + '/rest/api/content/1', params={'expand': 'version'})
+    cassette.send(send, 'GET', baseurl + '/rest/api/content/1', params={'expand': 'version'})
+    cassette.send(send, 'GET', baseurl + '/rest/api/content/2', params={})
+    cassette.close()
+
+    sleeps = []
+    cassette = Cassette(path, 'replay', latency=0.5, sleep=sleeps.append)
+    r = cassette.play('GET', baseurl + '/rest/api/content/2', dict(params={}))
+    assert r.status_code == 404
+    assert sleeps == [0.5]
+
+    config = dict(baseurl=baseurl, username='user', password='secret', cassette=path, memo=False)
+    api = ConfluenceAPI(config)
+    assert api.get('/rest/api/content/1', params={'expand': 'version'}) == {'version': 1}
+    assert api.get('/rest/api/content/1', params={'expand': 'version'}) == {'version': 2}
+    # last response is repeated
+    assert api.get('/rest/api/content/1', params={'expand': 'version'}) == {'version': 2}
+    with pytest.raises(ConfluenceError):
+        api.get('/rest/api/content/2')
+    with pytest.raises(CassetteError):
+        api.get('/rest/api/content/3')
+
+    assert 'transport' not in api.__dict__
+    close_cassettes()
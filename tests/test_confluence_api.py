@@ -0,0 +1,249 @@
+import threading, time
+from confluence_tool.confluence_api import ConfluenceAPI
+
+
+class PagingAPI(ConfluenceAPI):
+    """serves ``count`` items in windows like confluence does"""
+
+    def __init__(self, count, **config):
+        config.setdefault('baseurl', 'http://localhost')
+        ConfluenceAPI.__init__(self, config)
+        self.items = [ dict(id=str(i)) for i in range(count) ]
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def listItems(self, start=0, limit=25, expand=None):
+        with self.lock:
+            self.calls.append(start)
+        time.sleep(0.01)
+        # expanded items are served in smaller windows
+        limit = min(limit, 10 if expand else 25)
+        results = self.items[start:start+limit]
+        return dict(results=results, start=start, limit=limit, size=len(results))
+
+    def listCursor(self, start=0, limit=25):
+        return self.get('/items?cursor=0')
+
+    def get(self, endpoint, params=None, **kwargs):
+        self.calls.append(endpoint)
+        cursor = int(endpoint.split('cursor=')[1])
+        results = self.items[cursor:cursor+10]
+        links = dict(base='http://localhost')
+        if cursor + 10 < len(self.items):
+            links['next'] = '/items?cursor=%s' % (cursor + 10)
+        return dict(results=results, start=0, limit=10, size=len(results), _links=links)
+
+
+def test_iterate_prefetches_windows():
+    api = PagingAPI(60)
+    assert [ item['id'] for item in api.iterate('listItems') ] == [ str(i) for i in range(60) ]
+    assert sorted(api.calls)[:3] == [0, 25, 50]
+
+
+def test_iterate_without_prefetch():
+    api = PagingAPI(50, prefetch=0)
+    assert len(list(api.iterate('listItems'))) == 50
+    assert api.calls == [0, 25, 50]
+
+
+def test_iterate_stops_early():
+    api = PagingAPI(1000)
+    items = list(api.iterate('listItems', limit=30))
+    assert len(items) == 30
+
+    time.sleep(0.05)
+    # first window, second window and at most two prefetched ones
+    assert len(api.calls) <= 4
+
+
+def test_iterate_discovers_page_size():
+    ConfluenceAPI.page_limits.clear()
+    api = PagingAPI(30, prefetch=0)
+
+    list(api.iterate('listItems'))
+    assert ConfluenceAPI.page_limits[('http://localhost', 'listItems', '')] == 25
+
+    api.calls = []
+    list(api.iterate('listItems', limit=5))
+    assert api.calls == [0]
+
+    list(api.iterate('listItems', expand='version,body.storage'))
+    assert ConfluenceAPI.page_limits[('http://localhost', 'listItems', 'body.storage,version')] == 10
+    assert ConfluenceAPI.page_limits[('http://localhost', 'listItems', '')] == 25
+
+
+def test_iterate_follows_cursor():
+    api = PagingAPI(35)
+    assert len(list(api.iterate('listCursor'))) == 35
+    assert api.calls == ['/items?cursor=0', '/items?cursor=10', '/items?cursor=20', '/items?cursor=30']
+
+
+class ShardingAPI(ConfluenceAPI):
+    def __init__(self):
+        ConfluenceAPI.__init__(self, dict(baseurl='http://localhost'))
+
+    def findPages(self, cql='', expand='', limit='', start=''):
+        when = '2018-01-01T00:00:00.000+02:00'
+        if 'desc' in cql:
+            when = '2018-01-01T04:00:00.000+02:00'
+        results = [ dict(id='1', version=dict(when=when)) ]
+        return dict(results=results, start=0, limit=1, size=1)
+
+
+def test_shard_cql():
+    api = ShardingAPI()
+    assert api.shardCQL('space = X', 4) == [
+        u'(space = X) and lastmodified < "2018/01/01 01:00"',
+        u'(space = X) and lastmodified >= "2018/01/01 01:00" and lastmodified < "2018/01/01 02:00"',
+        u'(space = X) and lastmodified >= "2018/01/01 02:00" and lastmodified < "2018/01/01 03:00"',
+        u'(space = X) and lastmodified >= "2018/01/01 03:00"',
+    ]
+    assert api.shardCQL('space = X order by title', 4) == ['space = X order by title']
+
+
+def test_pages_in_workflow_state(fake, api, tmpdir):
+    fake.addSpace('DOC')
+    approved = fake.addPage('DOC', 'Approved', '<p>v1</p>', state='Approved')
+    fake.addPage('DOC', 'Current', '<p>v1</p>', state='Approved')
+    fake.addPage('DOC', 'Never', '<p>v1</p>', state='Draft')
+
+    # new version of approved page is in draft again
+    approved['versions'].append(dict(approved['versions'][0], number=2, storage='<p>v2</p>'))
+    approved['states'].append(dict(name='Draft', contentVersion=2))
+
+    api = api(cache=True, cache_dir=str(tmpdir))
+    for i in range(2):
+        pages = list(api.getPages('space = DOC', expand=['body.storage', 'version'], state='Approved'))
+        assert sorted((p['title'], p['version']['number']) for p in pages) == [('Approved', 1), ('Current', 1)]
+    assert api.cache.get(approved['id'], 2, 'workflow.states') is not None
+
+    # without a version, the history is cached for the current version
+    approved['versions'].append(dict(approved['versions'][0], number=3, storage='<p>v3</p>'))
+    approved['states'].append(dict(name='Approved', contentVersion=3))
+    assert api.getWorkflowStates(approved['id'])[-1] == dict(name='Approved', contentVersion=3)
+    assert api.cache.get(approved['id'], 3, 'workflow.states')[-1]['contentVersion'] == 3
+
+
+def test_expand_pages_in_batches(fake, server, api):
+    fake.addSpace('DOC')
+    for i in range(60):
+        fake.addPage('DOC', 'Page %s' % i, '<p>content %s</p>' % i)
+
+    api = api()
+    pages = list(api.getPages('space = DOC', expand=['version']))
+    assert not pages[0].has('body.storage')
+
+    requests = server.counters['requests']
+    pages = list(api.expandPages(pages, 'body.storage'))
+    # two batches of at most 50 pages (including the space's home page)
+    assert server.counters['requests'] - requests == 2
+    assert [ p.content for p in pages[1:] ] == [ '<p>content %s</p>' % i for i in range(60) ]
+    assert pages[1]['version']['number'] == 1
+
+    page = api.getPage(pages[1]['id'])
+    assert page.content == '<p>content 0</p>'
+    assert page.has('body.storage')
+
+
+def test_page_decodes_body_on_access():
+    from confluence_tool.page import Page
+
+    data = dict(id='1', title='t', body=dict(storage=dict(value='a &amp;amp; b')),
+        _links=dict(webui='/x'), _expandable=dict(space='/rest/api/space/DOC'))
+    page = Page(None, data, expand='body.storage', compact=True)
+    assert data['body']['storage']['value'] == 'a &amp;amp; b'
+    assert '_links' not in data
+    assert page.content == 'a &amp; b'
+    # only once
+    assert page['body']['storage']['value'] == 'a &amp; b'
+    assert page.spacekey == 'DOC'
+    assert page.expand is Page(None, {}, expand=['body.storage']).expand
+
+
+def test_resolve_references_batched_and_cached(fake, server, api, tmpdir):
+    fake.addSpace('DOC')
+    pages = [ fake.addPage('DOC', 'Page %s' % i, '<p></p>') for i in range(3) ]
+    child = fake.addPage('DOC', 'Child', '<p></p>', parent=pages[0]['id'])
+
+    confluence = api(cache=True, cache_dir=str(tmpdir))
+    refs = [ 'DOC:Page 0', 'DOC:Page 1', ':Page 2', 'DOC:Missing' ]
+    requests = server.counters['requests']
+    ids = confluence.resolveIds(refs)
+    assert server.counters['requests'] - requests == 1
+    assert ids == {
+        'DOC:Page 0': [pages[0]['id']], 'DOC:Page 1': [pages[1]['id']],
+        ':Page 2': [pages[2]['id']], 'DOC:Missing': [] }
+
+    assert confluence.resolveCQL('DOC:Page 0>') == '(parent = %s)' % pages[0]['id']
+    assert confluence.resolveCQL(refs[:2]) == 'ID in (%s,%s)' % (pages[0]['id'], pages[1]['id'])
+
+    # other API objects use the persistent reference cache
+    requests = server.counters['requests']
+    confluence = api(cache=True, cache_dir=str(tmpdir))
+    assert confluence.resolveCQL('DOC:Page 0>>') == '(ancestor = %s)' % pages[0]['id']
+    assert server.counters['requests'] == requests
+
+
+def test_plan_cql_splits_long_disjunctions():
+    api = ConfluenceAPI(dict(baseurl='http://localhost', cql_chunk=2))
+    cql = 'type = page and (ancestor = 1 OR ancestor = 2 OR ancestor = 3)'
+    assert api.planCQL(cql) == [
+        'type = page and (ancestor = 1 OR ancestor = 2)',
+        'type = page and (ancestor = 3)' ]
+    assert api.planCQL('id in (1, 2, 3) and label = x') == [
+        'id in (1,2) and label = x', 'id in (3) and label = x' ]
+    assert len(api.planCQL('(ancestor = 1 OR ancestor = 2 OR ancestor = 3) and id in (4,5,6)')) == 4
+    # splitting a negated disjunction would change the result
+    assert len(api.planCQL('not (ancestor = 1 OR ancestor = 2 OR ancestor = 3)')) == 1
+    assert len(api.planCQL('(ancestor = 1 OR ancestor = 2 OR ancestor = 3) order by title')) == 1
+
+
+def test_get_pages_runs_chunked_queries(fake, server, api):
+    fake.addSpace('DOC')
+    parents = [ fake.addPage('DOC', 'Parent %s' % i, '<p></p>') for i in range(30) ]
+    for parent in parents:
+        fake.addPage('DOC', 'Child of %s' % parent['title'], '<p></p>', parent=parent['id'])
+
+    api = api(cql_chunk=7)
+    cql = '(%s)' % ' OR '.join('parent = %s' % p['id'] for p in parents)
+    requests = server.counters['requests']
+    pages = list(api.getPages(cql))
+    assert server.counters['requests'] - requests == 5
+    assert sorted(p['title'] for p in pages) == sorted('Child of %s' % p['title'] for p in parents)
+
+
+def test_cached_page_fetches_live_expansions(fake, server, api, tmpdir):
+    home = fake.spaces[fake.addSpace('DOC')['key']]['homepage']
+    page = fake.addPage('DOC', 'A', '<p>a</p>', parent=home)
+    other = fake.addPage('DOC', 'B', '<p>b</p>', parent=home)
+
+    api = api(cache=True, cache_dir=str(tmpdir), conditional_get=False)
+    requests = server.counters['requests']
+    assert api.getPage(page['id'], expand='body.storage,ancestors')['ancestors'][-1]['id'] == home
+    # a miss is fetched with one request
+    assert server.counters['requests'] - requests == 1
+
+    # ancestors change without a new version
+    fake.pages[page['id']]['parent'] = other['id']
+    requests = server.counters['requests']
+    data = api.getPage(page['id'], expand='body.storage,ancestors')
+    assert data['ancestors'][-1]['id'] == other['id']
+    assert data['body']['storage']['value'] == '<p>a</p>'
+    assert server.counters['requests'] - requests == 1
+
+
+def test_move_page_is_not_memoized(fake, server, api):
+    home = fake.spaces[fake.addSpace('DOC')['key']]['homepage']
+    page = fake.addPage('DOC', 'A', '<p>a</p>', parent=home)
+    other = fake.addPage('DOC', 'B', '<p>b</p>', parent=home)
+
+    api = api(memo=True, memo_ttl=60)
+    assert api.getPage(page['id'], expand='ancestors')['ancestors'][-1]['id'] == home
+
+    parent = api.getPage(other['id'])
+    requests = server.counters['requests']
+    for i in range(2):
+        api.movePage(api.getPage(page['id']), parent=parent)
+    # each move is sent and forgets memoized pages
+    assert server.counters['requests'] - requests == 4
+    assert api.getPage(page['id'], expand='ancestors')['ancestors'][-1]['id'] == other['id']
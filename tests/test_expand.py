@@ -0,0 +1,16 @@
+from confluence_tool.expand import infer_expand
+
+
+def test_infer_expand_from_format():
+    assert infer_expand(format=u'{id} {version[number]} {body[view][value]}', expand='ancestors') == ['body.view', 'version']
+    assert infer_expand(format=u'{{#ancestors}}{{title}}{{/ancestors}} {{space.key}}') == ['ancestors', 'space']
+    assert infer_expand(format=u'{parent[title]} {Owner}', aliases=dict(parent='ancestors')) == ['ancestors']
+
+
+def test_infer_expand_from_fields():
+    assert infer_expand(fields=['id', 'spacekey', 'title'], expand='body.view,version') == []
+    assert infer_expand(fields=['body', 'children'], filter='Owner?') == ['body.storage', 'children.page']
+
+
+def test_infer_expand_keeps_explicit_expand_without_format():
+    assert infer_expand(expand='version, body.view') == ['body.view', 'version']
@@ -0,0 +1,53 @@
+import random
+import pytest
+
+from confluence_tool.confluence_api import ConfluenceError
+from confluence_tool.fake_server import FakeConfluence, CqlError
+
+
+@pytest.fixture
+def fake():
+    fake = FakeConfluence()
+    fake.seed(spaces=2, pages=60, fanout=5)
+    return fake
+
+
+def test_cql(fake):
+    titles = lambda cql: [ p['title'] for p in fake.search(cql) ]
+
+    assert len(titles('space = BENCHA')) == 61
+    assert titles('space = BENCHA AND title = "Page BENCHA 3"') == ['Page BENCHA 3']
+    assert len(titles('space in (BENCHA, BENCHB) and not label = label-0')) == 2 * 61 - 2 * 6
+    home = fake.spaces['BENCHA']['homepage']
+    assert len(titles('parent = %s' % home)) == 5
+    assert len(titles('ancestor = %s' % home)) == 60
+    assert titles('space = BENCHA order by title desc')[0] == 'Page BENCHA 9'
+    with pytest.raises(CqlError):
+        fake.search('foo = bar')
+
+
+def test_pages_and_properties(api):
+    confluence = api()
+
+    assert len(list(confluence.getPages('space = BENCHA'))) == 61
+    assert len(list(confluence.getPages('space = BENCHA', shards=3))) == 61
+
+    page = list(confluence.getPagesWithProperties('space = BENCHA and title = "Page BENCHA 3"'))[0]
+    assert page.getPageProperty('Property 0').startswith('[~user')
+
+    list(confluence.setPageProperties(dict(page='BENCHA:Page BENCHA 3',
+        pagePropertiesEditor={'Property 3': {'replace': 'changed'}})))
+    page = list(confluence.getPagesWithProperties('space = BENCHA and title = "Page BENCHA 3"'))[0]
+    assert page.getPageProperty('Property 3') == 'changed'
+
+    with pytest.raises(ConfluenceError):
+        confluence.updatePage(page['id'], page['title'], version=1, storage='<p/>')
+
+
+def test_injected_errors_are_retried(server, api):
+    server.error_rate = 0.5
+    server.random = random.Random(1)
+
+    confluence = api(backoff=0.001, max_retries=20)
+    assert len(list(confluence.getPages('space = BENCHB'))) == 61
+    assert server.counters['errors'] > 0
@@ -0,0 +1,80 @@
+import pytest
+from confluence_tool.journal import Journal, JournalError
+
+
+def test_journal_resume(tmpdir):
+    path = str(tmpdir.join('copy.journal'))
+    journal = Journal(path, 'copy')
+    journal.record('1', id='11', version=2, hash='abc')
+    journal.close()
+
+    # an interrupted write leaves an incomplete last line
+    with open(path, 'a') as f:
+        f.write('{"key": "2", "id"')
+
+    with pytest.raises(JournalError):
+        Journal(path, 'copy')
+    with pytest.raises(JournalError):
+        Journal(path, 'edit', resume=True)
+    with pytest.raises(JournalError):
+        Journal(str(tmpdir.join('missing')), 'copy', resume=True)
+
+    journal = Journal(path, 'copy', resume=True)
+    assert '1' in journal and '2' not in journal
+    assert journal.get(1)['id'] == '11'
+    assert journal.done('1', 2) and not journal.done('1', 3)
+
+
+def test_resume_copy_page_tree(fake, api, tmpdir):
+    home = fake.spaces[fake.addSpace('DOC')['key']]['homepage']
+    for i in range(6):
+        fake.addPage('DOC', 'P%s' % i, '<p>%s</p>' % i, parent=home)
+    target = fake.spaces[fake.addSpace('COPY')['key']]['homepage']
+    path = str(tmpdir.join('copy.journal'))
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(copy):
+        if copy.counts['pages'] == 4:
+            raise Interrupted()
+
+    api = api(workers=1)
+    with pytest.raises(Interrupted):
+        api.copyPage(home, target, journal=Journal(path, 'copy'), progress=interrupt)
+
+    counts = api.copyPage(home, target, journal=Journal(path, 'copy', resume=True))
+    # pages written, but not yet recorded, are updated again
+    assert counts['resumed'] == 4
+    assert counts['created'] + counts['updated'] == 3
+    assert len([ p for p in fake.pages.values() if p['parent'] == target ]) == 6
+    assert fake.pages[target]['versions'][-1]['number'] == 2
+
+
+def test_edit_journals_updates_when_others_fail(fake, server, tmpdir, monkeypatch):
+    from confluence_tool.cli import main
+    from confluence_tool.confluence_api import ConfluenceAPI, ConfluenceError
+
+    fake.addSpace('DOC')
+    pages = [ fake.addPage('DOC', 'P%s' % i, '<p>%s</p>' % i) for i in range(6) ]
+    failing = pages[1]['id']
+
+    updatePage = ConfluenceAPI.updatePage
+    def failingUpdatePage(self, id, *args, **kwargs):
+        if id == failing:
+            raise ConfluenceError("update failed")
+        return updatePage(self, id, *args, **kwargs)
+    monkeypatch.setattr(ConfluenceAPI, 'updatePage', failingUpdatePage)
+
+    config = tmpdir.join('ct.yaml')
+    config.write('default:\n  cache: false\n  memo: false\n')
+    path = str(tmpdir.join('edit.journal'))
+    edit = tmpdir.join('edit.yaml')
+    edit.write('actions:\n- content: <p>edited</p>\n')
+
+    assert main(['-C', str(config), '-b', server.baseurl, '-u', 'user', '-p', 'secret',
+        'edit', 'space = DOC and title ~ "P*"', str(edit), '--journal', path]) == 1
+
+    journal = Journal(path, 'edit', resume=True)
+    assert sorted(journal.steps) == sorted(p['id'] for p in pages if p['id'] != failing)
+    assert fake.pages[failing]['versions'][-1]['number'] == 1
@@ -0,0 +1,45 @@
+import threading, time
+from confluence_tool.memo import RequestMemo
+
+
+def test_memo_ttl_and_invalidation():
+    now = [0]
+    memo = RequestMemo(ttl=10, clock=lambda: now[0])
+    calls = []
+    def fetch():
+        calls.append(1)
+        return 'body'
+
+    assert memo.call('a', fetch, '/rest/api/content/1') == 'body'
+    assert memo.call('a', fetch, '/rest/api/content/1') == 'body'
+    assert len(calls) == 1
+
+    now[0] = 11
+    memo.call('a', fetch, '/rest/api/content/1')
+    assert len(calls) == 2
+
+    memo.call('u', fetch, '/rest/api/user')
+    memo.invalidate()
+    memo.call('a', fetch, '/rest/api/content/1')
+    memo.call('u', fetch, '/rest/api/user')
+    assert len(calls) == 4
+
+
+def test_memo_coalesces_concurrent_requests():
+    memo = RequestMemo(ttl=10)
+    calls = []
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'body'
+
+    results = []
+    threads = [ threading.Thread(target=lambda: results.append(memo.call('a', fetch))) for i in range(5) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ['body'] * 5
+    assert len(calls) == 1
+    assert memo.stats()['memo_coalesced'] >= 1
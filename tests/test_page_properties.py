@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from confluence_tool.page_properties import get_page_properties, get_storage_page_properties
+
+PAGE = u'''<div data-macro-name="details"><div class="table-wrap"><table><tbody>
+<tr><th> Owner </th><td><a class="confluence-userlink" data-username="bob" href="/display/~bob">Bob</a></td></tr>
+<tr><th>Link</th><td><a class="external-link" href="http://a">A</a> and <a class="external-link" href="http://b">http://b</a></td></tr>
+<tr><th>Ref</th><td><a href="/display/DOC/Some+Page">x</a><script>var x;</script></td></tr>
+<tr><th>Due</th><td><time datetime="2020-01-01">1 Jan</time></td></tr>
+<tr><th>List</th><td><div class="content-wrapper"><ul><li>a</li><li>b</li></ul></div></td></tr>
+<tr><th>Table</th><td><table><tbody><tr><th>Key</th><td>value</td></tr></tbody></table></td></tr>
+</tbody></table></div></div>'''
+
+def test_get_page_properties():
+    assert dict(get_page_properties(PAGE)) == {
+        'Owner': '[~bob]',
+        'Link':  '[A|http://a] and [http://b]',
+        'Ref':   '[DOC:Some Page]',
+        'Due':   '2020-01-01',
+        'List':  ['a', 'b'],
+        'Table': {'Key': 'value'},
+    }
+
+def test_get_page_properties_filter_and_html():
+    props = list(get_page_properties(PAGE, need_html=True, properties=['Due']))
+    assert props == [('Due', '<time datetime="2020-01-01">1 Jan</time>')]
+
+STORAGE = u'''<ac:structured-macro ac:name="details"><ac:rich-text-body><table><tbody>
+<tr><th>Owner</th><td><ac:link><ri:user ri:userkey="k1"/></ac:link></td></tr>
+<tr><th>Ref</th><td>a &amp; b & <ac:link><ri:page ri:content-title="Some Page"/></ac:link></td></tr>
+<tr><th>Status</th><td><ac:structured-macro ac:name="status"><ac:parameter ac:name="title">Done</ac:parameter></ac:structured-macro></td></tr>
+<tr><th>List</th><td><ul><li>a&nbsp;b</li><li><a href="http://b">http://b</a></li></ul></td></tr>
+</tbody></table></ac:rich-text-body></ac:structured-macro>'''
+
+def test_get_storage_page_properties():
+    props = get_storage_page_properties(STORAGE, spacekey='DOC', username=lambda key: 'bob')
+    assert dict(props) == {
+        'Owner':  '[~bob]',
+        'Ref':    'a & b & [DOC:Some Page]',
+        'Status': 'Done',
+        'List':   [u'a\xa0b', '[http://b]'],
+    }
+
+def test_page_properties_of_escaped_storage():
+    from confluence_tool.page import Page
+
+    class API(object):
+        requests = []
+        def getPage(self, id, expand='', **kwargs):
+            self.requests.append(expand)
+            raise AssertionError("unexpected request for %s" % expand)
+        def getUsername(self, userkey):
+            return 'bob'
+
+    storage = u'''<ac:structured-macro ac:name="details"><ac:rich-text-body><table><tbody>
+<tr><th>Limit</th><td>a &lt; b &amp;&gt; c</td></tr>
+</tbody></table></ac:rich-text-body></ac:structured-macro>'''
+    api = API()
+    page = Page(api, dict(id='1', space=dict(key='DOC'), body=dict(storage=dict(value=storage))), expand='body.storage,space')
+
+    # unescaped body does not spoil parsing storage
+    assert u'a < b' in page.content
+    assert page.pageProperty == {'Limit': u'a < b &> c'}
+    assert api.requests == []
@@ -0,0 +1,58 @@
+import time, threading
+import pytest
+from confluence_tool.parallel import Executor, pmap, pchain, prefetch
+
+
+def test_executor_future():
+    executor = Executor(2)
+    assert executor.submit(lambda x: x * 2, 21).result() == 42
+
+    future = executor.submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        future.result()
+    executor.shutdown()
+
+
+def test_pmap_keeps_order_and_overlaps():
+    def slow(x):
+        time.sleep(0.05)
+        return x * x
+
+    start = time.time()
+    assert list(pmap(slow, range(8), workers=8)) == [ x * x for x in range(8) ]
+    assert time.time() - start < 0.3
+
+
+def test_pmap_stops_feeding_on_close():
+    consumed = []
+    def items():
+        for i in range(1000):
+            consumed.append(i)
+            yield i
+
+    results = pmap(lambda x: x, items(), workers=2)
+    assert next(results) == 0
+    results.close()
+    assert len(consumed) <= 5
+
+
+def test_pchain_merges_and_propagates_errors():
+    assert sorted(pchain([range(3), range(3, 6)])) == range(6)
+
+    def failing():
+        yield 1
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        list(pchain([failing()]))
+
+
+def test_prefetch_runs_in_background():
+    threads = []
+    def items():
+        for i in range(3):
+            threads.append(threading.current_thread())
+            yield i
+
+    assert list(prefetch(items())) == [0, 1, 2]
+    assert threading.current_thread() not in threads
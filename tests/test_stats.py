@@ -0,0 +1,45 @@
+from StringIO import StringIO
+import json
+
+from confluence_tool.stats import Stats, endpoint_template
+
+
+def test_endpoint_template():
+    assert endpoint_template('/rest/api/content/12345') == '/rest/api/content/{id}'
+    assert endpoint_template('/rest/api/content/12345/child/page?limit=10') == '/rest/api/content/{id}/child/page'
+    assert endpoint_template('/rest/api/space/FOO/content') == '/rest/api/space/{space}/content'
+    assert endpoint_template('/rest/adhocworkflows/1/workflow/12345') == '/rest/adhocworkflows/1/workflow/{id}'
+
+
+def test_stats_records_functions_and_generators():
+    stats = Stats()
+
+    @stats.timed('parse')
+    def items(n):
+        for i in range(n):
+            yield i
+
+    @stats.timed('render', 'plain')
+    def plain():
+        return 42
+
+    assert list(items(3)) == [0, 1, 2]
+    assert plain() == 42
+    with stats.timer('http', 'GET /x') as info:
+        info['bytes'] = 100
+    stats.register('counters', lambda: dict(hits=1))
+
+    data = stats.dict()
+    metrics = dict( ((m['category'], m['name']), m) for m in data['metrics'] )
+    assert metrics['parse', 'items']['count'] == 1
+    assert metrics['render', 'plain']['count'] == 1
+    assert metrics['http', 'GET /x']['bytes'] == 100
+    assert data['counters'] == dict(counters=dict(hits=1))
+
+    out = StringIO()
+    stats.report('json', out)
+    assert json.loads(out.getvalue())['counters']['counters']['hits'] == 1
+
+    out = StringIO()
+    stats.report('table', out)
+    assert 'GET /x' in out.getvalue()
@@ -0,0 +1,41 @@
+from confluence_tool.throttle import TokenBucket, RetryPolicy, parse_retry_after
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(2, burst=2, clock=clock, sleep=clock.sleep)
+
+    waits = [ bucket.acquire() for i in range(6) ]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert clock.now == 2.0
+
+
+def test_retry_after():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('Thu, 01 Jan 1970 00:01:00 GMT', now=30) == 30.0
+    assert parse_retry_after(None) is None
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_retries=2, backoff=1, jitter=False)
+
+    assert policy.delay('GET', 0, status=503) == 1
+    assert policy.delay('GET', 1, status=503) == 2
+    assert policy.delay('GET', 2, status=503) is None
+
+    assert policy.delay('POST', 0, status=503) is None
+    assert policy.delay('POST', 0, status=429, retry_after='7') == 7
+    assert policy.delay('GET', 0, status=404) is None
+    assert policy.delay('GET', 0, status=200) is None
@@ -0,0 +1,101 @@
+import threading
+import pytest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from confluence_tool.confluence_api import ConfluenceAPI, ConfluenceError
+from confluence_tool.transport import close_transports
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    throttled = 0
+
+    def do_GET(self):
+        headers = {}
+        if self.path.startswith('/missing'):
+            status, body = 404, '{"message": "not found"}'
+        elif self.path.startswith('/etag'):
+            headers['ETag'] = '"v1"'
+            if self.headers.get('If-None-Match') == '"v1"':
+                status, body = 304, ''
+            else:
+                status, body = 200, '{"id": "2"}'
+        elif self.path.startswith('/throttled') and Handler.throttled < 2:
+            Handler.throttled += 1
+            status, body = 429, '{"message": "slow down"}'
+            headers['Retry-After'] = '0'
+        else:
+            status, body = 200, '{"id": "1"}'
+
+        self.send_response(status)
+        for k,v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Type', 'application/json')
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%s' % httpd.server_address[1]
+    close_transports()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_transport_survives_errors(server):
+    api = ConfluenceAPI(dict(baseurl=server, username='user', password='secret', cache=False, memo=False))
+
+    assert api.get('/found') == {'id': '1'}
+    with pytest.raises(ConfluenceError):
+        api.get('/missing')
+    assert api.get('/found') == {'id': '1'}
+
+    stats = api.stats()
+    assert stats['pool_misses'] == 1
+    assert stats['pool_hits'] == 2
+
+
+def test_transport_is_shared(server):
+    config = dict(baseurl=server, username='user', password='secret', cache=False, memo=False)
+    assert ConfluenceAPI(config).transport is ConfluenceAPI(dict(config)).transport
+
+    other = dict(config, keep_alive='false')
+    assert ConfluenceAPI(config).transport is not ConfluenceAPI(other).transport
+    assert ConfluenceAPI(other).transport.session.headers['Connection'] == 'close'
+
+
+def test_transport_retries_throttled_requests(server):
+    api = ConfluenceAPI(dict(baseurl=server, username='user', password='secret', cache=False, memo=False, rate_limit=100))
+
+    Handler.throttled = 0
+    assert api.get('/throttled') == {'id': '1'}
+
+    stats = api.stats()
+    assert stats['retries'] == 2
+    assert stats['pool_misses'] == 1
+
+
+def test_conditional_get(server, tmpdir):
+    api = ConfluenceAPI(dict(baseurl=server, username='user', password='secret', cache_dir=str(tmpdir), memo=False))
+
+    assert api.get('/etag') == {'id': '2'}
+    assert api.get('/etag') == {'id': '2'}
+
+    stats = api.stats()
+    assert stats['not_modified'] == 1
+    assert stats['bytes_saved'] == len('{"id": "2"}')
@@ -0,0 +1,75 @@
+def test_copy_page_tree_level_by_level(fake, api):
+    home = fake.spaces[fake.addSpace('DOC')['key']]['homepage']
+    a = fake.addPage('DOC', 'A', '<p>a</p>', parent=home)
+    fake.addPage('DOC', 'A1', '<p>a1</p>', parent=a['id'])
+    fake.addPage('DOC', 'A2', '<p>a2</p>', parent=a['id'])
+    fake.addPage('DOC', 'B', '<p>b</p>', parent=home)
+    target = fake.spaces[fake.addSpace('COPY')['key']]['homepage']
+
+    def tree(id):
+        return sorted( (p['title'], p['parent'] and fake.pages[p['parent']]['title'], p['versions'][-1]['storage'])
+            for p in fake.pages.values() if p['status'] == 'current' and id in [ a['id'] for a in fake.ancestors(p) ] )
+
+    api = api(workers=2)
+    counts = api.copyPage(home, target)
+    assert (counts['created'], counts['updated'], counts['total']) == (4, 1, 5)
+    assert tree(target) == [ (u'A', u'COPY Home', u'<p>a</p>'), (u'A1', u'A', u'<p>a1</p>'),
+        (u'A2', u'A', u'<p>a2</p>'), (u'B', u'COPY Home', u'<p>b</p>') ]
+
+    fake.addPage('COPY', 'Extra', '<p></p>', parent=target)
+    fake.pages[a['id']]['versions'][-1]['storage'] = '<p>changed</p>'
+    counts = api.copyPage(home, target, delete=True)
+    assert (counts['created'], counts['updated'], counts['deleted']) == (0, 5, 1)
+    assert tree(target)[0] == (u'A', u'COPY Home', u'<p>changed</p>')
+    assert len(tree(target)) == 4
+    assert fake.pages[target]['versions'][-1]['number'] == 3
+
+    counts = api.copyPage(a['id'], 'Copy of A', space='COPY', recursive=False)
+    assert counts['created'] == 1
+    assert fake.findTitle('COPY', 'Copy of A')['parent'] is None
+
+
+def test_sync_page_tree_writes_only_changes(fake, api):
+    home = fake.spaces[fake.addSpace('DOC')['key']]['homepage']
+    a = fake.addPage('DOC', 'A', '<p>a</p>', parent=home)
+    a1 = fake.addPage('DOC', 'A1', '<p>a1</p>', parent=a['id'])
+    b = fake.addPage('DOC', 'B', '<p>b</p>', parent=home)
+    target = fake.spaces[fake.addSpace('COPY')['key']]['homepage']
+
+    api = api(workers=2)
+    assert api.copyPage(home, target, sync=True)['created'] == 3
+    counts = api.copyPage(home, target, sync=True)
+    assert (counts['updated'], counts['created'], counts['unchanged']) == (0, 0, 4)
+
+    # whitespace and macro ids do not count as changes
+    fake.pages[b['id']]['versions'][-1]['storage'] = '<p>b</p>\n'
+    fake.pages[a['id']]['versions'][-1]['storage'] = '<p>a2</p>'
+    fake.pages[a1['id']]['parent'] = b['id']
+    counts = api.copyPage(home, target, sync=True)
+    assert (counts['updated'], counts['unchanged']) == (2, 2)
+    assert fake.pages[fake.findTitle('COPY', 'A1')['id']]['parent'] == fake.findTitle('COPY', 'B')['id']
+
+    # pages not modified since are not compared
+    since = max(p['versions'][-1]['when'] for p in fake.pages.values())
+    fake.pages[b['id']]['versions'][-1]['storage'] = '<p>b2</p>'
+    counts = api.copyPage(home, target, since=since.strftime('%Y-%m-%d %H:%M:%S'))
+    assert (counts['updated'], counts['unchanged']) == (0, 4)
+
+
+def test_get_children_paginates_and_walks_tree(fake, api):
+    fake.max_limit = 10
+    home = fake.spaces[fake.addSpace('DOC')['key']]['homepage']
+    parents = [ fake.addPage('DOC', 'P%s' % i, '<p></p>', parent=home)['id'] for i in range(25) ]
+    for i, parent in enumerate(parents[:3]):
+        fake.addPage('DOC', 'C%s' % i, '<p></p>', parent=parent)
+
+    api = api(prefetch=1)
+    children = list(api.getChildren(home, expand=['version']))
+    assert [ p['id'] for p in children ] == parents
+    assert children[0]['version']['number'] == 1
+
+    found = sorted( (parent, page['title']) for (parent, page) in api.getChildrenOfPages(parents[:4]) )
+    assert found == [ (parents[0], 'C0'), (parents[1], 'C1'), (parents[2], 'C2') ]
+
+    levels = list(api.walkTree(home, workers=4))
+    assert [ len(level) for level in levels ] == [25, 3]